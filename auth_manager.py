@@ -4,28 +4,267 @@ import hashlib
 import streamlit as st
 import io
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from google.auth.exceptions import RefreshError
+from gspread.urls import DRIVE_FILES_API_V3_URL
+from gspread.utils import fill_gaps, numericise_all, to_records
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 
+import sheets_client
+import storage
+
+
+NOME_PLANILHA = "listagem_empenhos"
+# Abas lidas no login, antes de conferir a senha (a base de empenhos só depois do login aceito)
+ABAS_INICIAIS = ("usuarios", "configuracoes")
+# Configurações guardadas: conferidas com a revisão da planilha no máximo a cada
+# CONFIG_CHECK_INTERVAL_SECONDS; sem revisão disponível, relidas depois de CONFIG_TTL_SECONDS
+CONFIG_CHECK_INTERVAL_SECONDS = 15
+CONFIG_TTL_SECONDS = 60
+
+def _criar_cliente_gspread():
+    # Tenta pegar das secrets do Streamlit Cloud
+    if "gcp_service_account" in st.secrets:
+        credentials_dict = dict(st.secrets["gcp_service_account"])
+        return gspread.service_account_from_dict(credentials_dict)
+    # Fallback para arquivo local
+    return gspread.service_account(filename="credenciais.json")
+
+def _chave_planilha():
+    """ID da planilha configurado em [storage] spreadsheet_key (abrir pelo ID evita a busca por nome no Drive)."""
+    try:
+        return st.secrets.get("storage", {}).get("spreadsheet_key")
+    except Exception:
+        return None
+
+@st.cache_resource(show_spinner=False)
+def _conexao():
+    """
+    Conexão compartilhada por todas as sessões do processo: cliente autenticado,
+    planilha já aberta e as abas já consultadas (cada sh.worksheet é uma chamada de metadados).
+    """
+    backend = storage.backend_name(st.secrets)
+    if backend == "sqlite":
+        return {"sh": storage.open_local(storage.sqlite_path(st.secrets)), "abas": {}}
+    if backend == "fake":
+        # Só para testes/medições: o fake_google não é importado em produção
+        import fake_google
+        # Sheets e Drive simulados (latência e erros de cota configuráveis), pelo mesmo controle de cota
+        sh, drive = fake_google.open_fake(**fake_google.options_from_env(st.secrets))
+        return {"sh": sheets_client.CLIENT.wrap_spreadsheet(sh), "drive": drive, "abas": {}}
+    gc = _criar_cliente_gspread()
+    chave = _chave_planilha()
+    if chave:
+        sh = sheets_client.CLIENT.call(sheets_client.LEITURA, gc.open_by_key, chave)
+    else:
+        sh = sheets_client.CLIENT.call(sheets_client.DRIVE, gc.open, NOME_PLANILHA)
+    # Toda chamada feita pela planilha (e pelas abas dela) passa pelo controle de cota e retry
+    return {"sh": sheets_client.CLIENT.wrap_spreadsheet(sh), "abas": {}}
+
+def _erro_de_autenticacao(e):
+    return isinstance(e, RefreshError) or getattr(e, "code", None) == 401
+
+def revisao_planilha(sh=None):
+    """
+    Revisão atual da planilha principal: o campo "version" do Drive, que muda a cada edição
+    (uma chamada leve de metadados, sem baixar dados). Retorna None se não der para consultar.
+    Passando sh, não usa o Streamlit (pode ser chamada de outra thread).
+    """
+    try:
+        sh = sh if sh is not None else _conexao()["sh"]
+        if hasattr(sh, "revision"):
+            # Backends local e fake têm a própria marca de revisão
+            return sh.revision()
+        # sh.client é o HTTPClient autenticado do gspread (o mesmo das chamadas ao Sheets)
+        resposta = sheets_client.CLIENT.call(
+            sheets_client.DRIVE, sh.client.request, "get", f"{DRIVE_FILES_API_V3_URL}/{sh.id}",
+            params={"fields": "version,modifiedTime", "supportsAllDrives": True},
+        )
+        metadados = resposta.json()
+        return metadados.get("version") or metadados.get("modifiedTime")
+    except Exception as e:
+        print(f"[WARN] Não foi possível consultar a revisão da planilha: {e}")
+        return None
+
+def reconectar_sheets():
+    """Descarta a conexão compartilhada; a próxima chamada autentica e abre a planilha de novo."""
+    _conexao.clear()
+
+class _Reconectavel:
+    """
+    Planilha ou aba da conexão compartilhada que sobrevive a uma reconexão: cada atributo é
+    buscado no objeto da conexão atual e, se uma chamada falha por autenticação expirada,
+    a conexão é refeita e a chamada é repetida uma vez no objeto novo (um 401 garante que
+    nada foi executado, então repetir é seguro mesmo para append_row e afins).
+    """
+
+    def __init__(self, resolver):
+        self._resolver = resolver
+
+    def __getattr__(self, name):
+        value = getattr(self._resolver(), name)
+        if not callable(value):
+            return value
+
+        def chamar(*args, **kwargs):
+            try:
+                return value(*args, **kwargs)
+            except Exception as e:
+                if not _erro_de_autenticacao(e):
+                    raise
+                reconectar_sheets()
+                return getattr(self._resolver(), name)(*args, **kwargs)
+        # Cota e repetições continuam com o QuotaClient (ver sheets_client.with_retry)
+        chamar.quota_managed = getattr(value, "quota_managed", False)
+        return chamar
+
+    def __repr__(self):
+        return f"<_Reconectavel {self._resolver()!r}>"
+
+def _planilha():
+    """Planilha principal da conexão compartilhada (reconecta se a autenticação expirou)."""
+    _conexao()
+    return _Reconectavel(lambda: _conexao()["sh"])
 
 def conectar_sheets():
-    """Conecta ao Google Sheets e retorna a planilha principal."""
+    """Retorna a planilha principal (Google Sheets ou banco SQLite local, conforme storage.backend_name)."""
     try:
-        if "gc" not in st.session_state:
-            # Tenta pegar das secrets do Streamlit Cloud
-            if "gcp_service_account" in st.secrets:
-                credentials_dict = dict(st.secrets["gcp_service_account"])
-                st.session_state.gc = gspread.service_account_from_dict(credentials_dict)
-            else:
-                # Fallback para arquivo local
-                st.session_state.gc = gspread.service_account(filename="credenciais.json")
-        sh = st.session_state.gc.open("listagem_empenhos")
-        return sh
+        return _planilha()
     except Exception as e:
         st.error(f"Erro ao conectar ao Google Sheets: {e}")
         return None
 
+def _aba_da_conexao(titulo):
+    """Handle da aba guardado na conexão atual (cada sh.worksheet é uma chamada de metadados)."""
+    for tentativa in range(2):
+        conexao = _conexao()
+        if titulo in conexao["abas"]:
+            return conexao["abas"][titulo]
+        try:
+            ws = conexao["sh"].worksheet(titulo)
+        except Exception as e:
+            if tentativa == 0 and _erro_de_autenticacao(e):
+                reconectar_sheets()
+                continue
+            raise
+        conexao["abas"][titulo] = ws
+        return ws
+
+def obter_aba(titulo):
+    """
+    Aba da planilha principal, guardada na conexão compartilhada.
+    O handle devolvido continua valendo depois de uma reconexão (autenticação expirada)
+    ou de descartar_aba: cada uso pega a aba da conexão atual.
+    Levanta gspread.WorksheetNotFound se a aba não existe.
+    """
+    _aba_da_conexao(titulo)
+    return _Reconectavel(lambda: _aba_da_conexao(titulo))
+
+def descartar_aba(titulo):
+    """Esquece o handle guardado da aba (ex.: depois que ela foi apagada ou substituída)."""
+    try:
+        _conexao()["abas"].pop(titulo, None)
+    except Exception:
+        pass
+
+# Leituras em paralelo e em segundo plano (só chamadas à API: nada de st.* nessas threads)
+_LEITURAS = ThreadPoolExecutor(max_workers=4, thread_name_prefix="leitura-planilha")
+
+def _ler_em_paralelo(titulos):
+    """Uma leitura get_all_values por aba, todas ao mesmo tempo (handles obtidos antes, nesta thread)."""
+    abas = {}
+    for titulo in titulos:
+        try:
+            abas[titulo] = obter_aba(titulo)
+        except gspread.WorksheetNotFound:
+            pass
+    if not abas:
+        return {}
+    futuros = {titulo: _LEITURAS.submit(ws.get_all_values) for titulo, ws in abas.items()}
+    return {titulo: futuro.result() for titulo, futuro in futuros.items()}
+
+def iniciar_leitura(titulo):
+    """
+    Começa a ler a aba inteira em segundo plano. Retorna um Future de (valores, revisão da planilha);
+    a revisão é lida antes dos dados, como no empenhos_cache. Levanta gspread.WorksheetNotFound
+    se a aba não existe.
+    """
+    sh = _planilha()
+    ws = obter_aba(titulo)
+
+    def ler():
+        revisao = revisao_planilha(sh)
+        return ws.get_all_values(), revisao
+    return _LEITURAS.submit(ler)
+
+def ler_abas(titulos):
+    """
+    Valores (como ws.get_all_values()) de várias abas numa única chamada values_batch_get,
+    em vez de uma leitura por aba. Se o lote falhar (ex.: uma das abas ainda não existe),
+    lê as abas em paralelo. Abas inexistentes ficam de fora. Retorna {titulo: valores}.
+    """
+    titulos = list(titulos)
+    if not titulos:
+        return {}
+    sh = _planilha()
+    try:
+        intervalos = ["'{}'".format(t.replace("'", "''")) for t in titulos]
+        resposta = sh.values_batch_get(intervalos)
+    except Exception as e:
+        print(f"[WARN] Leitura em lote das abas {titulos} falhou, lendo em paralelo: {e}")
+        return _ler_em_paralelo(titulos)
+    # O lote não completa as linhas com células vazias no fim; o get_all_values completa
+    return {titulo: fill_gaps(intervalo.get("values", []))
+            for titulo, intervalo in zip(titulos, resposta.get("valueRanges", []))}
+
+def registros_de_valores(valores):
+    """Mesmo resultado de ws.get_all_records() a partir dos valores já lidos da aba."""
+    if not valores:
+        return []
+    return to_records(valores[0], [numericise_all(linha) for linha in valores[1:]])
+
+@st.cache_resource(show_spinner=False)
+def _configuracoes():
+    """Registros da aba 'configuracoes', compartilhados pelas sessões (ver _configuracoes_em_dia)."""
+    return {"registros": None, "revisao": None, "lido_em": 0.0, "conferido_em": 0.0}
+
+def _guardar_configuracoes(registros, revisao=None):
+    agora = time.monotonic()
+    _configuracoes().update(registros=registros, revisao=revisao, lido_em=agora, conferido_em=agora)
+
+def _configuracoes_em_dia():
+    """
+    Os registros guardados ainda valem? Como a base de empenhos: a revisão da planilha é
+    comparada com a da leitura no máximo a cada CONFIG_CHECK_INTERVAL_SECONDS (pega edições
+    feitas direto na planilha); sem revisão, vale o CONFIG_TTL_SECONDS.
+    """
+    cache = _configuracoes()
+    if cache["registros"] is None:
+        return False
+    agora = time.monotonic()
+    if cache["revisao"] is None:
+        return agora - cache["lido_em"] < CONFIG_TTL_SECONDS
+    if agora - cache["conferido_em"] < CONFIG_CHECK_INTERVAL_SECONDS:
+        return True
+    revisao = revisao_planilha()
+    cache["conferido_em"] = agora
+    if revisao is None:
+        return agora - cache["lido_em"] < CONFIG_TTL_SECONDS
+    return revisao == cache["revisao"]
+
+def carregar_abas_iniciais(titulos=ABAS_INICIAIS):
+    """
+    Leitura de entrada da sessão: as abas pedidas numa chamada só. Já guarda as configurações
+    para obter_configuracao; os demais valores (usuários) vão para quem chamou.
+    """
+    abas = ler_abas(titulos)
+    if "configuracoes" in abas:
+        _guardar_configuracoes(registros_de_valores(abas["configuracoes"]))
+    return abas
+
 def init_usuarios():
     """Inicializa a planilha de usuários se não existir."""
     sh = conectar_sheets()
@@ -33,7 +272,7 @@ def init_usuarios():
         return
 
     try:
-        ws = sh.worksheet("usuarios")
+        ws = obter_aba("usuarios")
     except gspread.WorksheetNotFound:
         # Adicionado coluna PrimeiroAcesso
         ws = sh.add_worksheet(title="usuarios", rows=100, cols=5)
@@ -43,15 +282,19 @@ def hash_senha(senha):
     """Retorna o hash SHA-256 da senha."""
     return hashlib.sha256(senha.encode()).hexdigest()
 
-def verificar_login(usuario, senha):
-    """Verifica se o usuário e senha correspondem."""
+def verificar_login(usuario, senha, registros=None):
+    """
+    Verifica se o usuário e senha correspondem.
+    registros: linhas da aba 'usuarios' já lidas (ex.: por carregar_abas_iniciais); sem elas, lê a aba.
+    """
     sh = conectar_sheets()
     if not sh:
         return False, None, None
 
-    init_usuarios() # Garante que a planilha existe
-    ws = sh.worksheet("usuarios")
-    registros = ws.get_all_records()
+    if registros is None:
+        init_usuarios() # Garante que a planilha existe
+        ws = obter_aba("usuarios")
+        registros = ws.get_all_records()
 
     senha_hash = hash_senha(senha)
 
@@ -84,7 +327,7 @@ def cadastrar_usuario(usuario, senha, perfil, departamento):
         return False, "Erro de conexão."
 
     init_usuarios()
-    ws = sh.worksheet("usuarios")
+    ws = obter_aba("usuarios")
     registros = ws.get_all_records()
 
     # Verificar duplicidade
@@ -107,7 +350,7 @@ def alterar_senha(usuario, senha_antiga, senha_nova):
         return False, "Erro de conexão com o banco de dados."
 
     init_usuarios()
-    ws = sh.worksheet("usuarios")
+    ws = obter_aba("usuarios")
     registros = ws.get_all_records()
 
     if not registros:
@@ -159,7 +402,7 @@ def redefinir_senha_admin(usuario):
         return False, "Erro de conexão."
 
     init_usuarios()
-    ws = sh.worksheet("usuarios")
+    ws = obter_aba("usuarios")
     registros = ws.get_all_records()
 
     if not registros:
@@ -206,7 +449,7 @@ def get_all_users():
 
     init_usuarios()
     try:
-        ws = sh.worksheet("usuarios")
+        ws = obter_aba("usuarios")
         return ws.get_all_records()
     except Exception as e:
         st.error(f"Erro ao buscar usuários: {e}")
@@ -215,6 +458,8 @@ def get_all_users():
 def conectar_drive():
     """Conecta ao Google Drive API e retorna o serviço."""
     try:
+        if storage.backend_name(st.secrets) == "fake":
+            return sheets_client.CLIENT.wrap_drive(_conexao()["drive"])
         if "gcp_service_account" in st.secrets:
             credentials_dict = dict(st.secrets["gcp_service_account"])
             scopes = ['https://www.googleapis.com/auth/drive']
@@ -222,7 +467,8 @@ def conectar_drive():
         else:
             scopes = ['https://www.googleapis.com/auth/drive']
             creds = Credentials.from_service_account_file("credenciais.json", scopes=scopes)
-        return build('drive', 'v3', credentials=creds)
+        # Chamadas .execute() passam pelo controle de cota e retry
+        return sheets_client.CLIENT.wrap_drive(build('drive', 'v3', credentials=creds))
     except Exception as e:
         st.error(f"Erro ao conectar ao Google Drive API: {e}")
         return None
@@ -288,17 +534,20 @@ def obter_configuracao(chave, default=""):
     if not sh:
         return default
     try:
-        try:
-            ws = sh.worksheet("configuracoes")
-        except gspread.WorksheetNotFound:
-            # Se não existir a aba, criamos e retornamos o padrão
-            ws = sh.add_worksheet(title="configuracoes", rows=10, cols=2)
-            ws.append_row(["Chave", "Valor"])
-            ws.append_row([chave, default])
-            return default
-            
-        registros = ws.get_all_records()
-        for r in registros:
+        # Registros já lidos (no login ou numa consulta anterior) e ainda em dia dispensam a leitura da aba
+        if not _configuracoes_em_dia():
+            try:
+                ws = obter_aba("configuracoes")
+            except gspread.WorksheetNotFound:
+                # Se não existir a aba, criamos e retornamos o padrão
+                ws = sh.add_worksheet(title="configuracoes", rows=10, cols=2)
+                ws.append_row(["Chave", "Valor"])
+                ws.append_row([chave, default])
+                return default
+            # Revisão lida antes dos dados: uma edição durante a leitura provoca nova leitura depois
+            revisao = revisao_planilha()
+            _guardar_configuracoes(ws.get_all_records(), revisao)
+        for r in _configuracoes()["registros"]:
             if str(r.get("Chave", "")).strip() == chave:
                 return str(r.get("Valor", "")).strip()
     except Exception:
@@ -312,11 +561,13 @@ def salvar_configuracao(chave, valor):
         return False
     try:
         try:
-            ws = sh.worksheet("configuracoes")
+            ws = obter_aba("configuracoes")
         except gspread.WorksheetNotFound:
             ws = sh.add_worksheet(title="configuracoes", rows=10, cols=2)
             ws.append_row(["Chave", "Valor"])
             
+        # Releitura na próxima obter_configuracao, já com o valor novo
+        _configuracoes()["registros"] = None
         registros = ws.get_all_records()
         col_chave_idx = 1
         col_valor_idx = 2
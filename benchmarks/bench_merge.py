@@ -0,0 +1,66 @@
+"""
+Mede a mesclagem inteligente (merge_engine.merge_upload) de um upload com uma base
+já existente no Google Sheets, em vários tamanhos.
+
+    python benchmarks/bench_merge.py --sizes 10000 100000 --repeat 3
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import merge_engine  # noqa: E402
+
+def make_frames(n_rows, seed=0):
+    """
+    Upload organizado e base existente com n_rows linhas cada. Metade dos empenhos se repete
+    entre os dois, ~1/3 do upload vem zerado e parte da base tem Observação e Anexo.
+    """
+    rng = np.random.default_rng(seed)
+    upload_emp = rng.permutation(n_rows) + n_rows // 2
+    base_emp = rng.permutation(n_rows)
+    # Empenhos anulados: valor e saldo zerados
+    zerado = rng.random(n_rows) < 1 / 3
+    valor = np.where(zerado, 0.0, rng.uniform(10, 250000, n_rows).round(2))
+    upload = pd.DataFrame({
+        "dotacao": "01.02.05.339030",
+        "numeroEmpenho": upload_emp.astype(str),
+        "valorEmpenho": valor,
+        "saldoPagar": np.where(zerado, 0.0, rng.choice([150.25, 9800.0], n_rows)),
+        "Status": "No Prazo",
+        "Observação": "",
+        "Anexo": "",
+    })
+    base = pd.DataFrame({
+        "dotacao": "01.02.05.339030",
+        "numeroEmpenho": base_emp.astype(str),
+        "valorEmpenho": rng.choice(["0,00", "1.234,56"], n_rows),
+        "saldoPagar": rng.choice(["0,00", "150,25", "9.800,00"], n_rows),
+        "Status": "Vencido",
+        "Observação": rng.choice(["", "Aguardando nota fiscal"], n_rows),
+        "Anexo": rng.choice(["", "https://drive.google.com/file/d/x/view"], n_rows),
+    })
+    return upload, base
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'linhas':>9} {'tempo (s)':>10} {'linhas/s':>12}  resumo")
+    for size in args.sizes:
+        upload, base = make_frames(size)
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            _, resumo = merge_engine.merge_upload(upload, base)
+            best = min(best, time.perf_counter() - start)
+        print(f"{size:>9} {best:>10.3f} {2 * size / best:>12,.0f}  {resumo}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Mede cada etapa do organize_sheet (leitura, pedido, seleção, numérico, status,
+formatação) em arquivos sintéticos: tempo, pico de memória e linhas/s.
+
+    python benchmarks/bench_organize_sheet.py --sizes 1000 100000 1000000 --format csv
+    python benchmarks/bench_organize_sheet.py --sizes 10000 --json resultados.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import data_processor  # noqa: E402
+import sheet_readers  # noqa: E402
+from synthetic_analitico import generate_analitico, write_analitico  # noqa: E402
+
+STAGES = ["leitura", "pedido", "seleção", "numérico", "status", "formatação"]
+
+# Data fixa para o Status: os resultados não mudam de um dia para o outro
+TODAY = "2026-01-01"
+
+def run_pipeline(path, engine, on_stage):
+    """
+    Executa as etapas do organize_sheet na mesma ordem, chamando on_stage(nome, func)
+    para cada uma. on_stage executa func() e devolve o resultado.
+    """
+    with open(path, "rb") as f:
+        df, _ = on_stage("leitura", lambda: sheet_readers.read_upload(f, engine=engine))
+    pedidos = on_stage("pedido", lambda: data_processor.extract_pedidos_compra(df))
+    result_df = on_stage("seleção", lambda: data_processor.select_result_columns(df, pedidos))
+    # A conversão numérica imprime amostras de debug; não interessam aqui
+    with contextlib.redirect_stdout(io.StringIO()):
+        result_df = on_stage("numérico", lambda: data_processor.convert_numeric_columns(result_df))
+    result_df = on_stage("status", lambda: data_processor.add_department_and_status(result_df, today=TODAY))
+    return on_stage("formatação", lambda: data_processor.format_result(result_df))
+
+def time_stages(path, engine, repeat):
+    """Melhor tempo (s) de cada etapa em `repeat` execuções completas."""
+    best = {stage: float("inf") for stage in STAGES}
+
+    def timed(stage, func):
+        start = time.perf_counter()
+        result = func()
+        best[stage] = min(best[stage], time.perf_counter() - start)
+        return result
+
+    for _ in range(repeat):
+        result_df = run_pipeline(path, engine, timed)
+    return best, len(result_df)
+
+def peak_memory(path, engine):
+    """Pico de memória (bytes) alocada por cada etapa, medido com tracemalloc numa execução à parte."""
+    peaks = {}
+
+    def traced(stage, func):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        peaks[stage] = tracemalloc.get_traced_memory()[1] - before
+        return result
+
+    tracemalloc.start()
+    try:
+        run_pipeline(path, engine, traced)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+    parser.add_argument("--engine", default=None, help="leitor de Excel (ver sheet_readers.READERS)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="grava os resultados neste arquivo para comparar entre versões")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'linhas':>9} {'etapa':>11} {'tempo (s)':>10} {'pico (MB)':>10} {'linhas/s':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = write_analitico(generate_analitico(size), Path(tmp) / f"analitico_{size}.{args.format}")
+            seconds, n_result = time_stages(path, args.engine, args.repeat)
+            peaks = peak_memory(path, args.engine)
+            for stage in STAGES + ["total"]:
+                if stage == "total":
+                    stage_seconds = sum(seconds.values())
+                    stage_peak = max(peaks.values())
+                else:
+                    stage_seconds, stage_peak = seconds[stage], peaks[stage]
+                rows_per_s = size / stage_seconds if stage_seconds else float("inf")
+                print(f"{size:>9} {stage:>11} {stage_seconds:>10.3f} {stage_peak / 2**20:>10.1f} {rows_per_s:>13,.0f}")
+                results.append({
+                    "linhas": size, "linhas_resultado": n_result, "formato": args.format, "etapa": stage,
+                    "tempo_s": stage_seconds, "pico_bytes": stage_peak, "linhas_por_s": rows_per_s,
+                })
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Compara os leitores de planilha do organizador (sheet_readers.READERS) nos mesmos
+arquivos sintéticos, em vários tamanhos.
+
+    python benchmarks/bench_readers.py --sizes 1000 10000 50000 --repeat 3
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import sheet_readers  # noqa: E402
+from synthetic_analitico import generate_analitico, write_analitico  # noqa: E402
+
+def time_reader(path, engine, repeat):
+    """Melhor tempo (s) de `repeat` leituras completas do arquivo."""
+    best = float("inf")
+    rows = 0
+    for _ in range(repeat):
+        with open(path, "rb") as f:
+            start = time.perf_counter()
+            frame, _ = sheet_readers.READERS[engine][0](f)
+            best = min(best, time.perf_counter() - start)
+            rows = len(frame)
+    return best, rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    engines = sheet_readers.available_readers()
+    missing = [name for name in sheet_readers.READERS if name not in engines]
+    if missing:
+        print(f"Leitores não instalados (ignorados): {', '.join(missing)}")
+
+    print(f"{'linhas':>9} {'leitor':>10} {'tempo (s)':>10} {'linhas/s':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            df = generate_analitico(size)
+            xlsx = write_analitico(df, Path(tmp) / f"analitico_{size}.xlsx")
+            csv = write_analitico(df, Path(tmp) / f"analitico_{size}.csv")
+            for engine in engines:
+                path = csv if engine == "csv" else xlsx
+                seconds, rows = time_reader(path, engine, args.repeat)
+                print(f"{size:>9} {engine:>10} {seconds:>10.3f} {rows / seconds:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
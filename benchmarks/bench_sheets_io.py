@@ -0,0 +1,93 @@
+"""
+Mede, contra o Google Sheets simulado (fake_google) com latência por chamada, o custo em
+tempo e em chamadas à API das operações da aplicação: edição de observações (busca linear
+x fila em lote), regravação da base (completa x só as células alteradas) e leituras
+parciais (aba inteira x só as colunas usadas, via column_reader).
+
+    python benchmarks/bench_sheets_io.py --empenhos 5000 --latency-ms 150 --edits 50
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import fake_google  # noqa: E402
+from column_reader import ColumnReader  # noqa: E402
+import sheets_writer  # noqa: E402
+import write_queue  # noqa: E402
+from empenho_index import EmpenhoIndex  # noqa: E402
+from merge_engine import normalize_empenho  # noqa: E402
+
+def measure(faults, func):
+    """(segundos, chamadas à API) de func()."""
+    calls = faults.total_calls()
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start, faults.total_calls() - calls
+
+def cells(values):
+    """Células trafegadas numa leitura (o fake não simula o tempo de transferência)."""
+    if isinstance(values, pd.DataFrame):
+        return values.size
+    return sum(len(row) for row in values)
+
+def edit_linear(ws, empenhos):
+    # Como era: planilha inteira + busca linear a cada edição
+    for empenho in empenhos:
+        values = ws.get_all_values()
+        row = next(i for i, r in enumerate(values[1:], start=2) if normalize_empenho(r[1]) == empenho)
+        ws.update_cell(row, 11, f"obs {empenho}")
+
+def edit_queue(ws, empenhos, indice):
+    fila = write_queue.WriteQueue()
+    for empenho in empenhos:
+        fila.add(empenho, write_queue.CAMPO_OBSERVACAO, f"obs {empenho}")
+    fila.flush(ws, indice)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--empenhos", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--edits", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    sh, _ = fake_google.open_fake(latency_ms=args.latency_ms, empenhos=args.empenhos)
+    faults = sh._faults
+    ws = sh.worksheet("emp_controle")
+    values = ws.get_all_values()
+    indice = EmpenhoIndex.from_values(values)
+    empenhos = [normalize_empenho(r[1]) for r in values[1:args.edits + 1]]
+
+    results = [
+        (f"{args.edits} observações: leitura completa + busca", measure(faults, lambda: edit_linear(ws, empenhos))),
+        (f"{args.edits} observações: fila em lote", measure(faults, lambda: edit_queue(ws, empenhos, indice))),
+    ]
+
+    # Mesma base com o status de `edits` empenhos alterado
+    df = pd.DataFrame(ws.get_all_values(value_render_option="UNFORMATTED_VALUE")[1:], columns=values[0])
+    df.loc[df.index[:args.edits], "Status"] = "Encerrado"
+    results += [
+        (f"base com {args.edits} status novos: só células alteradas", measure(faults, lambda: sheets_writer.write_dataframe(ws, df))),
+        ("mesma base: reescrita completa", measure(faults, lambda: ws.update(sheets_writer.dataframe_to_rows(df), "A1"))),
+    ]
+
+    # Leituras que precisam de poucas colunas: mesmo número de chamadas, bem menos dados
+    reads = [
+        ("leitura: aba inteira", lambda: ws.get_all_values()),
+        ("leitura: cabeçalho + coluna de empenhos", lambda: ColumnReader(ws).read(["empenho"])),
+        ("leitura: saldo, status e departamento", lambda: ColumnReader(ws, values[0]).read(["saldo", "status", "departamento"])),
+    ]
+    read_cells = {}
+    for name, func in reads:
+        results.append((name, measure(faults, lambda: read_cells.__setitem__(name, cells(func())))))
+
+    print(f"latência simulada: {args.latency_ms:.0f} ms por chamada, {args.empenhos} empenhos")
+    print(f"{'operação':<50} {'tempo (s)':>10} {'chamadas':>9} {'células lidas':>14}")
+    for name, (seconds, calls) in results:
+        print(f"{name:<50} {seconds:>10.2f} {calls:>9} {read_cells.get(name, ''):>14}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Gerador de arquivos sintéticos no layout do analítico de empenhos (38 colunas),
+usado pelos benchmarks. Não faz parte da aplicação.
+
+    python benchmarks/synthetic_analitico.py --rows 1000 100000 1000000 --format csv --out /tmp/analiticos
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import data_processor  # noqa: E402
+
+# Cabeçalhos no layout do analítico (posições 0-indexed usadas pelo organizador:
+# D=3, F=5, H=7, I=8, J=9, K=10, W=22, AB=27, AJ=35, AK=36, AL=37)
+HEADERS = [
+    "entidade", "exercicio", "orgao", "dotacao", "ficha", "dataEmissao", "especie", "numeroEmpenho",
+    "codigoFornecedor", "nomeFornecedor", "tipoEmpenho", "modalidade", "licitacao", "processo",
+    "contrato", "fonteRecurso", "aplicacao", "categoria", "elemento", "subelemento", "funcao",
+    "subfuncao", "historico", "programa", "acao", "vinculo", "convenio", "valorEmpenho",
+    "valorAnulado", "valorLiquidado", "valorPago", "valorRetido", "valorEstornado",
+    "liquidadoPagar", "processado", "saldoPagar", "anoPedido", "numeroPedido",
+]
+
+TIPOS = ["Ordinário", "Global", "Estimativo"]
+FORNECEDORES = ["Comercial Alfa Ltda", "Construtora Beta S/A", "Papelaria Central ME", "Auto Posto Rio", "Clínica Vida"]
+
+# Históricos como vêm do sistema contábil: caixa misturada, abreviações, espaços
+# sobrando (inclusive o não separável), quebras de linha, ";" e aspas no meio do texto.
+# Nem todos têm um pedido que o PEDIDO_PATTERN reconhece ("ped." e "OF" não casam).
+HISTORICOS = [
+    "Aquisição de material conforme OC {n}",
+    "PEDIDO DE COMPRA Nº {n}/2025 - aquisição de material de expediente",
+    "pedido de compra n. {n}-2025;  entrega parcelada",
+    "Processo de Compra: Pedido {n}/2025\nReferente ao contrato {c}/2024",
+    "Ordem de Compra nº {n}\xa0 - serviços de manutenção",
+    "Ref. ped. {n}/2025 (sem número de OC)",
+    "Prestação de serviços",
+    "  Prestação de serviços de limpeza   urbana ",
+    "Pagto. \"parcela {c}\" do convênio; OF {n}",
+    "AQUISIÇÃO DE GÊNEROS ALIMENTÍCIOS - ALIMENTAÇÃO ESCOLAR",
+    "",
+]
+
+def messy_historico(rng):
+    """Um histórico sorteado de HISTORICOS, com números aleatórios."""
+    return rng.choice(HISTORICOS).format(n=rng.randint(1, 9999), c=rng.randint(1, 99))
+
+def brl(value):
+    """Formata um float como o analítico exporta: "1.234,56"."""
+    return f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def generate_analitico(n_rows, seed=0, subline_ratio=0.15):
+    """Gera um DataFrame de strings com n_rows linhas (empenhos + sub-linhas de pedido)."""
+    rng = random.Random(seed)
+    codes = list(data_processor.DEPARTAMENTOS)
+    rows = []
+    numero = 0
+    while len(rows) < n_rows:
+        if rows and rng.random() < subline_ratio:
+            # Sub-linha sem número de empenho, com o pedido em colunas dedicadas ou no texto
+            row = [""] * len(HEADERS)
+            if rng.random() < 0.5:
+                row[36], row[37] = "2025", str(rng.randint(1, 9999))
+            elif rng.random() < 0.7:
+                row[22] = f"Pedido de compra nº {rng.randint(1, 9999)}/2025"
+            else:
+                row[22] = messy_historico(rng)
+            rows.append(row)
+            continue
+
+        numero += 1
+        valor = rng.uniform(10, 250000)
+        saldo = rng.choice([0.0, valor, valor * rng.random()])
+        row = [""] * len(HEADERS)
+        row[0], row[1], row[2] = "1", "2025", "01"
+        row[3] = f"{rng.choice(codes)}.{rng.randint(10, 99)}.{rng.randint(100, 999)}"
+        row[4] = str(rng.randint(1, 900))
+        row[5] = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025"
+        row[7] = str(numero)
+        row[8] = str(rng.randint(1, 5000))
+        row[9] = rng.choice(FORNECEDORES)
+        row[10] = rng.choice(TIPOS)
+        row[22] = messy_historico(rng)
+        row[27] = brl(valor)
+        row[30] = brl(valor - saldo)
+        row[35] = brl(saldo)
+        if rng.random() < 0.4:
+            row[36], row[37] = "2025", str(rng.randint(1, 9999))
+        rows.append(row)
+    return pd.DataFrame(rows, columns=HEADERS)
+
+def write_analitico(df, path):
+    """Grava o DataFrame como .xlsx ou .csv (separador ";", como o sistema contábil exporta)."""
+    path = Path(path)
+    if path.suffix == ".csv":
+        df.to_csv(path, sep=";", index=False, encoding="utf-8")
+    else:
+        df.to_excel(path, index=False, engine="xlsxwriter")
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera arquivos sintéticos no layout do analítico.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+    parser.add_argument("--out", default=".")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    for n_rows in args.rows:
+        path = write_analitico(generate_analitico(n_rows, seed=args.seed), out / f"analitico_{n_rows}.{args.format}")
+        print(f"{path} ({n_rows:,} linhas)")
+
+if __name__ == "__main__":
+    main()
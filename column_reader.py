@@ -0,0 +1,77 @@
+import pandas as pd
+from gspread.utils import rowcol_to_a1
+
+from empenho_index import FIRST_DATA_ROW
+
+def _column_letter(position):
+    """Letra da coluna (base 1): 1 -> "A", 28 -> "AB"."""
+    return rowcol_to_a1(1, position)[:-1]
+
+class ColumnReader:
+    """
+    Leitura seletiva de colunas de uma aba: o cabeçalho é lido uma vez e cada leitura baixa
+    só as colunas pedidas, todas numa chamada batch_get (um intervalo "B2:B" por coluna),
+    em vez de trazer a aba inteira com o get_all_values (Histórico, Observação...).
+    """
+
+    def __init__(self, ws, header=None):
+        self.ws = ws
+        self._header = [str(h).strip() for h in header] if header is not None else None
+
+    @property
+    def header(self):
+        """Cabeçalho da aba (linha 1), lido na primeira vez que é preciso."""
+        if self._header is None:
+            self._header = [str(h).strip() for h in self.ws.row_values(1)]
+        return self._header
+
+    def position(self, column):
+        """
+        Posição (base 1) da coluna: nome exato (sem diferenciar maiúsculas) ou, se não houver,
+        a primeira que contém o texto ("saldo" -> "saldoPagar"). None se não existe.
+        """
+        names = [h.lower() for h in self.header]
+        column = column.strip().lower()
+        if column in names:
+            return names.index(column) + 1
+        return next((i + 1 for i, name in enumerate(names) if column in name), None)
+
+    @staticmethod
+    def _same_length(value_ranges):
+        columns = [list(vr[0]) if vr else [] for vr in value_ranges]
+        # A API omite as células vazias do fim de cada coluna
+        n_rows = max(len(c) for c in columns)
+        return [c + [""] * (n_rows - len(c)) for c in columns]
+
+    @staticmethod
+    def _ranges(positions):
+        return [f"{_column_letter(p)}{FIRST_DATA_ROW}:{_column_letter(p)}" for p in positions]
+
+    def read_positions(self, positions):
+        """
+        Valores das linhas de dados das colunas nas posições dadas, numa chamada só.
+        Retorna uma lista por coluna, todas com o mesmo número de linhas.
+        """
+        if not positions:
+            return []
+        return self._same_length(self.ws.batch_get(self._ranges(positions), major_dimension="COLUMNS"))
+
+    def read_with_header(self, positions):
+        """
+        Como read_positions, mas relê também o cabeçalho (linha 1) na mesma chamada, para
+        conferir se as posições ainda valem. Retorna (cabeçalho, colunas); o cabeçalho lido
+        passa a ser o deste leitor.
+        """
+        value_ranges = self.ws.batch_get(["1:1"] + self._ranges(positions), major_dimension="COLUMNS")
+        # Com COLUMNS, a linha 1 vem como uma lista por coluna (vazia se a célula está vazia)
+        self._header = [str(c[0]).strip() if c else "" for c in value_ranges[0]]
+        return self.header, self._same_length(value_ranges[1:]) if positions else []
+
+    def read(self, columns):
+        """
+        DataFrame só com as colunas pedidas (nomes como em position(); colunas do resultado
+        com o nome do cabeçalho). Colunas que não existem na aba ficam de fora.
+        """
+        positions = [p for p in dict.fromkeys(self.position(c) for c in columns) if p is not None]
+        values = self.read_positions(positions)
+        return pd.DataFrame({self.header[p - 1]: v for p, v in zip(positions, values)}, dtype=object)
@@ -1,6 +1,15 @@
+import logging
+import re
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 
+import numeric_parser
+import pipeline_timer
+import sheet_readers
+
+logger = logging.getLogger(__name__)
+
 DEPARTAMENTOS = {
     "01.02.01": "GABINETE PREFEITO DEPENDÊNCIAS",
     "01.02.02": "PROCURADORIA JURIDICA",
@@ -35,6 +44,10 @@ DEPARTAMENTOS = {
     "05.05.01": "FUNDO DE PREVIDÊNCIA DOS SERVIDORES MUNICIPAIS"
 }
 
+# Versão das regras de processamento do organize_sheet. Altere sempre que mudar o resultado
+# do processamento (colunas, conversões, status...) para invalidar o cache de uploads.
+PROCESSING_RULES_VERSION = "2026.10.2"
+
 def get_department_name(code):
     """
     Returns the department name based on the code.
@@ -43,41 +56,320 @@ def get_department_name(code):
     prefix = clean_code[:8]
     return DEPARTAMENTOS.get(prefix, f"DEP-{prefix}")
 
-def organize_sheet(file):
+def get_department_names(codes):
+    """
+    Vectorized get_department_name: maps a whole Series of codes at once
+    (first 8 characters looked up in DEPARTAMENTOS, "DEP-<prefixo>" if unknown).
+    """
+    codes = pd.Series(codes)
+    # Mesmo texto que str(code) daria, inclusive "nan" para células vazias
+    clean_codes = codes.astype(object).where(codes.notna(), "nan").astype(str).str.strip()
+    prefixes = clean_codes.str[:8]
+    names = prefixes.map(DEPARTAMENTOS)
+    return names.fillna("DEP-" + prefixes).astype(object)
+
+# Colunas com poucos valores distintos, guardadas como "category" para economizar memória
+CATEGORY_COLUMN_KEYWORDS = ["departamento", "status", "tipo"]
+
+def categorize_columns(df):
+    """
+    Converts the low-cardinality columns (department, status, tipo) to pandas categoricals.
+    Use uncategorize_columns before fillna/replace or writing back to Google Sheets.
+    """
+    for col in df.columns:
+        if any(palavra in str(col).lower() for palavra in CATEGORY_COLUMN_KEYWORDS):
+            df[col] = df[col].astype("category")
+    return df
+
+def uncategorize_columns(df):
+    """Converts the categorical columns back to plain object columns."""
+    category_cols = df.select_dtypes("category").columns
+    if len(category_cols):
+        df = df.astype({col: object for col in category_cols})
+    return df
+
+PEDIDO_PATTERN = re.compile(
+    r'(?:pedido\s*de\s*compra|processo\s*de\s*compra(?:\s*:\s*pedido)?|pedido|ordem\s*de\s*compra|oc)\s*(?:n[ºo\.]|:|\s)*\s*(\d+(?:[/-]\d+)?)\b',
+    re.IGNORECASE,
+)
+
+def _pedido_from_columns(numero, ano):
+    """Monta "numero/ano" (ou só "numero") a partir das colunas dedicadas do pedido."""
+    numero_valido = (numero != "") & (numero != "0")
+    ano_valido = (ano != "") & (ano != "0")
+    numero = numero.str.replace(r"\.0$", "", regex=True)
+    ano = ano.str.replace(r"\.0$", "", regex=True)
+    pedido = numero.where(~ano_valido, numero + "/" + ano)
+    return pedido.where(numero_valido, "")
+
+def extract_pedidos_compra(frame):
+    """
+    Extracts the "Pedido de Compra" of every row with a valid empenho number.
+    `frame` is the projected sheet returned by sheet_readers (source columns + sub-line text).
+    Works column-wise (no per-row loop). Priority order of the sources:
+    1. dedicated columns (AK/AL) of the same row;
+    2. dedicated columns of the next row, when it is a sub-line (no empenho);
+    3. regex over the histórico of the same row;
+    4. regex over every cell of the next row, when it is a sub-line.
+    Returns a Series aligned with frame.index ("" when nothing is found).
+    """
+    n_rows = len(frame)
+    if n_rows == 0:
+        return pd.Series("", index=frame.index, dtype=object)
+
+    def column(position):
+        source = sheet_readers.source_column(frame, position)
+        if source is None:
+            return pd.Series("", index=range(n_rows), dtype=object)
+        return sheet_readers.clean_text(source).reset_index(drop=True)
+
+    empenho = column(sheet_readers.COL_EMPENHO)
+    numero = column(sheet_readers.COL_NUMERO_PEDIDO)
+    ano = column(sheet_readers.COL_ANO_PEDIDO)
+    historico = column(sheet_readers.COL_HISTORICO)
+    row_text = frame[sheet_readers.ROW_TEXT_COLUMN].reset_index(drop=True)
+
+    has_empenho = empenho != ""
+    # Linha de baixo existe e é uma sub-linha (sem número de empenho)
+    next_is_subline = (~has_empenho).shift(-1, fill_value=False)
+
+    # 1. Colunas dedicadas da própria linha
+    from_columns = _pedido_from_columns(numero, ano)
+    pedido = from_columns.copy()
+
+    # 2. Colunas dedicadas da linha de baixo
+    use_next = (pedido == "") & next_is_subline
+    pedido = pedido.mask(use_next, from_columns.shift(-1, fill_value=""))
+
+    # 3 e 4. Fallbacks por regex, resolvidos numa única passada de str.extract
+    need_regex = has_empenho & (pedido == "")
+    hist_rows = need_regex[need_regex].index
+    next_rows = need_regex[need_regex & next_is_subline].index
+    if len(hist_rows):
+        hist_texts = historico.loc[hist_rows]
+        # Texto de todas as células da linha de baixo (já juntado pelo leitor)
+        next_texts = row_text.shift(-1, fill_value="").loc[next_rows]
+
+        texts = pd.concat([hist_texts, next_texts], ignore_index=True)
+        found = texts.str.extract(PEDIDO_PATTERN, expand=False).fillna("")
+        found_hist = pd.Series(found.iloc[:len(hist_texts)].to_numpy(), index=hist_rows)
+        found_next = pd.Series(found.iloc[len(hist_texts):].to_numpy(), index=next_rows)
+
+        pedido.loc[hist_rows] = found_hist
+        still_missing = (found_hist.loc[next_rows] == "").to_numpy()
+        pedido.loc[next_rows[still_missing]] = found_next[still_missing]
+
+    pedido = pedido.where(has_empenho, "")
+    return pd.Series(pedido.to_numpy(dtype=object), index=frame.index)
+
+# Quantos dias antes do prazo o empenho passa a aparecer como "Vence em N dias"
+STATUS_WARNING_DAYS = 5
+
+def compute_status(saldo, valor, prazo, today=None):
+    """
+    Computes the Status of every empenho at once.
+    - "Em execução": saldo > 0 and different from the original valor;
+    - "Data Inválida": no deadline;
+    - "Vencido" / "Vence em N dias" / "No Prazo": days left until the deadline.
+    `today` can be injected (date, datetime or string); defaults to now.
+    """
+    today = pd.Timestamp(datetime.now() if today is None else today)
+    saldo_val = numeric_parser.to_float_or_zero(saldo).to_numpy()
+    valor_val = numeric_parser.to_float_or_zero(valor).to_numpy()
+    prazo = pd.to_datetime(pd.Series(prazo), errors='coerce')
+
+    # Mesma contagem de (deadline - today).days: dias inteiros, arredondando para baixo
+    days_remaining = (prazo - today).dt.days
+    days_text = days_remaining.fillna(0).astype(int).astype(str)
+
+    conditions = [
+        (saldo_val > 0.01) & (np.abs(saldo_val - valor_val) > 0.01),
+        prazo.isna().to_numpy(),
+        (days_remaining < 0).to_numpy(),
+        (days_remaining <= STATUS_WARNING_DAYS).to_numpy(),
+    ]
+    choices = [
+        "Em execução",
+        "Data Inválida",
+        "Vencido",
+        ("Vence em " + days_text + " dias").to_numpy(dtype=object),
+    ]
+    status = np.select(conditions, choices, default="No Prazo")
+    return pd.Series(status, index=prazo.index, dtype=object)
+
+def select_result_columns(df, pedidos_compra):
+    """
+    Keeps only the analítico columns (D, F, H, I, J, K, W, AB, AJ) plus the
+    "Pedido de Compra" and drops the sub-lines (rows without an empenho).
+    """
+    # Extract specific columns (D, F, H, I, J, K, W, AB, AJ)
+    result_df = pd.concat(
+        [sheet_readers.source_column(df, p) for p in sheet_readers.ANALITICO_COLUMNS], axis=1
+    )
+    
+    # Associar o "Pedido de Compra" mapeado para o index correto
+    result_df["Pedido de Compra"] = pedidos_compra
+    
+    # Filtrar para manter apenas as linhas com empenho válido (ignorar sub-linhas vazias após extrair os dados delas)
+    col_emp_temp = next((c for c in result_df.columns if "empenho" in c.lower()), None)
+    if col_emp_temp:
+        result_df = result_df[sheet_readers.clean_text(result_df[col_emp_temp]) != ""].copy()
+    return result_df
+
+def convert_numeric_columns(result_df):
+    """
+    Converts the Brazilian-formatted value columns to float and cleans the identifier columns.
+    """
+    # CRÍTICO: Converter valores com vírgula decimal (formato brasileiro) para float
+    # O Excel salva valores como "18500,51" ou "13412,43" (strings com vírgula decimal)
+    # Precisamos converter vírgula para ponto ANTES de converter para float
+    
+    # Lista para debug
+    debug_conversions = []
+    log_debug = logger.isEnabledFor(logging.DEBUG)
+    
+    # Aplicar conversão apenas nas colunas que não são identificadores, texto ou data
+    for col in result_df.columns:
+        col_lower = col.lower()
+        
+        # Pular colunas de texto/data claras
+        if any(palavra in col_lower for palavra in ['data', 'prazo', 'status', 'departamento', 'observação', 'observacao', 'nome', 'histórico', 'historico', 'atividade', 'tipoempenho']):
+            continue
+            
+        # Pular identificadores/códigos (ex: número do empenho, código do fornecedor)
+        # Mas não se for valor/saldo do empenho
+        if "valor" not in col_lower and "saldo" not in col_lower and any(palavra in col_lower for palavra in ['empenho', 'emp.', 'emp', 'código', 'codigo', 'cod.', 'nº', 'numero', 'número']):
+            # Garantir que identificadores sejam strings limpas (ex: "164" em vez de "164.0")
+            def clean_id_val(val):
+                if pd.isna(val):
+                    return ""
+                val_str = str(val).strip()
+                if val_str.endswith(".0"):
+                    val_str = val_str[:-2]
+                return val_str
+            result_df[col] = result_df[col].apply(clean_id_val)
+            continue
+            
+        # Aplicar conversão brasileira decimal para float (valores que não são números ficam como estão)
+        original_col = result_df[col]
+        result_df[col] = numeric_parser.parse_br_numbers(original_col, keep_invalid=True)
+        
+        # Debug: registrar conversões de valores monetários (só com o log em nível DEBUG)
+        if not log_debug:
+            continue
+        converted = pd.to_numeric(result_df[col], errors="coerce")
+        mask_debug = (converted > 100) & original_col.notna()
+        debug_conversions.extend(f"{o} -> {c}" for o, c in zip(original_col[mask_debug].head(10), converted[mask_debug].head(10)))
+    
+    # Mostrar conversões realizadas
+    if debug_conversions:
+        # Mostrar primeiras 10
+        logger.debug("Conversoes realizadas:\n  %s", "\n  ".join(debug_conversions[:10]))
+    return result_df
+
+def add_department_and_status(result_df, today=None):
+    """
+    Inserts the "Departamento (De/Para)" column, the 90-day deadline and the Status.
+    """
+    # Insert "De/Para" (Department) after Column D (which is now at index 0 in result_df)
+    # Column D is at result_df.columns[0]
+    col_d_name = result_df.columns[0]
+    col_f_name = result_df.columns[1] # F is at index 1 initially
+    
+    # Apply mapping
+    department_names = get_department_names(result_df[col_d_name])
+    
+    # Insert "Departamento (De/Para)" at index 1 (after the Code column), keeping the code column
+    result_df.insert(1, "Departamento (De/Para)", department_names)
+    
+    # Date Logic (Column F)
+    # result_df now has: Code(0), Dept(1), F(2), H(3)...
+    # So col_f_name (which we grabbed before) is still valid as a reference to the source Series name.
+    
+    # Convert to datetime (with dayfirst=True for Brazilian format DD/MM/YYYY)
+    result_df[col_f_name] = pd.to_datetime(result_df[col_f_name], dayfirst=True, errors='coerce')
+    
+    # Calculate +90 days
+    result_df["Prazo (90 dias)"] = result_df[col_f_name] + timedelta(days=90)
+    
+    # Status Check
+    col_tipo_name = result_df.columns[4]
+    col_valor_name = result_df.columns[8]
+    col_saldo_name = result_df.columns[9]
+    
+    result_df["Status"] = compute_status(
+        result_df[col_saldo_name], result_df[col_valor_name], result_df["Prazo (90 dias)"], today=today
+    )
+    return result_df
+
+def format_result(result_df):
+    """
+    Formats the date columns for display, rounds the monetary columns and
+    guarantees the "Observação" and "Anexo" columns.
+    """
+    # Coluna F (data de emissão) fica logo depois do Departamento
+    col_f_name = result_df.columns[2]
+
+    # Formatting Date Columns for display
+    result_df[col_f_name] = result_df[col_f_name].dt.strftime('%d/%m/%Y')
+    result_df["Prazo (90 dias)"] = result_df["Prazo (90 dias)"].dt.strftime('%d/%m/%Y')
+
+    # Garantir que colunas monetárias sejam números (float) para o Google Sheets
+    # NÃO formatar como string aqui - deixar a formatação para a exibição no Streamlit
+    for col in result_df.columns:
+        col_lower = col.lower()
+        
+        # Pular colunas que não são monetárias
+        if any(palavra in col_lower for palavra in ['data', 'prazo', 'status', 'departamento', 'observa']):
+            continue
+        
+        # Pular colunas que são identificadores (números inteiros, não valores monetários)
+        # Ex: Número do Empenho, Código do Fornecedor (mas não se for valor/saldo!)
+        if "valor" not in col_lower and "saldo" not in col_lower and any(palavra in col_lower for palavra in ['empenho', 'emp.', 'emp', 'código', 'codigo', 'cod.', 'nº', 'numero', 'número']):
+            continue
+            
+        # Verificar se é uma coluna numérica ou se contém palavras-chave que indicam valores monetários
+        # Isso é necessário porque CSVs são lidos como strings (dtype 'object')
+        is_monetary = any(palavra in col_lower for palavra in ['valor', 'saldo', 'pago', 'pagar', 'liquidado', 'empenhado'])
+        if pd.api.types.is_numeric_dtype(result_df[col]) or is_monetary:
+            try:
+                # Apenas garantir que é numérico (float) - NÃO converter para string
+                result_df[col] = pd.to_numeric(result_df[col], errors='coerce')
+                # Arredondar para 2 casas decimais
+                result_df[col] = result_df[col].round(2)
+            except Exception:
+                pass  # Se der erro, mantém o valor original
+
+
+    if "Observação" not in result_df.columns:
+        # Garantir coluna Observação
+        result_df["Observação"] = ""
+        
+    if "Anexo" not in result_df.columns:
+        # Garantir coluna Anexo
+        result_df["Anexo"] = ""
+    return result_df
+
+def organize_sheet(file, today=None, engine=None, timer=None):
     """
     Reads an Excel or CSV file, extracts specific columns, 
     adds Department mapping, and calculates deadlines.
+    `today` is the reference date for the status (defaults to now).
+    `engine` picks the Excel reader (see sheet_readers.READERS).
+    `timer` (pipeline_timer.PipelineTimer) records the time of each stage.
     """
+    timer = timer or pipeline_timer.PipelineTimer()
     try:
-        # Load data
-        if file.name.endswith('.csv'):
-            # Tentativa robusta de leitura com diferentes encodings e separadores
-            success = False
-            for enc in ['utf-8', 'iso-8859-1', 'windows-1252']:
-                for separator in [';', ',', '\t']:
-                    try:
-                        file.seek(0)
-                        # Usa on_bad_lines='skip' se versões mais novas do pandas, mas error no antigo. Vamos focar no sep.
-                        df_temp = pd.read_csv(file, dtype=str, encoding=enc, sep=separator)
-                        if len(df_temp.columns) > 1:  # Se achou mais de uma coluna, o delimitador está correto
-                            df = df_temp
-                            success = True
-                            break
-                    except Exception:
-                        continue
-                if success:
-                    break
-            
-            if not success:
-                # Fallback final tentando auto-detect com a engine do Python
-                file.seek(0)
-                try:
-                    df = pd.read_csv(file, dtype=str, encoding='iso-8859-1', sep=None, engine='python')
-                except Exception as e:
-                    return None, f"Erro crítico na leitura do CSV. Verifique se o formato está correto. Detalhe: {e}"
-        else:
-            # Ler Excel como strings para preservar formatação brasileira (vírgula decimal)
-            df = pd.read_excel(file, dtype=str, engine='openpyxl')
+        # Load data (só as colunas usadas + texto das sub-linhas, ver sheet_readers)
+        # Excel como strings para preservar formatação brasileira (vírgula decimal)
+        try:
+            with timer.stage("leitura do arquivo") as etapa:
+                df, dialect = sheet_readers.read_upload(file, engine=engine)
+                etapa["linhas"] = len(df)
+        except Exception as e:
+            if file.name.lower().endswith('.csv'):
+                return None, f"Erro crítico na leitura do CSV. Verifique se o formato está correto. Detalhe: {e}"
+            raise
         
         # Define target columns by Excel letter (0-indexed)
         # D=3, F=5, H=7, J=9, K=10, W=22, AJ=35
@@ -85,274 +377,27 @@ def organize_sheet(file):
         
         # Check if file has enough columns
         max_col_idx = 35
-        if df.shape[1] <= max_col_idx:
-            return None, f"Erro: A planilha tem apenas {df.shape[1]} colunas, mas precisamos da coluna AJ (índice 35)."
+        n_source_cols = df.attrs["source_width"]
+        if n_source_cols <= max_col_idx:
+            return None, f"Erro: A planilha tem apenas {n_source_cols} colunas, mas precisamos da coluna AJ (índice 35)."
 
         # Extrair "Pedido de Compra" robustamente (da mesma linha ou da linha de baixo)
-        import re
-        pattern = r'(?:pedido\s*de\s*compra|processo\s*de\s*compra(?:\s*:\s*pedido)?|pedido|ordem\s*de\s*compra|oc)\s*(?:n[ºo\.]|:|\s)*\s*(\d+(?:[/-]\d+)?)\b'
-        
-        pedidos_compra = []
-        for i in range(len(df)):
-            emp_val = str(df.iloc[i, 7]).strip() if df.shape[1] > 7 else ""
-            if emp_val and emp_val != "nan" and emp_val != "":
-                pedido = ""
-                # 1. Tentar pegar das colunas dedicadas na própria linha (coluna 38/index 37 = numeroPedido, coluna 37/index 36 = anoPedido)
-                num_ped = str(df.iloc[i, 37]).strip() if df.shape[1] > 37 else ""
-                ano_ped = str(df.iloc[i, 36]).strip() if df.shape[1] > 36 else ""
-                
-                # Tratar valores vazios ou "0" ou "nan"
-                if num_ped and num_ped != "nan" and num_ped != "0" and num_ped != "":
-                    if num_ped.endswith(".0"):
-                        num_ped = num_ped[:-2]
-                    if ano_ped and ano_ped != "nan" and ano_ped != "0" and ano_ped != "":
-                        if ano_ped.endswith(".0"):
-                            ano_ped = ano_ped[:-2]
-                        pedido = f"{num_ped}/{ano_ped}"
-                    else:
-                        pedido = num_ped
-                
-                # 2. Se não achou na própria linha, verificar a linha de baixo (i+1) nas mesmas colunas (se ela não tiver número de empenho)
-                if not pedido and i + 1 < len(df):
-                    next_emp = str(df.iloc[i + 1, 7]).strip() if df.shape[1] > 7 else ""
-                    if not next_emp or next_emp == "nan" or next_emp == "":
-                        num_ped_next = str(df.iloc[i + 1, 37]).strip() if df.shape[1] > 37 else ""
-                        ano_ped_next = str(df.iloc[i + 1, 36]).strip() if df.shape[1] > 36 else ""
-                        
-                        if num_ped_next and num_ped_next != "nan" and num_ped_next != "0" and num_ped_next != "":
-                            if num_ped_next.endswith(".0"):
-                                num_ped_next = num_ped_next[:-2]
-                            if ano_ped_next and ano_ped_next != "nan" and ano_ped_next != "0" and ano_ped_next != "":
-                                if ano_ped_next.endswith(".0"):
-                                    ano_ped_next = ano_ped_next[:-2]
-                                pedido = f"{num_ped_next}/{ano_ped_next}"
-                            else:
-                                pedido = num_ped_next
-                
-                # 3. Fallback: Procurar no histórico da própria linha por regex
-                if not pedido:
-                    hist_val = str(df.iloc[i, 22]).strip() if df.shape[1] > 22 else ""
-                    match = re.search(pattern, hist_val, re.IGNORECASE)
-                    if match:
-                        pedido = match.group(1)
-                
-                # 4. Fallback 2: Procurar em todas as colunas da linha de baixo por regex (se ela não tiver número de empenho)
-                if not pedido and i + 1 < len(df):
-                    next_emp = str(df.iloc[i + 1, 7]).strip() if df.shape[1] > 7 else ""
-                    if not next_emp or next_emp == "nan" or next_emp == "":
-                        # Procurar em todas as colunas da linha de baixo
-                        for col_idx in range(df.shape[1]):
-                            cell_val = str(df.iloc[i + 1, col_idx]).strip()
-                            if cell_val and cell_val != "nan":
-                                match_next = re.search(pattern, cell_val, re.IGNORECASE)
-                                if match_next:
-                                    pedido = match_next.group(1)
-                                    break
-                
-                pedidos_compra.append(pedido)
-            else:
-                pedidos_compra.append("")
-                
-        df["Pedido de Compra"] = pedidos_compra
-
-        # Extract specific columns using iloc
-        # We start with D (3)
-        col_indices = [3, 5, 7, 8, 9, 10, 22, 27, 35]
-        
-        # Select data
-        result_df = df.iloc[:, col_indices].copy()
-        
-        # Associar o "Pedido de Compra" mapeado para o index correto
-        result_df["Pedido de Compra"] = [pedidos_compra[idx] for idx in result_df.index]
-        
-        # Filtrar para manter apenas as linhas com empenho válido (ignorar sub-linhas vazias após extrair os dados delas)
-        col_emp_temp = next((c for c in result_df.columns if "empenho" in c.lower()), None)
-        if col_emp_temp:
-            result_df = result_df[result_df[col_emp_temp].astype(str).str.strip().replace("nan", "") != ""].copy()
-        
-        # CRÍTICO: Converter valores com vírgula decimal (formato brasileiro) para float
-        # O Excel salva valores como "18500,51" ou "13412,43" (strings com vírgula decimal)
-        # Precisamos converter vírgula para ponto ANTES de converter para float
-        
-        # Lista para debug
-        debug_conversions = []
-        
-        def convert_brazilian_decimal(val):
-            """Converte valores do formato brasileiro (vírgula) ou americano (ponto) para float"""
-            if pd.isna(val):
-                return val
-            
-            original_val = val  # Guardar para debug
-            
-            # Se já é número, retorna como está
-            if isinstance(val, (int, float)):
-                return float(val)
-            
-            # Se é string, tenta converter
-            if isinstance(val, str):
-                val_clean = val.strip()
-                
-                # Se tem vírgula, é formato brasileiro com vírgula como separador decimal
-                if ',' in val_clean:
-                    # Se tem PONTO: formato "1.234,56" (ponto=milhar, vírgula=decimal)
-                    if '.' in val_clean:
-                        # Remove pontos (separador de milhar) e troca vírgula por ponto
-                        val_clean = val_clean.replace('.', '').replace(',', '.')
-                    # Se tem APENAS VÍRGULA: formato "18500,51" (vírgula=decimal)
-                    else:
-                        # Apenas troca vírgula por ponto (NÃO remove nada!)
-                        val_clean = val_clean.replace(',', '.')
-                
-                # Tenta converter para float
-                try:
-                    result = float(val_clean)
-                    # Debug: registrar conversões de valores monetários
-                    if result > 100:  # Provavelmente valor monetário
-                        debug_conversions.append(f"{original_val} -> {result}")
-                    return result
-                except ValueError:
-                    return val  # Se não conseguir converter, retorna original
-            
-            return val
-        
-        # Aplicar conversão apenas nas colunas que não são identificadores, texto ou data
-        for col in result_df.columns:
-            col_lower = col.lower()
-            
-            # Pular colunas de texto/data claras
-            if any(palavra in col_lower for palavra in ['data', 'prazo', 'status', 'departamento', 'observação', 'observacao', 'nome', 'histórico', 'historico', 'atividade', 'tipoempenho']):
-                continue
-                
-            # Pular identificadores/códigos (ex: número do empenho, código do fornecedor)
-            # Mas não se for valor/saldo do empenho
-            if "valor" not in col_lower and "saldo" not in col_lower and any(palavra in col_lower for palavra in ['empenho', 'emp.', 'emp', 'código', 'codigo', 'cod.', 'nº', 'numero', 'número']):
-                # Garantir que identificadores sejam strings limpas (ex: "164" em vez de "164.0")
-                def clean_id_val(val):
-                    if pd.isna(val):
-                        return ""
-                    val_str = str(val).strip()
-                    if val_str.endswith(".0"):
-                        val_str = val_str[:-2]
-                    return val_str
-                result_df[col] = result_df[col].apply(clean_id_val)
-                continue
-                
-            # Aplicar conversão brasileira decimal para float
-            result_df[col] = result_df[col].apply(convert_brazilian_decimal)
-        
-        # Mostrar conversões realizadas
-        if debug_conversions:
-            print("[DEBUG] Conversoes realizadas:")
-            for conv in debug_conversions[:10]:  # Mostrar primeiras 10
-                print(f"  {conv}")
-        
-        # Insert "De/Para" (Department) after Column D (which is now at index 0 in result_df)
-        # Column D is at result_df.columns[0]
-        col_d_name = result_df.columns[0]
-        col_f_name = result_df.columns[1] # F is at index 1 initially
-        
-        # Apply mapping
-        department_names = result_df[col_d_name].apply(get_department_name)
-        
-        # Insert "Departamento (De/Para)" at index 1 (after the Code column), keeping the code column
-        result_df.insert(1, "Departamento (De/Para)", department_names)
-        
-        # Date Logic (Column F)
-        # result_df now has: Code(0), Dept(1), F(2), H(3)...
-        # So col_f_name (which we grabbed before) is still valid as a reference to the source Series name.
-        
-        # Convert to datetime (with dayfirst=True for Brazilian format DD/MM/YYYY)
-        result_df[col_f_name] = pd.to_datetime(result_df[col_f_name], dayfirst=True, errors='coerce')
-        
-        # Calculate +90 days
-        result_df["Prazo (90 dias)"] = result_df[col_f_name] + timedelta(days=90)
-        
-        # Status Check
-        today = datetime.now()
-        
-        col_tipo_name = result_df.columns[4]
-        col_valor_name = result_df.columns[8]
-        col_saldo_name = result_df.columns[9]
-        
-        def determine_status(row):
-            def parse_to_float(val):
-                if pd.isna(val) or val == "":
-                    return 0.0
-                if isinstance(val, (int, float)):
-                    return float(val)
-                try:
-                    val_str = str(val).strip().replace("R$", "").replace(" ", "")
-                    if "," in val_str and "." in val_str:
-                        val_str = val_str.replace(".", "").replace(",", ".")
-                    elif "," in val_str:
-                        val_str = val_str.replace(",", ".")
-                    return float(val_str)
-                except:
-                    return 0.0
-
-            saldo_val = parse_to_float(row[col_saldo_name])
-            valor_val = parse_to_float(row[col_valor_name])
-            
-            # Se o saldo do empenho comparado com o valor do empenho original 
-            # for diferente de zero e diferentes entre si, coloque em execução
-            if saldo_val > 0.01 and abs(saldo_val - valor_val) > 0.01:
-                return "Em execução"
-            
-            # Caso contrário, segue a lógica de 90 dias
-            deadline = row["Prazo (90 dias)"]
-            if pd.isna(deadline):
-                return "Data Inválida"
-            
-            days_remaining = (deadline - today).days
-            
-            if days_remaining < 0:
-                return "Vencido"
-            elif days_remaining <= 5: # Warning threshold
-                return f"Vence em {days_remaining} dias"
-            else:
-                return "No Prazo"
-
-        result_df["Status"] = result_df.apply(determine_status, axis=1)
-        
-        # Formatting Date Columns for display
-        result_df[col_f_name] = result_df[col_f_name].dt.strftime('%d/%m/%Y')
-        result_df["Prazo (90 dias)"] = result_df["Prazo (90 dias)"].dt.strftime('%d/%m/%Y')
-
-        # Garantir que colunas monetárias sejam números (float) para o Google Sheets
-        # NÃO formatar como string aqui - deixar a formatação para a exibição no Streamlit
-        for col in result_df.columns:
-            col_lower = col.lower()
-            
-            # Pular colunas que não são monetárias
-            if any(palavra in col_lower for palavra in ['data', 'prazo', 'status', 'departamento', 'observa']):
-                continue
-            
-            # Pular colunas que são identificadores (números inteiros, não valores monetários)
-            # Ex: Número do Empenho, Código do Fornecedor (mas não se for valor/saldo!)
-            if "valor" not in col_lower and "saldo" not in col_lower and any(palavra in col_lower for palavra in ['empenho', 'emp.', 'emp', 'código', 'codigo', 'cod.', 'nº', 'numero', 'número']):
-                continue
-                
-            # Verificar se é uma coluna numérica ou se contém palavras-chave que indicam valores monetários
-            # Isso é necessário porque CSVs são lidos como strings (dtype 'object')
-            is_monetary = any(palavra in col_lower for palavra in ['valor', 'saldo', 'pago', 'pagar', 'liquidado', 'empenhado'])
-            if pd.api.types.is_numeric_dtype(result_df[col]) or is_monetary:
-                try:
-                    # Apenas garantir que é numérico (float) - NÃO converter para string
-                    result_df[col] = pd.to_numeric(result_df[col], errors='coerce')
-                    # Arredondar para 2 casas decimais
-                    result_df[col] = result_df[col].round(2)
-                except Exception:
-                    pass  # Se der erro, mantém o valor original
-
-
-        if "Observação" not in result_df.columns:
-            # Garantir coluna Observação
-            result_df["Observação"] = ""
-            
-        if "Anexo" not in result_df.columns:
-            # Garantir coluna Anexo
-            result_df["Anexo"] = ""
+        with timer.stage("pedido de compra", rows=len(df)):
+            pedidos_compra = extract_pedidos_compra(df)
+
+        # Cada etapa abaixo também é medida separadamente em benchmarks/bench_organize_sheet.py
+        with timer.stage("seleção de colunas", rows=len(df)):
+            result_df = select_result_columns(df, pedidos_compra)
+        with timer.stage("conversão numérica", rows=len(result_df)):
+            result_df = convert_numeric_columns(result_df)
+        with timer.stage("departamento e status", rows=len(result_df)):
+            result_df = add_department_and_status(result_df, today=today)
+        with timer.stage("formatação", rows=len(result_df)):
+            result_df = format_result(result_df)
+        result_df = categorize_columns(result_df)
             
+        # Como o arquivo foi lido (encoding/separador), para exibir na página do organizador
+        result_df.attrs["leitura"] = dialect
         return result_df, None
 
 
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+from merge_engine import normalize_empenho, normalize_empenhos
+
+# Primeira linha de dados da aba (a linha 1 é o cabeçalho)
+FIRST_DATA_ROW = 2
+
+def _column_position(header, keywords):
+    """Posição (base 1) da primeira coluna cujo nome contém alguma das palavras, ou None."""
+    return next((i + 1 for i, c in enumerate(header) if any(k in c.lower() for k in keywords)), None)
+
+class EmpenhoIndex:
+    """
+    Linha de cada empenho na aba emp_controle (base 1, como o gspread) e posição das colunas
+    editadas pela aplicação, para gravar células sem baixar a planilha inteira.
+
+    O índice pode ficar desatualizado se a planilha for editada por fora: antes de gravar,
+    a fila de edições (write_queue) relê só a coluna de empenhos e monta um índice novo.
+    """
+
+    def __init__(self, header, empenhos):
+        self.header = [str(h).strip() for h in header]
+        self.col_empenho = _column_position(self.header, ["empenho"])
+        self.col_observacao = _column_position(self.header, ["observação", "observacao"])
+        self.col_anexo = _column_position(self.header, ["anexo"])
+        keys = normalize_empenhos(pd.Series(list(empenhos), dtype=object))
+        # Empenho repetido: vale a primeira linha (a mesma que a busca linear encontrava)
+        first = ~keys.duplicated(keep="first").to_numpy()
+        self.rows = dict(zip(keys[first], (np.flatnonzero(first) + FIRST_DATA_ROW).tolist()))
+
+    @classmethod
+    def from_values(cls, all_values):
+        """Índice a partir de ws.get_all_values() (cabeçalho + linhas)."""
+        if not all_values:
+            return cls([], [])
+        header = all_values[0]
+        col = _column_position([str(h).strip() for h in header], ["empenho"])
+        empenhos = [row[col - 1] if col and len(row) >= col else "" for row in all_values[1:]]
+        return cls(header, empenhos)
+
+    @classmethod
+    def from_reader(cls, reader):
+        """Índice lendo da aba só o cabeçalho e a coluna de empenhos (column_reader.ColumnReader)."""
+        col = _column_position(reader.header, ["empenho"])
+        return cls(reader.header, reader.read_positions([col])[0] if col else [])
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Índice da planilha que acabou de ser gravada a partir de df (cabeçalho na linha 1)."""
+        header = [str(c) for c in df.columns]
+        col = _column_position([h.strip() for h in header], ["empenho"])
+        return cls(header, df.iloc[:, col - 1] if col else [])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def row_of(self, empenho):
+        """Linha do empenho segundo o índice (sem conferir na planilha), ou None."""
+        return self.rows.get(normalize_empenho(empenho))
+
+    def add_column(self, name):
+        """Registra uma coluna criada no fim do cabeçalho e retorna a posição dela."""
+        self.header.append(name)
+        position = len(self.header)
+        if self.col_observacao is None and _column_position([name], ["observação", "observacao"]):
+            self.col_observacao = position
+        if self.col_anexo is None and _column_position([name], ["anexo"]):
+            self.col_anexo = position
+        return position
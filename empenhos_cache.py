@@ -0,0 +1,214 @@
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from merge_engine import normalize_empenho, normalize_empenhos
+
+# Sem como consultar a revisão da planilha, a base é relida depois desse tempo (pega alterações feitas por fora)
+TTL_SECONDS = 60
+# Intervalo mínimo entre duas consultas da revisão da planilha (chamada leve de metadados)
+CHECK_INTERVAL_SECONDS = 15
+
+def _empenho_column(columns):
+    return next((c for c in columns if "empenho" in str(c).lower()), None)
+
+def _sheet_text(value):
+    """Valor como o get_all_values() do Sheets devolve: texto, sem ".0" em números inteiros."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def as_sheet_text(df):
+    """
+    DataFrame recém-gravado no Sheets no mesmo formato da leitura (todas as células como texto,
+    com o mesmo dtype que o pandas dá às colunas de uma leitura nova).
+    """
+    df = df.rename(columns=lambda c: str(c).strip())
+    return pd.DataFrame({c: [v if type(v) is str else _sheet_text(v) for v in df[c].tolist()] for c in df.columns})
+
+class EmpenhosCache:
+    """
+    Base de empenhos em memória, compartilhada por todas as sessões do processo.
+    Depois das nossas próprias gravações, as linhas alteradas são corrigidas aqui (patch)
+    em vez de descartar tudo e baixar a aba emp_controle de novo.
+
+    A releitura completa só acontece na primeira carga, no botão "Atualizar Dados" (invalidate)
+    ou quando a planilha foi alterada por fora: a cada CHECK_INTERVAL_SECONDS, no máximo,
+    a revisão atual da planilha é comparada com a da base carregada. Sem revisão disponível,
+    vale o TTL.
+
+    Só a primeira carga (e a seguinte a um invalidate) espera a leitura. Nas outras vezes,
+    get() devolve na hora a última base boa e a conferência/releitura roda numa thread;
+    quando termina, a base nova substitui a antiga de uma vez para todas as sessões.
+    """
+
+    def __init__(self, ttl_seconds=TTL_SECONDS, check_interval_seconds=CHECK_INTERVAL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self.lock = threading.Lock()
+        self.df = None
+        self.keys = None
+        self.loaded_at = None
+        self.updated_at = None      # datetime da base atual, para o aviso "dados de HH:MM"
+        self.revision = None
+        self.checked_at = None
+        # Muda a cada patch/replace/invalidate: uma releitura iniciada antes não sobrescreve a base
+        self.generation = 0
+        self.refreshing = False
+        self.last_error = None
+
+    def _set(self, df, revision=None):
+        col = _empenho_column(df.columns)
+        self.keys = normalize_empenhos(df[col]).to_numpy() if col else np.array([], dtype=object)
+        self.df = df
+        self.loaded_at = self.checked_at = time.monotonic()
+        self.updated_at = datetime.now()
+        self.revision = revision
+        self.generation += 1
+
+    def expired(self):
+        return self.df is None or time.monotonic() - self.loaded_at >= self.ttl_seconds
+
+    def _check_due(self, revision_fn):
+        """Já é hora de conferir se a base está desatualizada? (sem chamada de rede)"""
+        if revision_fn is None or self.revision is None:
+            return self.expired()
+        return time.monotonic() - self.checked_at >= self.check_interval_seconds
+
+    def _stale(self, revision_fn):
+        """Consulta a revisão e diz se a base precisa ser relida."""
+        if revision_fn is None or self.revision is None:
+            return self.expired()
+        revision = revision_fn()
+        with self.lock:
+            self.checked_at = time.monotonic()
+        if revision is None:
+            # Consulta falhou: não dá para saber, volta ao TTL
+            return self.expired()
+        return revision != self.revision
+
+    def _load(self, loader, revision_fn):
+        # Revisão lida antes dos dados: uma edição durante a leitura provoca nova leitura depois
+        revision = revision_fn() if revision_fn is not None else None
+        return loader(), revision
+
+    def _refresh(self, loader, revision_fn):
+        """Conferência e releitura em segundo plano; troca a base só se ninguém a alterou nesse meio-tempo."""
+        try:
+            generation = self.generation
+            if not self._stale(revision_fn):
+                return
+            df, revision = self._load(loader, revision_fn)
+            with self.lock:
+                if self.generation == generation:
+                    self._set(df, revision)
+            self.last_error = None
+        except Exception as e:
+            # Continua servindo a última base boa; tenta de novo na próxima conferência
+            self.last_error = str(e)
+            print(f"[WARN] Falha ao atualizar a base de empenhos em segundo plano: {e}")
+        finally:
+            self.refreshing = False
+
+    def get(self, loader, revision_fn=None):
+        """
+        Cópia da base. Sem base, chama loader() (leitura completa) e espera; com base, devolve
+        a atual e, se for hora, confere/relê em segundo plano.
+        revision_fn(): revisão atual da planilha (ou None se não der para consultar).
+        loader e revision_fn podem rodar numa thread: não devem usar st.*.
+        Exceções do loader na primeira carga são propagadas e não ficam guardadas.
+        """
+        with self.lock:
+            if self.df is None:
+                df, revision = self._load(loader, revision_fn)
+                self._set(df, revision)
+            elif not self.refreshing and self._check_due(revision_fn):
+                self.refreshing = True
+                threading.Thread(target=self._refresh, args=(loader, revision_fn), daemon=True).start()
+            # Cópia: quem chama pode criar colunas auxiliares sem alterar a base compartilhada
+            return self.df.copy()
+
+    def seed(self, loader, revision=None):
+        """
+        Preenche a base com dados já baixados por outra leitura (ex.: a do login), se ela
+        ainda está vazia. loader() só é chamado nesse caso. Retorna True se a base foi preenchida.
+        """
+        with self.lock:
+            if self.df is not None:
+                return False
+            self._set(loader(), revision)
+            return True
+
+    def mark_revision(self, revision, before):
+        """
+        Registra a revisão da planilha depois de uma gravação nossa (a base já foi corrigida).
+        before: revisão lida logo antes da gravação. Se ela não é a da base em memória, alguém
+        alterou a planilha por fora desde a última leitura: adotar a revisão nova esconderia
+        essa alteração, então a base é descartada. Sem revisão (consulta falhou), vale o TTL.
+        """
+        with self.lock:
+            if self.df is None or revision is None or before is None:
+                return
+            if before != self.revision:
+                self._invalidate()
+                return
+            self.revision = revision
+            self.checked_at = time.monotonic()
+
+    def replace(self, df, revision=None):
+        """
+        Troca a base inteira (ex.: depois da mesclagem, a planilha passa a ser df).
+        revision: revisão da planilha logo depois de gravar df.
+        """
+        with self.lock:
+            self._set(df, revision)
+
+    def _invalidate(self):
+        self.df = None
+        self.generation += 1
+
+    def invalidate(self):
+        """Descarta a base; a próxima leitura baixa a planilha de novo (esperando por ela)."""
+        with self.lock:
+            self._invalidate()
+
+    def patch(self, empenho, column, value):
+        """
+        Corrige uma célula da base em memória (primeira linha do empenho, como na planilha).
+        Retorna False se não há base ou o empenho não está nela.
+        """
+        return self.patch_many([(empenho, column, value)]) == 1
+
+    def patch_many(self, changes):
+        """
+        Corrige várias células (empenho, coluna, valor) numa única cópia da base, em vez
+        de uma cópia por célula. Retorna quantas foram aplicadas.
+        """
+        with self.lock:
+            if self.df is None:
+                return 0
+            located = []
+            for empenho, column, value in changes:
+                positions = np.flatnonzero(self.keys == normalize_empenho(empenho))
+                if len(positions):
+                    located.append((positions[0], column, value))
+            if not located:
+                return 0
+            # Nova versão da base em vez de alterar a atual, que pode estar em uso por outra sessão
+            df = self.df.copy()
+            columns = {}
+            for position, column, value in located:
+                if column not in columns:
+                    columns[column] = (df[column].to_numpy(dtype=object).copy() if column in df.columns
+                                       else np.full(len(df), "", dtype=object))
+                columns[column][position] = value
+            for column, values in columns.items():
+                df[column] = values
+            self.df = df
+            self.generation += 1
+            return len(located)
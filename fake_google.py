@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import random
+import secrets
+import threading
+import time
+import uuid
+
+import httplib2
+import numpy as np
+import requests
+from googleapiclient.errors import HttpError
+from gspread.exceptions import APIError
+
+import data_processor
+import storage
+
+# Configuração do fake (variáveis de ambiente ou seção [storage] das secrets)
+LATENCY_ENV = "EMPENHOS_FAKE_LATENCY_MS"
+ERROR_RATE_ENV = "EMPENHOS_FAKE_ERROR_RATE"
+QUOTA_ENV = "EMPENHOS_FAKE_QUOTA_PER_MINUTE"
+SEED_ENV = "EMPENHOS_FAKE_EMPENHOS"
+# Senha provisória do usuário "admin" da base de exemplo (sem ela, uma senha aleatória é sorteada)
+ADMIN_PASSWORD_ENV = "EMPENHOS_FAKE_ADMIN_PASSWORD"
+
+# Métodos que viram chamadas à API no gspread de verdade (os outros são só atributos locais)
+WORKSHEET_CALLS = frozenset({
+    "get_all_values", "get_all_records", "get_values", "batch_get", "row_values", "col_values", "cell", "find",
+    "update", "update_cell", "batch_update", "append_row", "clear", "batch_clear", "resize",
+})
+SPREADSHEET_CALLS = frozenset({
+    "worksheet", "worksheets", "add_worksheet", "duplicate_sheet", "del_worksheet", "batch_update", "values_batch_get",
+})
+
+def _api_error(code, message):
+    """APIError do gspread como a biblioteca levanta para uma resposta de erro do Google."""
+    response = requests.Response()
+    response.status_code = code
+    response._content = json.dumps({"error": {"code": code, "message": message, "status": "RESOURCE_EXHAUSTED"}}).encode()
+    return APIError(response)
+
+def _http_error(code, message):
+    """HttpError do googleapiclient (Drive)."""
+    return HttpError(httplib2.Response({"status": code}), json.dumps({"error": {"code": code, "message": message}}).encode())
+
+class FaultInjector:
+    """
+    Latência e erros simulados de cada chamada:
+    - latency_ms (+ até jitter_ms aleatório) de espera;
+    - error_rate: fração das chamadas que falham com 429 (ou 503) aleatoriamente;
+    - quota_per_minute: como o Google, recusa com 429 o que passar da cota no último minuto.
+    Conta as chamadas e os erros injetados por nome do método.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, quota_per_minute=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.quota_per_minute = quota_per_minute
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = []
+        self.calls = {}
+        self.errors = 0
+
+    def before_call(self, name, error_factory):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            now = time.monotonic()
+            self.recent = [t for t in self.recent if now - t < 60]
+            over_quota = self.quota_per_minute is not None and len(self.recent) >= self.quota_per_minute
+            if not over_quota:
+                self.recent.append(now)
+            failure = over_quota or self.random.random() < self.error_rate
+            code = 429 if over_quota or self.random.random() < 0.5 else 503
+            delay = (self.latency_ms + self.random.random() * self.jitter_ms) / 1000
+        if delay:
+            time.sleep(delay)
+        if failure:
+            with self.lock:
+                self.errors += 1
+            raise error_factory(code, f"Erro simulado pelo fake_google em {name}")
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+class _Faulty:
+    """Repassa ao objeto local; os métodos de CALLS passam antes pelo FaultInjector."""
+
+    CALLS = frozenset()
+
+    def __init__(self, target, faults):
+        self._target = target
+        self._faults = faults
+
+    def _wrap_result(self, value):
+        return value
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if name not in self.CALLS:
+            return value
+
+        def call(*args, **kwargs):
+            self._faults.before_call(name, _api_error)
+            return self._wrap_result(value(*args, **kwargs))
+        return call
+
+class FakeWorksheet(_Faulty):
+    CALLS = WORKSHEET_CALLS
+
+    @property
+    def spreadsheet(self):
+        return FakeSpreadsheet(self._target.spreadsheet, self._faults)
+
+class FakeSpreadsheet(_Faulty):
+    """
+    Planilha do Google Sheets em memória: a mesma interface do storage.LocalSpreadsheet
+    (subconjunto do gspread usado pela aplicação) num SQLite ":memory:", com latência e
+    erros de cota simulados em cada chamada.
+    """
+
+    CALLS = SPREADSHEET_CALLS
+
+    def __init__(self, target=None, faults=None):
+        super().__init__(target if target is not None else storage.LocalSpreadsheet(":memory:"), faults or FaultInjector())
+
+    def _wrap_result(self, value):
+        if isinstance(value, storage.LocalWorksheet):
+            return FakeWorksheet(value, self._faults)
+        if isinstance(value, list):
+            return [self._wrap_result(v) for v in value]
+        return value
+
+    @property
+    def id(self):
+        return "fake-listagem-empenhos"
+
+    def del_worksheet(self, worksheet):
+        self._faults.before_call("del_worksheet", _api_error)
+        target = worksheet._target if isinstance(worksheet, FakeWorksheet) else worksheet
+        return self._target.del_worksheet(target)
+
+    def revision(self):
+        """Conta as alterações do banco em memória (faz o papel da "version" do Drive)."""
+        with self._target.lock:
+            return self._target.conn.total_changes
+
+class _FakeRequest:
+    def __init__(self, faults, name, action):
+        self._faults = faults
+        self._name = name
+        self._action = action
+
+    def execute(self, num_retries=0):
+        self._faults.before_call(f"drive.{self._name}", _http_error)
+        return self._action()
+
+class _FakeFiles:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def create(self, body=None, media_body=None, fields=None, **kwargs):
+        def action():
+            file_id = uuid.uuid4().hex
+            size = media_body.size() if media_body is not None else 0
+            self._drive.stored[file_id] = {"id": file_id, "name": (body or {}).get("name"), "size": size,
+                                          "parents": (body or {}).get("parents", [])}
+            return {"id": file_id, "webViewLink": f"https://drive.google.com/file/d/{file_id}/view"}
+        return _FakeRequest(self._drive.faults, "files.create", action)
+
+    def delete(self, fileId, **kwargs):
+        def action():
+            if self._drive.stored.pop(fileId, None) is None:
+                raise _http_error(404, f"File not found: {fileId}")
+            return ""
+        return _FakeRequest(self._drive.faults, "files.delete", action)
+
+    def get(self, fileId, fields=None, **kwargs):
+        def action():
+            if fileId not in self._drive.stored:
+                raise _http_error(404, f"File not found: {fileId}")
+            return dict(self._drive.stored[fileId])
+        return _FakeRequest(self._drive.faults, "files.get", action)
+
+class _FakePermissions:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def create(self, fileId, body=None, fields=None, **kwargs):
+        return _FakeRequest(self._drive.faults, "permissions.create", lambda: {"id": "anyoneWithLink"})
+
+class FakeDrive:
+    """Serviço do Drive em memória: files().create/get/delete e permissions().create com .execute()."""
+
+    def __init__(self, faults=None):
+        self.faults = faults or FaultInjector()
+        self.stored = {}  # id -> metadados do arquivo
+
+    def files(self):
+        return _FakeFiles(self)
+
+    def permissions(self):
+        return _FakePermissions(self)
+
+def options_from_env(secrets=None):
+    """Parâmetros do FaultInjector e tamanho da base de exemplo (variáveis de ambiente > [storage] das secrets)."""
+    section = {}
+    if secrets is not None:
+        try:
+            section = secrets.get("storage", {})
+        except Exception:
+            section = {}
+
+    def value(env, key, cast, default):
+        raw = os.environ.get(env) or section.get(key)
+        return cast(raw) if raw not in (None, "") else default
+
+    return {
+        "latency_ms": value(LATENCY_ENV, "fake_latency_ms", float, 0),
+        "error_rate": value(ERROR_RATE_ENV, "fake_error_rate", float, 0.0),
+        "quota_per_minute": value(QUOTA_ENV, "fake_quota_per_minute", int, None),
+        "empenhos": value(SEED_ENV, "fake_empenhos", int, 1000),
+        "admin_password": value(ADMIN_PASSWORD_ENV, "fake_admin_password", str, None),
+    }
+
+def seed_demo(sh, n_empenhos=1000, admin_password=None, seed=0):
+    """
+    Preenche a planilha com o usuário "admin" (senha provisória `admin_password`, com troca
+    obrigatória no primeiro acesso; sem ela, sorteia uma e mostra no console), as configurações
+    padrão e n_empenhos empenhos sintéticos na aba emp_controle.
+    """
+    rng = np.random.default_rng(seed)
+    if not admin_password:
+        admin_password = secrets.token_urlsafe(9)
+        print(f"[INFO] fake_google: usuário 'admin', senha provisória '{admin_password}' (defina {ADMIN_PASSWORD_ENV} para fixá-la)")
+    senha = hashlib.sha256(admin_password.encode()).hexdigest()
+    usuarios = sh.add_worksheet(title="usuarios", rows=100, cols=5)
+    usuarios.update([["Usuario", "Senha", "Perfil", "Departamento", "PrimeiroAcesso"],
+                     ["admin", senha, "Administrador", "", "TRUE"]], "A1")
+    configuracoes = sh.add_worksheet(title="configuracoes", rows=10, cols=2)
+    configuracoes.update([["Chave", "Valor"], ["DRIVE_FOLDER_ID", "fake-pasta"]], "A1")
+
+    departamentos = list(data_processor.DEPARTAMENTOS.values())
+    status = ["No Prazo", "Vencido", "Vence em 10 dias", "Em execução"]
+    valor = rng.uniform(100, 250000, n_empenhos).round(2)
+    rows = [["Data Emissão", "numeroEmpenho", "Código Fornecedor", "Nome Fornecedor", "Histórico",
+             "valorEmpenho", "saldoPagar", "Prazo (90 dias)", "Status", "Departamento (De/Para)",
+             "Observação", "Anexo"]]
+    for i in range(n_empenhos):
+        rows.append([
+            f"{rng.integers(1, 29):02d}/{rng.integers(1, 13):02d}/2026", str(1000 + i), str(rng.integers(100, 999)),
+            f"FORNECEDOR {rng.integers(1, 300)} LTDA", "AQUISIÇÃO DE MATERIAL DE CONSUMO CONFORME PROCESSO",
+            float(valor[i]), float((valor[i] * rng.choice([0, 0.5, 1])).round(2)), "",
+            str(rng.choice(status)), str(rng.choice(departamentos)), "", "",
+        ])
+    empenhos = sh.add_worksheet(title="emp_controle", rows=len(rows), cols=len(rows[0]))
+    empenhos.update(rows, "A1")
+    return sh
+
+def open_fake(latency_ms=0, error_rate=0.0, quota_per_minute=None, empenhos=1000, seed=0, admin_password=None):
+    """(planilha, drive) falsos, com o mesmo FaultInjector e a base de exemplo já preenchida."""
+    faults = FaultInjector(latency_ms=latency_ms, error_rate=error_rate, quota_per_minute=quota_per_minute, seed=seed)
+    local = storage.LocalSpreadsheet(":memory:")
+    # Base de exemplo gravada sem latência nem erros
+    seed_demo(local, n_empenhos=empenhos, admin_password=admin_password, seed=seed)
+    return FakeSpreadsheet(local, faults), FakeDrive(faults)
@@ -6,6 +6,18 @@ import time
 import gspread
 from google.oauth2.service_account import Credentials
 import data_processor
+import numeric_parser
+import sheet_readers
+import upload_cache
+import pipeline_timer
+import merge_engine
+import sheets_writer
+import sheets_client
+import empenho_index
+import column_reader
+import write_queue
+import empenhos_cache
+import storage
 
 
 import auth_manager
@@ -87,6 +99,17 @@ if "departamento" not in st.session_state:
 if "primeiro_acesso" not in st.session_state:
     st.session_state.primeiro_acesso = False
 
+# Bases compartilhadas por todas as sessões (antes do login, que já pode preenchê-las)
+@st.cache_resource(show_spinner=False)
+def _indice_empenhos():
+    """Índice empenho -> linha da aba emp_controle, compartilhado por todas as sessões."""
+    return {"indice": None}
+
+@st.cache_resource(show_spinner=False)
+def cache_empenhos():
+    """Base de empenhos em memória, compartilhada por todas as sessões (ver empenhos_cache)."""
+    return empenhos_cache.EmpenhosCache()
+
 # ===============================
 # SIDEBAR LOGIN / CADASTRO
 # ===============================
@@ -155,8 +178,22 @@ if not st.session_state.usuario:
     login_pass = st.sidebar.text_input("Senha", type="password")
     
     if st.sidebar.button("Entrar"):
-        sucesso, perfil, depto, p_acesso = auth_manager.verificar_login(login_user.strip(), login_pass)
+        # Só o necessário para conferir a senha: usuários e configurações numa leitura só
+        try:
+            abas = auth_manager.carregar_abas_iniciais()
+        except Exception as e:
+            print(f"[WARN] Leitura inicial das abas falhou: {e}")
+            abas = {}
+        usuarios = auth_manager.registros_de_valores(abas["usuarios"]) if "usuarios" in abas else None
+        sucesso, perfil, depto, p_acesso = auth_manager.verificar_login(login_user.strip(), login_pass, registros=usuarios)
         if sucesso:
+            if cache_empenhos().df is None:
+                # Senha conferida: a base de empenhos começa a ser baixada enquanto a página recarrega
+                # (carregar_empenhos usa essa leitura no lugar de uma nova)
+                try:
+                    st.session_state.prefetch_empenhos = auth_manager.iniciar_leitura("emp_controle")
+                except Exception as e:
+                    print(f"[WARN] Não foi possível iniciar a leitura da base de empenhos: {e}")
             st.session_state.usuario = login_user
             st.session_state.perfil = perfil
             st.session_state.departamento = depto
@@ -213,25 +250,37 @@ departamento_usuario = st.session_state.departamento
     
     
 def conectar_sheets():
-    sh = auth_manager.conectar_sheets()
-    # auth_manager já retorna a planilha "listagem_empenhos" aberta
-    # Precisamos da aba "emp_controle" (ou "empenhos" se for o caso - verificar original)
-    # No código anterior era "emp_controle".
+    # Aba "emp_controle" da planilha principal; o handle fica guardado na conexão compartilhada do auth_manager
     try:
-        ws = sh.worksheet("emp_controle")
-        return ws
+        return auth_manager.obter_aba("emp_controle")
     except Exception as e:
         st.error(f"Erro ao acessar aba de empenhos: {e}")
         return None
 
-
-def normalize_empenho(val):
-    if pd.isna(val):
-        return ""
-    val_str = str(val).strip()
-    if val_str.endswith(".0"):
-        val_str = val_str[:-2]
-    return val_str
+def gravar_emp_controle(ws, df):
+    """Grava df na aba emp_controle (só o que mudou) e retorna o resumo do sheets_writer."""
+    escrita = sheets_writer.write_dataframe(ws, df)
+    if escrita["modo"] == "staging":
+        # A aba antiga foi substituída pela staging: o handle guardado não vale mais
+        auth_manager.descartar_aba("emp_controle")
+    # A planilha agora é exatamente df: o índice e a base em memória do acompanhamento saem dele, sem reler o Sheets
+    guardar_indice(empenho_index.EmpenhoIndex.from_dataframe(df))
+    # A revisão nova é a da nossa gravação (a planilha inteira agora é df): não precisa relê-la por causa dela
+    cache_empenhos().replace(data_processor.categorize_columns(empenhos_cache.as_sheet_text(df)),
+                             revision=auth_manager.revisao_planilha())
+    return escrita
+
+def guardar_indice(indice):
+    _indice_empenhos()["indice"] = indice
+
+def indice_emp_controle(ws):
+    """Índice guardado da aba emp_controle; se ainda não existe, lê a coluna de empenhos uma vez para montá-lo."""
+    indice = _indice_empenhos()["indice"]
+    if indice is None:
+        # Só o cabeçalho e a coluna de empenhos, em vez da aba inteira
+        indice = empenho_index.EmpenhoIndex.from_reader(column_reader.ColumnReader(ws))
+        guardar_indice(indice)
+    return indice
 
 
 def get_worksheet_data(ws):
@@ -240,7 +289,10 @@ def get_worksheet_data(ws):
     Retrieves all values and parses them into a list of dicts,
     ignoring empty trailing columns and avoiding duplicate header errors.
     """
-    all_values = ws.get_all_values()
+    return registros_da_planilha(ws.get_all_values())
+
+def registros_da_planilha(all_values):
+    """Lista de dicts de get_worksheet_data a partir dos valores já lidos (cabeçalho + linhas)."""
     if not all_values:
         return []
     
@@ -264,7 +316,21 @@ def get_worksheet_data(ws):
     return records
 
 
-@st.cache_data(ttl=60) # Cache por 60 segundos para evitar recarregar toda hora
+def ler_empenhos(ws, destino_indice):
+    """
+    Leitura completa da aba emp_controle. Sem chamadas st.*: roda também na thread de atualização
+    em segundo plano (destino_indice é o dict de _indice_empenhos(), obtido antes na sessão).
+    """
+    return montar_empenhos(ws.get_all_values(), destino_indice)
+
+def montar_empenhos(all_values, destino_indice):
+    """Base de empenhos a partir dos valores da aba emp_controle (leitura completa ou a do login)."""
+    # Aproveita a leitura completa para refazer o índice empenho -> linha usado nas edições
+    destino_indice["indice"] = empenho_index.EmpenhoIndex.from_values(all_values)
+    df = pd.DataFrame(registros_da_planilha(all_values))
+    # Departamento, Status e Tipo como "category": menos memória no cache e filtros mais rápidos
+    return data_processor.categorize_columns(df)
+
 def carregar_empenhos():
     ws = conectar_sheets()
     if ws is None:
@@ -272,14 +338,32 @@ def carregar_empenhos():
         return pd.DataFrame()
     
     try:
-        dados = get_worksheet_data(ws)
-        df = pd.DataFrame(dados)
+        # Só baixa a planilha se ela mudou desde a última leitura (revisão do Drive) ou se a base foi descartada;
+        # com base em memória, a conferência e a releitura rodam em segundo plano
+        cache = cache_empenhos()
+        destino_indice = _indice_empenhos()
+        prefetch = st.session_state.pop("prefetch_empenhos", None)
+        if prefetch is not None:
+            # Leitura iniciada no login; se falhou, o cache.get abaixo lê a aba normalmente
+            try:
+                valores, revisao = prefetch.result()
+            except Exception as e:
+                print(f"[WARN] Leitura antecipada da base de empenhos falhou: {e}")
+            else:
+                cache.seed(lambda: montar_empenhos(valores, destino_indice), revisao)
+        df = cache.get(lambda: ler_empenhos(ws, destino_indice),
+                       revision_fn=lambda: auth_manager.revisao_planilha(ws.spreadsheet))
+        atualizado = f"dados de {cache.updated_at:%H:%M}"
+        if cache.refreshing:
+            atualizado += " · atualizando..."
+        elif cache.last_error:
+            atualizado += " · ⚠️ falha na última atualização, exibindo a versão anterior"
         
         # Debug: mostrar informações sobre os dados carregados
         if df.empty:
             st.warning(f"⚠️ A planilha do Google Sheets está vazia. Total de linhas: {len(ws.get_all_values())}")
         else:
-            st.info(f"✅ Dados carregados: {len(df)} registros, {len(df.columns)} colunas")
+            st.info(f"✅ Dados carregados: {len(df)} registros, {len(df.columns)} colunas · 🕒 {atualizado}")
             
             # Debug detalhado: mostrar uma amostra dos dados
             with st.expander("🔍 Debug: Ver dados brutos do Google Sheets"):
@@ -299,85 +383,65 @@ def carregar_empenhos():
 
 
 
-def format_currency(val):
-    try:
-        val_str = str(val).strip()
-        
-        # Se já tem R$, retorna como está
-        if val_str.startswith("R$"):
-            return val_str
-        
-        # Se está vazio
-        if not val_str or val_str == "":
-            return "R$ 0,00"
-        
-        # Converter para float e formatar no padrão brasileiro
-        if isinstance(val, (int, float)):
-            val_float = float(val)
-        else:
-            # Tentar converter string para float
-            # Remover possíveis formatações
-            val_clean = val_str.replace(" ", "").replace("R$", "")
-            
-            # Se tem vírgula E ponto, é formato brasileiro (1.234,56)
-            if "," in val_clean and "." in val_clean:
-                val_clean = val_clean.replace(".", "").replace(",", ".")
-            # Se tem apenas vírgula, é formato brasileiro sem milhar (123,45)
-            elif "," in val_clean:
-                val_clean = val_clean.replace(",", ".")
-            
-            val_float = float(val_clean)
-        
-        # Formatar no padrão brasileiro com 2 casas decimais
-        return f"R$ {val_float:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    except:
-        return str(val)
-
-
-
+def fila_escrita():
+    """Fila de edições (observações e links de anexo) desta sessão."""
+    if "fila_escrita" not in st.session_state:
+        st.session_state.fila_escrita = write_queue.WriteQueue()
+    return st.session_state.fila_escrita
 
-    
 def salvar_observacao(empenho, key):
+    # Só enfileira: a gravação sai em lote (gravar_fila), após alguns segundos sem edições ou no botão "Salvar"
     novo_texto = st.session_state[key]
-    ws = conectar_sheets()
-    registros = get_worksheet_data(ws)
 
-    if not registros:
-        return
+    # Adicionar timestamp à observação
+    timestamp = pd.Timestamp.now().strftime("%d/%m/%Y %H:%M")
+    texto_com_timestamp = f"{novo_texto}\n[Atualizado em: {timestamp}]" if novo_texto.strip() else ""
+    fila_escrita().add(empenho, write_queue.CAMPO_OBSERVACAO, texto_com_timestamp)
 
-    # Detectar colunas dinamicamente
-    cabecalho = list(registros[0].keys())
-    
-    # Achar índice da coluna de Empenho (base 1)
-    col_empenho_idx = next((i for i, c in enumerate(cabecalho) if "empenho" in c.lower()), -1)
-    
-    # Achar índice da coluna de Observação (base 1)
-    # Se não achar "Observação" exata, tenta criar ou usar a última?
-    # O data_processor garante que cria "Observação", então deve existir.
-    col_obs_idx = next((i for i, c in enumerate(cabecalho) if "observação" in c.lower() or "observacao" in c.lower()), -1)
-    
-    if col_empenho_idx == -1 or col_obs_idx == -1:
-        st.error("Não foi possível encontrar as colunas necessárias.")
-        return
-    
-    # Procurar linha do empenho
-    for idx, reg in enumerate(registros):
-        if normalize_empenho(reg.get(cabecalho[col_empenho_idx])) == normalize_empenho(empenho):
-            row_number = idx + 2  # +1 para base 1, +1 para pular cabeçalho
-            # col_letter_obs = chr(65 + col_obs_idx)  # Converter índice para letra (A, B, C...) # Not used
-            
-            # Adicionar timestamp à observação
-            timestamp = pd.Timestamp.now().strftime("%d/%m/%Y %H:%M")
-            texto_com_timestamp = f"{novo_texto}\n[Atualizado em: {timestamp}]" if novo_texto.strip() else ""
-            
-            ws.update_cell(row_number, col_obs_idx + 1, texto_com_timestamp)
-            st.success(f"Observação salva para empenho {empenho}!")
-            time.sleep(1)
-            st.cache_data.clear() # Limpar cache para forçar recarregamento do Google Sheets
-            st.rerun()
-            return
-    
-    st.error(f"Empenho {empenho} não encontrado.")
+def gravar_fila():
+    """
+    Grava todas as edições pendentes da sessão numa única chamada batch_update.
+    Retorna True se não sobrou nada pendente.
+    """
+    fila = fila_escrita()
+    if not len(fila):
+        return True
+    ws = conectar_sheets()
+    if not ws:
+        return False
+    # Revisão antes de gravar: se já não é a da base em memória, a planilha mudou por fora
+    revisao_antes = auth_manager.revisao_planilha()
+    try:
+        resumo, indice = fila.flush(ws, indice_emp_controle(ws))
+    except Exception as e:
+        fila.fail(str(e))
+        st.error(f"Erro ao salvar as alterações no Google Sheets: {e}")
+        return False
+    guardar_indice(indice)
+    for empenho in resumo["nao_encontrados"]:
+        st.error(f"Empenho {empenho} não encontrado.")
+    for coluna in resumo["colunas_ausentes"]:
+        st.error(f"Coluna '{coluna}' não encontrada na aba emp_controle; a alteração não foi salva.")
+    # Corrige só as células gravadas na base em memória (sem baixar a planilha de novo), numa cópia só
+    cache_empenhos().patch_many(resumo["alteracoes"])
+    if resumo["alteracoes"]:
+        cache_empenhos().mark_revision(auth_manager.revisao_planilha(), before=revisao_antes)
+    return not len(fila)
+
+@st.fragment(run_every=write_queue.DEBOUNCE_SECONDS)
+def painel_fila_escrita():
+    """Estado das edições pendentes; grava sozinho quando o usuário para de editar."""
+    fila = fila_escrita()
+    col_info, col_botao = st.columns([5, 1])
+    if col_botao.button("💾 Salvar", disabled=not len(fila), use_container_width=True) or fila.due():
+        gravados = len(fila)
+        if gravar_fila():
+            st.toast(f"{gravados} alteração(ões) salva(s) no Google Sheets.")
+            st.rerun() # Atualiza o estado de cada linha e os dados da tabela
+    if len(fila):
+        col_info.caption(f"⏳ {len(fila)} alteração(ões) pendente(s): serão salvas automaticamente em alguns segundos.")
+    elif fila.saved:
+        col_info.caption(f"✅ Todas as alterações salvas (última às {max(fila.saved.values())}).")
 
 
 def extrair_id_drive(url):
@@ -392,49 +456,9 @@ def extrair_id_drive(url):
     return None
 
 def salvar_link_anexo(empenho, link):
-    ws = conectar_sheets()
-    if not ws:
-        return False
-    try:
-        registros = get_worksheet_data(ws)
-    except Exception as e:
-        st.error(f"Erro ao ler registros para salvar anexo: {e}")
-        return False
-
-    if not registros:
-        return False
-
-    cabecalho = list(registros[0].keys())
-    col_empenho_idx = next((i for i, c in enumerate(cabecalho) if "empenho" in c.lower()), -1)
-    col_anexo_idx = next((i for i, c in enumerate(cabecalho) if "anexo" in c.lower()), -1)
-    
-    if col_empenho_idx == -1:
-        st.error("Não foi possível encontrar a coluna de Empenho.")
-        return False
-        
-    if col_anexo_idx == -1:
-        # Se não existe a coluna "Anexo", vamos adicioná-la no final do cabeçalho da planilha
-        try:
-            ws.update_cell(1, len(cabecalho) + 1, "Anexo")
-            col_anexo_idx = len(cabecalho)
-        except Exception as e:
-            st.error(f"Erro ao criar coluna 'Anexo': {e}")
-            return False
-
-    # Procurar linha do empenho
-    for idx, reg in enumerate(registros):
-        if normalize_empenho(reg.get(cabecalho[col_empenho_idx])) == normalize_empenho(empenho):
-            row_number = idx + 2  # +1 para base 1, +1 para pular cabeçalho
-            try:
-                ws.update_cell(row_number, col_anexo_idx + 1, link)
-                st.cache_data.clear() # Limpar cache
-                return True
-            except Exception as e:
-                st.error(f"Erro ao salvar link do anexo no Sheets: {e}")
-                return False
-    
-    st.error(f"Empenho {empenho} não encontrado para salvar anexo.")
-    return False
+    # Vai pela fila e é gravado na hora (junto com as observações pendentes), numa única chamada
+    fila_escrita().add(empenho, write_queue.CAMPO_ANEXO, link)
+    return gravar_fila()
 
 def salvar_anexo_process(empenho, uploaded_file):
     if uploaded_file is None:
@@ -461,7 +485,6 @@ def salvar_anexo_process(empenho, uploaded_file):
     if salvar_link_anexo(empenho, link_anexo):
         st.success(f"Documento anexado com sucesso para o empenho {empenho}!")
         time.sleep(1)
-        st.cache_data.clear()
         st.rerun()
 
 def deletar_anexo_process(empenho, url):
@@ -474,7 +497,6 @@ def deletar_anexo_process(empenho, url):
     if salvar_link_anexo(empenho, ""):
         st.success(f"Anexo removido do empenho {empenho}!")
         time.sleep(1)
-        st.cache_data.clear()
         st.rerun()
 
 
@@ -492,166 +514,158 @@ if modo == "Organizador de Planilhas":
     st.markdown("O arquivo é o analitico de empenho no formato .xlsx com ponto e virgula de separação e virgula de centavos. De empenhos a pagar")
     uploaded_file = st.file_uploader("Carregue a planilha (Excel ou CSV)", type=["xlsx", "xls", "csv"])
 
-    if uploaded_file and st.button("Processar e Salvar"):
-        df_result, erro = data_processor.organize_sheet(uploaded_file)
+    if uploaded_file and st.button("Processar e pré-visualizar"):
+        st.session_state.pop("upload_pendente", None)
+        leitor_excel = auth_manager.obter_configuracao("LEITOR_EXCEL", sheet_readers.DEFAULT_EXCEL_READER)
+        timer = pipeline_timer.PipelineTimer()
+        df_result, erro = upload_cache.organize_sheet_cached(uploaded_file, engine=leitor_excel, timer=timer)
 
-        if erro:
-            st.error(erro)
-        else:
+        if not erro:
             ws = conectar_sheets()
             
-            # --- Lógica de Merge Inteligente com Exclusão de Zerados ---
+            # --- Simulação do Merge Inteligente (nada é gravado antes da confirmação) ---
             try:
                 # 1. Carregar dados existentes
-                existing_data = get_worksheet_data(ws)
-                df_existing = pd.DataFrame(existing_data)
-                
-                # Identificar colunas chaves no novo arquivo
-                col_emp_new = next((c for c in df_result.columns if "empenho" in c.lower()), None)
-                col_saldo_new = next((c for c in df_result.columns if any(x in c.lower() for x in ["saldo", "valor", "pagar"])), None)
-                
-                if not col_emp_new or not col_saldo_new:
-                    st.error("Erro: Não foi possível identificar as colunas 'Empenho' ou 'Saldo' no arquivo enviado.")
+                with timer.stage("carregar planilha do Sheets") as etapa:
+                    existing_data = get_worksheet_data(ws)
+                    df_existing = pd.DataFrame(existing_data)
+                    etapa["linhas"] = len(df_existing)
+
+                # 2. Mesclar upload e base (regras em merge_engine.merge_upload) e medir as diferenças
+                with timer.stage("pré-visualização do merge", rows=len(df_result) + len(df_existing)):
+                    df_final, resumo, diferencas = merge_engine.preview_merge(df_result, df_existing)
+
+                st.session_state.upload_pendente = {
+                    "arquivo": uploaded_file.name,
+                    "tamanho_bytes": uploaded_file.size,
+                    "df_result": df_result,
+                    "df_existing": df_existing,
+                    "df_final": df_final,
+                    "resumo": resumo,
+                    "diferencas": diferencas,
+                    "timer": timer,
+                }
+            except ValueError as e:
+                erro = str(e)
+            except Exception as e:
+                erro = f"Erro ao processar atualização inteligente: {e}"
+
+        if erro:
+            st.error(erro)
+            timer.append_log(arquivo=uploaded_file.name, tamanho_bytes=uploaded_file.size,
+                             usuario=st.session_state.get("usuario"), erro=erro)
+
+    pendente = st.session_state.get("upload_pendente")
+    if pendente and (not uploaded_file or uploaded_file.name != pendente["arquivo"]):
+        # Trocou ou removeu o arquivo: a pré-visualização antiga não vale mais
+        st.session_state.pop("upload_pendente", None)
+        pendente = None
+
+    if pendente:
+        df_result = pendente["df_result"]
+        resumo = pendente["resumo"]
+        diferencas = pendente["diferencas"]
+        timer = pendente["timer"]
+
+        leitura = df_result.attrs.get("leitura")
+        if leitura:
+            st.caption(f"📄 {sheet_readers.describe_dialect(leitura)}")
+        if df_result.attrs.get("cache_upload"):
+            st.caption("♻️ Este arquivo já tinha sido processado hoje: resultado reaproveitado do cache, sem nova leitura.")
+
+        st.subheader("🔎 Pré-visualização da atualização")
+        if resumo["base_vazia"]:
+            st.info("A planilha do Google Sheets está vazia: todos os empenhos ativos do arquivo serão gravados.")
+        m1, m2, m3, m4, m5 = st.columns(5)
+        m1.metric("Novos", resumo["novos"])
+        m2.metric("Atualizados", resumo["atualizados"], help=f"{resumo['com_alteracao']} com saldo ou status diferente")
+        m3.metric("Preservados", resumo["preservados"], help="Estão na planilha, mas não vieram no arquivo")
+        m4.metric("Removidos (zerados)", resumo["removidos"])
+        m5.metric("Zerados no arquivo", resumo["zerados_descartados"], help="Descartados, não serão gravados")
+
+        saldo_deptos = diferencas["saldo_por_departamento"]
+        if not saldo_deptos.empty:
+            st.markdown("**Variação do saldo por departamento**")
+            st.dataframe(saldo_deptos.apply(numeric_parser.format_brl).reset_index(), hide_index=True, use_container_width=True)
+
+        amostra = diferencas["amostra"].copy()
+        if not amostra.empty:
+            st.markdown(f"**Amostra dos empenhos novos ou alterados** (até {len(amostra)})")
+            saldo_anterior = numeric_parser.format_brl(amostra["Saldo anterior"])
+            amostra["Saldo anterior"] = saldo_anterior.mask(amostra["Situação"] == "novo", "-")
+            amostra["Saldo novo"] = numeric_parser.format_brl(amostra["Saldo novo"])
+            st.dataframe(amostra, hide_index=True, use_container_width=True)
+
+        col_confirmar, col_cancelar = st.columns(2)
+        confirmar = col_confirmar.button("✅ Confirmar e salvar no Google Sheets", type="primary")
+        if col_cancelar.button("Cancelar"):
+            st.session_state.pop("upload_pendente", None)
+            st.rerun()
+
+        if confirmar:
+            st.session_state.pop("upload_pendente", None)
+            ws = conectar_sheets()
+            erro = None
+            df_final = pendente["df_final"]
+
+            # --- Gravação do Merge Inteligente com Exclusão de Zerados ---
+            try:
+                # A base mudou desde a pré-visualização (ex.: observação editada)? Refaz a mesclagem.
+                with timer.stage("conferir planilha do Sheets") as etapa:
+                    df_existing = pd.DataFrame(get_worksheet_data(ws))
+                    etapa["linhas"] = len(df_existing)
+                if not df_existing.equals(pendente["df_existing"]):
+                    st.warning("A planilha do Google Sheets mudou desde a pré-visualização: a mesclagem foi refeita com os dados atuais.")
+                    with timer.stage("merge com a planilha existente", rows=len(df_result) + len(df_existing)):
+                        df_final, resumo = merge_engine.merge_upload(df_result, df_existing)
+
+                if resumo["base_vazia"]:
+                    # Se vazio, apenas salva os ativos (que não estão zerados)
+                    with timer.stage("gravação no Sheets", rows=len(df_final)):
+                        escrita = gravar_emp_controle(ws, df_final)
+                    st.caption(sheets_writer.describe_write(escrita))
+                    st.success("Planilha salva no Google Sheets com sucesso! (Base estava vazia, registros zerados foram descartados)")
                 else:
-                    # Função robusta para identificar valores zerados
-                    def is_zero_value(val):
-                        if pd.isna(val):
-                            return True
-                        if isinstance(val, (int, float)):
-                            return abs(val) < 0.01
-                        val_str = str(val).strip().replace("R$", "").replace(" ", "")
-                        if not val_str or val_str == "0" or val_str == "0,00" or val_str == "0.00" or val_str == "":
-                            return True
-                        try:
-                            if "," in val_str and "." in val_str:
-                                val_str = val_str.replace(".", "").replace(",", ".")
-                            elif "," in val_str:
-                                val_str = val_str.replace(",", ".")
-                            return abs(float(val_str)) < 0.01
-                        except:
-                            return False
-
-                    # Separar empenhos ativos e empenhos zerados do novo upload
-                    mask_zero = df_result[col_saldo_new].apply(is_zero_value)
-                    df_result_active = df_result[~mask_zero].copy()
-                    df_result_zero = df_result[mask_zero].copy()
-                    
-                    # Guardar códigos de empenhos zerados do upload para excluir da planilha
-                    empenhos_a_excluir = set(normalize_empenho(emp) for emp in df_result_zero[col_emp_new].tolist())
+                    # Debug e salvar no Google Sheets
+                    st.info(f"📤 Salvando no Google Sheets: {len(df_final)} registros, {len(df_final.columns)} colunas")
                     
-                    # PREVENÇÃO CRÍTICA DE ERROS JSON (NaN, NaT, Infinity)
-                    df_result_active.columns = [str(c) if pd.notna(c) else f"Coluna_Sem_Nome_{i}" for i, c in enumerate(df_result_active.columns)]
-                    df_result_active = df_result_active.fillna("")
-                    import numpy as np
-                    df_result_active = df_result_active.replace([np.inf, -np.inf], "")
-
-                    if df_existing.empty:
-                        # Se vazio, apenas salva os ativos (que não estão zerados)
-                        ws.update([df_result_active.columns.values.tolist()] + df_result_active.values.tolist())
-                        st.success("Planilha salva no Google Sheets com sucesso! (Base estava vazia, registros zerados foram descartados)")
-                        df_final = df_result_active
-                    else:
-                        # 2. Identificar coluna de Empenho, Observação e Saldo na base existente
-                        col_emp_exist = next((c for c in df_existing.columns if "empenho" in c.lower()), None)
-                        col_obs_exist = next((c for c in df_existing.columns if "observação" in c.lower() or "observacao" in c.lower()), None)
-                        col_saldo_exist = next((c for c in df_existing.columns if any(x in c.lower() for x in ["saldo", "valor", "pagar"])), None)
-                        col_obs_new = "Observação" # data_processor garante essa coluna
-
-                        if not col_emp_exist:
-                            st.error("Erro: Não foi possível identificar a coluna 'Empenho' na planilha do Google Sheets.")
-                        else:
-                            # 3. Converter base existente para dicionário
-                            existing_dict = {normalize_empenho(row[col_emp_exist]): row for _, row in df_existing.iterrows()}
-                            
-                            # Lista final combinada
-                            final_rows = []
-                            processed_empenhos = set()
-
-                            # 4. Iterar sobre o df de ativos
-                            for _, row_new in df_result_active.iterrows():
-                                emp_val = normalize_empenho(row_new[col_emp_new])
-                                processed_empenhos.add(emp_val)
-                                
-                                if emp_val in existing_dict:
-                                    # JÁ EXISTE E ATIVO: Atualiza dados, mas PRESERVA observação antiga e anexo
-                                    row_merged = row_new.to_dict()
-                                    old_obs = existing_dict[emp_val].get(col_obs_exist, "")
-                                    if old_obs:
-                                        row_merged[col_obs_new] = old_obs
-                                    
-                                    col_anexo_exist = next((c for c in df_existing.columns if "anexo" in c.lower()), None)
-                                    col_anexo_new = "Anexo"
-                                    if col_anexo_exist:
-                                        old_anexo = existing_dict[emp_val].get(col_anexo_exist, "")
-                                        if old_anexo:
-                                            row_merged[col_anexo_new] = old_anexo
-                                    final_rows.append(row_merged)
-                                else:
-                                    # NOVO E ATIVO: Adiciona como está
-                                    final_rows.append(row_new.to_dict())
-                            
-                            # 5. E os que estavam na planilha antiga mas NÃO no upload?
-                            # Preservamos contanto que:
-                            # - Não tenham sido atualizados por um ativo (processed_empenhos)
-                            # - Não estejam nos empenhos zerados do novo upload (empenhos_a_excluir)
-                            # - E não tenham saldo zerado na planilha antiga
-                            for emp_val, row_old in existing_dict.items():
-                                emp_val_clean = normalize_empenho(emp_val)
-                                if emp_val_clean not in processed_empenhos and emp_val_clean not in empenhos_a_excluir:
-                                    # Se a coluna de saldo existir na base antiga, remove se estiver zerado
-                                    if col_saldo_exist:
-                                        saldo_old = row_old.get(col_saldo_exist, "")
-                                        if is_zero_value(saldo_old):
-                                            continue  # Ignora/exclui
-                                    final_rows.append(row_old)
-
-                            # 6. Salvar de volta
-                            df_final = pd.DataFrame(final_rows)
-                            df_final = df_final.fillna("")
-                            df_final = df_final.replace([np.inf, -np.inf], "")
-                            
-                            # Ajustar colunas
-                            cols_order = df_result_active.columns.tolist()
-                            for c in df_final.columns:
-                                if c not in cols_order:
-                                    cols_order.append(c)
-                            df_final = df_final[cols_order]
-
-                            # Debug e salvar no Google Sheets
-                            st.info(f"📤 Salvando no Google Sheets: {len(df_final)} registros, {len(df_final.columns)} colunas")
-                            
-                            with st.expander("🔍 Debug: Valores antes de salvar no Google Sheets"):
-                                for col in df_final.columns:
-                                    if any(palavra in col.lower() for palavra in ['saldo', 'valor', 'pagar']):
-                                        st.write(f"**{col}** (primeiros 3 valores):")
-                                        st.write(df_final[col].head(3).tolist())
-                                        st.write(f"Tipo de dados: {df_final[col].dtype}")
-
-                            ws.clear()
-                            ws.update([df_final.columns.values.tolist()] + df_final.values.tolist())
-                            st.cache_data.clear() # Limpar o cache para refletir a nova planilha no acompanhamento
-                            st.success(f"Planilha atualizada com sucesso! Observações preservadas e empenhos zerados foram excluídos.")
+                    with st.expander("🔍 Debug: Valores antes de salvar no Google Sheets"):
+                        for col in df_final.columns:
+                            if any(palavra in col.lower() for palavra in ['saldo', 'valor', 'pagar']):
+                                st.write(f"**{col}** (primeiros 3 valores):")
+                                st.write(df_final[col].head(3).tolist())
+                                st.write(f"Tipo de dados: {df_final[col].dtype}")
+
+                    # Só as células que mudaram (sem ws.clear(): a planilha nunca fica vazia)
+                    with timer.stage("gravação no Sheets", rows=len(df_final)):
+                        escrita = gravar_emp_controle(ws, df_final)
+                    st.caption(sheets_writer.describe_write(escrita))
+                    st.success(f"Planilha atualizada com sucesso! Observações preservadas e empenhos zerados foram excluídos.")
+            except ValueError as e:
+                erro = str(e)
+                st.error(erro)
             except Exception as e:
-                st.error(f"Erro ao processar atualização inteligente: {e}")
+                erro = f"Erro ao processar atualização inteligente: {e}"
+                st.error(erro)
             
             # --- Fim Lógica Merge ---
             
-            # Converter para Excel (usando o df_result ou df_final? O usuário baixa o que acabou de processar ou o consolidado?)
-            # Geralmente quer baixar o que resultou do processamento. Vamos baixar o df_final consolidado se existir, senão o result.
-            df_to_download = df_final if 'df_final' in locals() else df_result
+            # Baixa a planilha consolidada (a mesma que foi gravada no Google Sheets)
+            df_to_download = df_final
             
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df_to_download.to_excel(writer, index=False, sheet_name='Organizada')
+            with timer.stage("exportação Excel", rows=len(df_to_download)):
+                output = io.BytesIO()
+                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+                    df_to_download.to_excel(writer, index=False, sheet_name='Organizada')
                 
-                # Ajuste simples de largura
-                worksheet = writer.sheets['Organizada']
-                for i, col in enumerate(df_result.columns):
-                    # Tenta estimar largura
-                    width = max(len(str(col)) + 5, 15)
-                    worksheet.set_column(i, i, width)
+                    # Ajuste simples de largura
+                    worksheet = writer.sheets['Organizada']
+                    for i, col in enumerate(df_result.columns):
+                        # Tenta estimar largura
+                        width = max(len(str(col)) + 5, 15)
+                        worksheet.set_column(i, i, width)
                     
-            output.seek(0)
+                output.seek(0)
             
             st.download_button(
                 label="⬇️ Baixar Planilha Organizada",
@@ -660,6 +674,15 @@ if modo == "Organizador de Planilhas":
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
 
+            # Tempo de cada etapa (processamento + gravação): na tela e no log local (logs/upload_timings.jsonl)
+            with st.expander(f"⏱️ Tempo de processamento: {timer.total_seconds():.2f} s"):
+                st.dataframe(timer.as_frame(), hide_index=True, use_container_width=True)
+            timer.append_log(arquivo=pendente["arquivo"], tamanho_bytes=pendente["tamanho_bytes"],
+                             usuario=st.session_state.get("usuario"), erro=erro)
+        else:
+            with st.expander(f"⏱️ Tempo de processamento: {timer.total_seconds():.2f} s"):
+                st.dataframe(timer.as_frame(), hide_index=True, use_container_width=True)
+
 if modo == "Gerenciar Usuários" and st.session_state.perfil == "Administrador":
     st.title("👤 Cadastro de Usuários")
     st.markdown("Crie novos usuários para o sistema.")
@@ -736,26 +759,51 @@ if modo == "Gerenciar Usuários" and st.session_state.perfil == "Administrador":
 if modo == "Configurações" and st.session_state.perfil == "Administrador":
     st.title("⚙️ Configurações do Sistema")
     st.markdown("Gerencie as configurações globais de integração.")
+    st.caption(f"🗄️ {storage.describe_backend(st.secrets)}")
     
     # Obter o ID da pasta padrão pré-configurado ou o ID enviado pelo usuário
     pasta_atual = auth_manager.obter_configuracao("DRIVE_FOLDER_ID", "1qLk6PQXHtr987d6csDrQD5U2YmE74zp3")
+    leitor_atual = auth_manager.obter_configuracao("LEITOR_EXCEL", sheet_readers.DEFAULT_EXCEL_READER)
     
     with st.form("form_configuracoes"):
         drive_folder_id = st.text_input("ID da Pasta do Google Drive (para Anexos)", value=pasta_atual, placeholder="Cole o ID da pasta do Google Drive")
         st.caption("ℹ️ O ID da pasta do Drive é o código que aparece no final da URL ao abrir a pasta no navegador (ex: 1qLk6PQXHtr987d6csDrQD5U2YmE74zp3)")
         
+        leitores_excel = [nome for nome in sheet_readers.READERS if nome != "csv"]
+        leitor_excel = st.selectbox(
+            "Leitor de planilhas Excel (Organizador de Planilhas)",
+            leitores_excel,
+            index=leitores_excel.index(leitor_atual) if leitor_atual in leitores_excel else 0,
+        )
+        if not sheet_readers.reader_available(leitor_excel):
+            st.caption(f"⚠️ O leitor '{leitor_excel}' não está instalado neste servidor; o upload usará o openpyxl.")
+        st.caption("ℹ️ Para escolher o mais rápido, rode `python benchmarks/bench_readers.py` e compare os tempos.")
+        
         submitted_config = st.form_submit_button("Salvar Configurações")
         
         if submitted_config:
             # Limpar espaços e possíveis parâmetros de query (?hl=...)
             clean_id = drive_folder_id.split('?')[0].strip() if drive_folder_id else ""
             if clean_id:
-                if auth_manager.salvar_configuracao("DRIVE_FOLDER_ID", clean_id):
+                if auth_manager.salvar_configuracao("DRIVE_FOLDER_ID", clean_id) and auth_manager.salvar_configuracao("LEITOR_EXCEL", leitor_excel):
                     st.success("Configurações salvas com sucesso no Google Sheets!")
                 else:
                     st.error("Erro ao salvar configurações no Google Sheets.")
             else:
                 st.warning("O ID da pasta do Drive não pode ser vazio.")
+
+    # Uso da API do Google desde que o servidor subiu (todas as sessões)
+    with st.expander("📊 Uso da API do Google (Sheets/Drive)"):
+        st.caption(
+            f"Limites aplicados: {sheets_client.SHEETS_READS_PER_MINUTE} leituras e {sheets_client.SHEETS_WRITES_PER_MINUTE} "
+            f"escritas por minuto no Sheets, {sheets_client.DRIVE_REQUESTS_PER_MINUTE} chamadas por minuto no Drive. "
+            "\"limitadas\" esperaram a cota; \"repetidas\" receberam 429/5xx e foram tentadas de novo "
+            "(inclusões de linhas, criação de abas e uploads só são repetidos em 429)."
+        )
+        st.dataframe(sheets_client.CLIENT.stats(), use_container_width=True)
+        if st.button("Zerar contadores"):
+            sheets_client.CLIENT.reset_stats()
+            st.rerun()
                 
     st.stop()
 
@@ -794,7 +842,7 @@ if st.session_state.usuario: # Só mostra se estiver logado
     
     # Botão para recarregar dados limpando cache
     if st.sidebar.button("🔄 Atualizar Dados", use_container_width=True):
-        st.cache_data.clear()
+        cache_empenhos().invalidate()
         st.rerun()
         
     st.sidebar.markdown("### 🔍 Filtros")
@@ -909,7 +957,8 @@ if st.session_state.usuario: # Só mostra se estiver logado
         else:
             return 200
     
-    df["_prioridade"] = df[col_status].apply(get_priority) if col_status else 999
+    # astype(object): em coluna "category" o apply devolveria outra "category", que ordena pela ordem das categorias
+    df["_prioridade"] = df[col_status].astype(object).apply(get_priority) if col_status else 999
     
     # Ordenar: primeiro por prioridade, depois por número de empenho
     if col_empenho and "_prioridade" in df.columns:
@@ -935,22 +984,9 @@ if st.session_state.usuario: # Só mostra se estiver logado
     
     # Calcular valores totais (se houver coluna de saldo)
     if col_saldo:
-        def extract_value(val):
-            """Extrai valor numérico de string formatada ou número"""
-            if pd.isna(val):
-                return 0
-            if isinstance(val, (int, float)):
-                return float(val)
-            # Se é string, tentar converter
-            try:
-                val_str = str(val).replace("R$", "").replace(".", "").replace(",", ".").strip()
-                return float(val_str)
-            except:
-                return 0
-        
-        valor_vencidos = vencidos[col_saldo].apply(extract_value).sum() if len(vencidos) > 0 else 0
-        valor_a_vencer = a_vencer[col_saldo].apply(extract_value).sum() if len(a_vencer) > 0 else 0
-        valor_no_prazo = no_prazo[col_saldo].apply(extract_value).sum() if len(no_prazo) > 0 else 0
+        valor_vencidos = numeric_parser.to_float_or_zero(vencidos[col_saldo]).sum() if len(vencidos) > 0 else 0
+        valor_a_vencer = numeric_parser.to_float_or_zero(a_vencer[col_saldo]).sum() if len(a_vencer) > 0 else 0
+        valor_no_prazo = numeric_parser.to_float_or_zero(no_prazo[col_saldo]).sum() if len(no_prazo) > 0 else 0
     else:
         valor_vencidos = valor_a_vencer = valor_no_prazo = 0
     
@@ -1024,7 +1060,7 @@ if st.session_state.usuario: # Só mostra se estiver logado
             
             # Formatar valores monetários para Excel
             if col_saldo:
-                df_export[col_saldo] = df_export[col_saldo].apply(extract_value)
+                df_export[col_saldo] = numeric_parser.to_float_or_zero(df_export[col_saldo])
             
             # Criar arquivo Excel em memória
             output = io.BytesIO()
@@ -1068,6 +1104,9 @@ if st.session_state.usuario: # Só mostra se estiver logado
         st.warning("Nenhum empenho encontrado com os filtros selecionados.")
         st.stop()
     else:
+        # Observações editadas: gravadas em lote (automaticamente ou no botão "Salvar")
+        painel_fila_escrita()
+
         # Cabeçalho da Tabela
         st.markdown("---")
         # Layout: Emissao(1.0), Empenho(0.7), Cod(0.7), Nome(1.6), Hist(2.5), Valor(0.9), Saldo(0.9), Prazo(0.9), Status(0.9)
@@ -1086,8 +1125,12 @@ if st.session_state.usuario: # Só mostra se estiver logado
         
         st.markdown("---")
 
+        # Formatar valores monetários da página de uma vez (formato brasileiro)
+        valor_fmt = numeric_parser.format_brl(df_display[col_valor]) if col_valor else None
+        saldo_fmt = numeric_parser.format_brl(df_display[col_saldo]) if col_saldo else None
+
         with st.container(height=600):
-            for _, row in df_display.iterrows():
+            for idx, row in df_display.iterrows():
                 empenho_val = row[col_empenho]
                 
                 cols = st.columns(cols_spec)
@@ -1112,12 +1155,10 @@ if st.session_state.usuario: # Só mostra se estiver logado
                 )
                 
                 # 6. Valor Original (Formatado)
-                valor_raw = row.get(col_valor, "-") if col_valor else "-"
-                cols[5].caption(format_currency(valor_raw))
+                cols[5].caption(valor_fmt[idx] if valor_fmt is not None else "-")
                 
                 # 7. Saldo (Formatado)
-                saldo_raw = row.get(col_saldo, "-")
-                cols[6].caption(format_currency(saldo_raw))
+                cols[6].caption(saldo_fmt[idx] if saldo_fmt is not None else "-")
     
                 # 8. Prazo
                 cols[7].caption(str(row.get("Prazo (90 dias)", "-")))
@@ -1152,6 +1193,9 @@ if st.session_state.usuario: # Só mostra se estiver logado
                     placeholder="Clique aqui para digitar uma observação sobre este empenho...",
                     on_change=lambda k=obs_key, e=empenho_val: salvar_observacao(e, k),
                 )
+                estado_edicao = fila_escrita().describe(empenho_val)
+                if estado_edicao:
+                    col_sub2.caption(estado_edicao)
                 
                 # Lógica do Anexo (Upload / Visualização)
                 anexo_val = row.get(col_anexo, "") if col_anexo else ""
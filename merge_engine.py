@@ -0,0 +1,212 @@
+import numpy as np
+import pandas as pd
+
+import data_processor
+import numeric_parser
+
+# Nomes das colunas que o data_processor garante na planilha organizada
+COL_OBS_NEW = "Observação"
+COL_ANEXO_NEW = "Anexo"
+
+def normalize_empenho(val):
+    if pd.isna(val):
+        return ""
+    val_str = str(val).strip()
+    if val_str.endswith(".0"):
+        val_str = val_str[:-2]
+    return val_str
+
+def normalize_empenhos(values):
+    """Versão vetorizada de normalize_empenho para uma Series inteira."""
+    values = pd.Series(values)
+    text = values.astype(object).where(values.notna(), "").astype(str).str.strip()
+    return text.str.replace(r"\.0$", "", regex=True).astype(object)
+
+def _find_column(columns, keywords):
+    return next((c for c in columns if any(k in c.lower() for k in keywords)), None)
+
+def _clean_for_sheets(df):
+    """Troca NaN/NaT/Infinity por "" (o Google Sheets não aceita esses valores no JSON)."""
+    df = data_processor.uncategorize_columns(df)
+    return df.fillna("").replace([np.inf, -np.inf], "")
+
+def merge_upload(df_result, df_existing):
+    """
+    Mesclagem inteligente do upload organizado (df_result) com a base atual do Google Sheets
+    (df_existing), sem Streamlit. Regras:
+    - empenhos zerados do upload são descartados e removidos da base;
+    - empenhos do upload que já existem na base são atualizados, preservando Observação e Anexo;
+    - empenhos da base que não vieram no upload são mantidos, exceto os de saldo zerado.
+    Ordem: linhas ativas do upload (na ordem do arquivo) e depois as linhas preservadas da base.
+    Retorna (df_final, resumo). Levanta ValueError se faltar uma coluna obrigatória.
+    """
+    # Identificar colunas chaves no novo arquivo
+    col_emp_new = _find_column(df_result.columns, ["empenho"])
+    col_saldo_new = _find_column(df_result.columns, ["saldo", "valor", "pagar"])
+    if not col_emp_new or not col_saldo_new:
+        raise ValueError("Erro: Não foi possível identificar as colunas 'Empenho' ou 'Saldo' no arquivo enviado.")
+
+    # Separar empenhos ativos e empenhos zerados do novo upload
+    mask_zero = numeric_parser.is_zero(df_result[col_saldo_new])
+    df_active = df_result[~mask_zero].copy()
+    # Guardar códigos de empenhos zerados do upload para excluir da planilha
+    empenhos_a_excluir = set(normalize_empenhos(df_result.loc[mask_zero, col_emp_new]))
+
+    # PREVENÇÃO CRÍTICA DE ERROS JSON (NaN, NaT, Infinity)
+    df_active.columns = [str(c) if pd.notna(c) else f"Coluna_Sem_Nome_{i}" for i, c in enumerate(df_active.columns)]
+    df_active = _clean_for_sheets(df_active).reset_index(drop=True)
+
+    resumo = {
+        "base_vazia": df_existing.empty,
+        "novos": 0,
+        "atualizados": 0,
+        "preservados": 0,
+        "removidos": 0,
+        "zerados_descartados": int(mask_zero.sum()),
+    }
+
+    if df_existing.empty:
+        # Se vazio, apenas salva os ativos (que não estão zerados)
+        resumo["novos"] = len(df_active)
+        resumo["total"] = len(df_active)
+        return df_active, resumo
+
+    # Identificar coluna de Empenho, Observação, Anexo e Saldo na base existente
+    col_emp_exist = _find_column(df_existing.columns, ["empenho"])
+    col_obs_exist = _find_column(df_existing.columns, ["observação", "observacao"])
+    col_anexo_exist = _find_column(df_existing.columns, ["anexo"])
+    col_saldo_exist = _find_column(df_existing.columns, ["saldo", "valor", "pagar"])
+    if not col_emp_exist:
+        raise ValueError("Erro: Não foi possível identificar a coluna 'Empenho' na planilha do Google Sheets.")
+
+    # Base existente com uma linha por empenho: se o empenho se repete, vale a última linha,
+    # na posição da primeira ocorrência
+    old_keys = normalize_empenhos(df_existing[col_emp_exist])
+    first_order = old_keys.drop_duplicates().to_numpy()
+    last_rows = ~old_keys.duplicated(keep="last").to_numpy()
+    df_old = df_existing[last_rows].set_axis(old_keys[last_rows].to_numpy()).loc[first_order].reset_index(drop=True)
+
+    # Junção externa pela chave normalizada; _merge diz de onde veio cada empenho
+    new_keys = pd.DataFrame({"_chave": normalize_empenhos(df_active[col_emp_new]), "_pos_novo": np.arange(len(df_active))})
+    old_keys = pd.DataFrame({"_chave": first_order, "_pos_antigo": np.arange(len(first_order))})
+    joined = new_keys.merge(old_keys, on="_chave", how="outer", indicator=True)
+
+    # JÁ EXISTE E ATIVO: atualiza os dados, mas PRESERVA observação antiga e anexo
+    both = joined[joined["_merge"] == "both"]
+    pos_new = both["_pos_novo"].to_numpy(dtype=int)
+    pos_old = both["_pos_antigo"].to_numpy(dtype=int)
+    for col_exist, col_new in [(col_obs_exist, COL_OBS_NEW), (col_anexo_exist, COL_ANEXO_NEW)]:
+        if not col_exist:
+            continue
+        old_values = df_old[col_exist].to_numpy(dtype=object)[pos_old]
+        keep_old = pd.notna(old_values) & (old_values.astype(str) != "")
+        if keep_old.any():
+            if col_new not in df_active.columns:
+                df_active[col_new] = ""
+            values = df_active[col_new].to_numpy(dtype=object).copy()
+            values[pos_new[keep_old]] = old_values[keep_old]
+            df_active[col_new] = values
+
+    # E os que estavam na planilha antiga mas NÃO no upload? Preservamos contanto que
+    # não estejam nos empenhos zerados do novo upload e não tenham saldo zerado na planilha antiga
+    only_old = joined[joined["_merge"] == "right_only"]
+    pos_keep = np.sort(only_old["_pos_antigo"].to_numpy(dtype=int))
+    keep = ~pd.Series(first_order[pos_keep], dtype=object).isin(empenhos_a_excluir).to_numpy()
+    if col_saldo_exist:
+        saldo_zerado = numeric_parser.is_zero(df_old[col_saldo_exist]).to_numpy()
+        keep &= ~saldo_zerado[pos_keep]
+    df_preserved = df_old.iloc[pos_keep[keep]]
+
+    # Juntar e ajustar colunas: as do upload primeiro, depois as que só existem na base
+    # (colunas que só existem na base entram apenas se alguma linha da base foi preservada)
+    df_final = pd.concat([df_active, df_preserved], ignore_index=True) if len(df_preserved) else df_active
+    df_final = _clean_for_sheets(df_final)
+    cols_order = df_active.columns.tolist() + [c for c in df_final.columns if c not in df_active.columns]
+    df_final = df_final.reindex(columns=cols_order, fill_value="")
+
+    resumo["novos"] = int((joined["_merge"] == "left_only").sum())
+    resumo["atualizados"] = len(both)
+    resumo["preservados"] = len(df_preserved)
+    resumo["removidos"] = len(pos_keep) - len(df_preserved)
+    resumo["total"] = len(df_final)
+    return df_final, resumo
+
+COL_DEPARTAMENTO = "Departamento (De/Para)"
+
+def _saldo_column(columns):
+    """Coluna do saldo, como a visualização procura (evitando o valorEmpenho)."""
+    col_saldo = _find_column(columns, ["saldo", "pagar"])
+    return col_saldo or next((c for c in columns if "valor" in c.lower() and "empenho" not in c.lower()), None)
+
+def saldo_by_department(df):
+    """Soma do saldo por departamento (Series vazia se faltar alguma das colunas)."""
+    col_saldo = _saldo_column(df.columns)
+    if df.empty or not col_saldo or COL_DEPARTAMENTO not in df.columns:
+        return pd.Series(dtype=float)
+    saldo = numeric_parser.to_float_or_zero(df[col_saldo]).to_numpy()
+    return pd.Series(saldo).groupby(df[COL_DEPARTAMENTO].astype(object).to_numpy()).sum()
+
+def preview_merge(df_result, df_existing, sample_size=20):
+    """
+    Simulação da mesclagem, sem gravar nada: o mesmo merge_upload mais as diferenças
+    em relação à base atual, calculadas de forma vetorizada.
+    Retorna (df_final, resumo, diferencas), onde diferencas tem:
+    - "saldo_por_departamento": saldo antes/depois e variação de cada departamento que mudou;
+    - "amostra": até sample_size empenhos novos ou com saldo/status alterado.
+    resumo ganha "com_alteracao": empenhos atualizados cujo saldo ou status mudou de fato.
+    """
+    df_final, resumo = merge_upload(df_result, df_existing)
+
+    # Saldo por departamento antes (base atual) e depois (planilha final)
+    saldo = pd.DataFrame({
+        "Saldo antes": saldo_by_department(df_existing),
+        "Saldo depois": saldo_by_department(df_final),
+    }).fillna(0.0)
+    saldo["Variação"] = saldo["Saldo depois"] - saldo["Saldo antes"]
+    saldo = saldo[saldo["Variação"].abs() >= 0.01].sort_values("Variação", key=np.abs, ascending=False)
+    saldo.index.name = "Departamento"
+
+    # As primeiras linhas de df_final são as do upload (novos + atualizados)
+    upload_part = df_final.iloc[:resumo["novos"] + resumo["atualizados"]]
+    col_emp = _find_column(df_final.columns, ["empenho"])
+    col_saldo = _saldo_column(df_final.columns)
+    col_status = _find_column(df_final.columns, ["status"])
+    keys = normalize_empenhos(upload_part[col_emp]).to_numpy()
+
+    novo = np.ones(len(upload_part), dtype=bool)
+    saldo_antes = np.full(len(upload_part), np.nan)
+    status_antes = np.full(len(upload_part), "", dtype=object)
+    changed = np.zeros(len(upload_part), dtype=bool)
+    saldo_depois = numeric_parser.to_float_or_zero(upload_part[col_saldo]).to_numpy() if col_saldo else saldo_antes
+    status_depois = upload_part[col_status].astype(str).to_numpy() if col_status else status_antes
+
+    col_emp_exist = _find_column(df_existing.columns, ["empenho"]) if not df_existing.empty else None
+    if col_emp_exist:
+        # Mesma regra do merge: empenho repetido na base vale a última linha
+        # (Index object: o isin do tipo str do pandas é lento com muitos valores)
+        df_old = df_existing.set_axis(pd.Index(normalize_empenhos(df_existing[col_emp_exist]), dtype=object))
+        df_old = df_old[~df_old.index.duplicated(keep="last")]
+        novo = ~pd.Index(keys, dtype=object).isin(df_old.index)
+        col_saldo_exist = _saldo_column(df_old.columns)
+        col_status_exist = _find_column(df_old.columns, ["status"])
+        if col_saldo_exist and col_saldo:
+            saldo_antes = numeric_parser.to_float_or_zero(df_old[col_saldo_exist]).reindex(keys).to_numpy()
+            changed |= ~novo & (np.abs(saldo_depois - np.nan_to_num(saldo_antes)) >= 0.01)
+        if col_status_exist and col_status:
+            status_antes = df_old[col_status_exist].astype(str).reindex(keys).fillna("").to_numpy(dtype=object)
+            changed |= ~novo & (status_antes != status_depois)
+    resumo["com_alteracao"] = int(changed.sum())
+
+    amostra = pd.DataFrame({
+        "Situação": np.where(novo, "novo", "alterado"),
+        "Empenho": keys,
+        "Departamento": upload_part[COL_DEPARTAMENTO].to_numpy() if COL_DEPARTAMENTO in upload_part.columns else "",
+        "Saldo anterior": saldo_antes,
+        "Saldo novo": saldo_depois,
+        "Status anterior": status_antes,
+        "Status novo": status_depois,
+    })
+    # Alterados primeiro (são os que mais interessam conferir), depois os novos
+    amostra = pd.concat([amostra[changed], amostra[novo]]).head(sample_size).reset_index(drop=True)
+
+    return df_final, resumo, {"saldo_por_departamento": saldo, "amostra": amostra}
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+# Remove o prefixo "R$" e qualquer espaço (inclusive o espaço não separável do Sheets)
+_NOISE_PATTERN = r"R\$|[\s\xa0]"
+
+def _as_series(values):
+    if isinstance(values, pd.Series):
+        return values
+    return pd.Series(values, dtype=object)
+
+def parse_br_numbers(values, keep_invalid=False):
+    """
+    Converte uma Series inteira de valores no formato brasileiro para float.
+    Aceita "R$ 1.234,56", "1.234,56", "18500,51", "12.5" e valores que já são números.
+    Vazios viram NaN. Textos que não são números viram NaN, ou são mantidos como
+    estão se keep_invalid=True.
+    """
+    series = _as_series(values)
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype(float)
+
+    text = series.astype(object).where(series.notna(), "").astype(str)
+    text = text.str.replace(_NOISE_PATTERN, "", regex=True)
+
+    # Com vírgula: ponto é separador de milhar e vírgula é o decimal ("1.234,56")
+    has_comma = text.str.contains(",", regex=False)
+    text = text.where(~has_comma, text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+
+    numbers = pd.to_numeric(text, errors="coerce").astype(float)
+    if keep_invalid:
+        invalid = numbers.isna() & series.notna() & (text.str.lower() != "nan")
+        if invalid.any():
+            return numbers.astype(object).mask(invalid, series)
+    return numbers
+
+def parse_br_number(value, default=0.0):
+    """Versão escalar de parse_br_numbers. Retorna default se o valor for vazio ou inválido."""
+    number = parse_br_numbers([value]).iloc[0]
+    return default if pd.isna(number) else float(number)
+
+def to_float_or_zero(values):
+    """Converte a Series para float, trocando vazios e valores inválidos por 0."""
+    return parse_br_numbers(values).fillna(0.0)
+
+def is_zero(values, tolerance=0.01):
+    """
+    Máscara booleana dos valores zerados.
+    Vazios/NaN contam como zero; textos que não são números NÃO contam como zero.
+    """
+    series = _as_series(values)
+    numbers = parse_br_numbers(series)
+    text = series.astype(object).where(series.notna(), "").astype(str).str.replace(_NOISE_PATTERN, "", regex=True)
+    return (numbers.abs() < tolerance).fillna(False) | (text == "") | series.isna()
+
+def format_brl(values):
+    """
+    Formata a Series no padrão de moeda brasileiro ("R$ 1.234,56").
+    Valores que já começam com "R$" são mantidos, vazios viram "R$ 0,00"
+    e textos que não são números são devolvidos como texto.
+    """
+    series = _as_series(values)
+    numbers = parse_br_numbers(series)
+    text = series.astype(object).where(series.notna(), "").astype(str).str.strip()
+
+    valid = numbers.notna() & np.isfinite(numbers.fillna(0.0))
+    formatted = numbers.where(valid, 0.0).map("{:,.2f}".format)
+    formatted = "R$ " + formatted.str.replace(",", "X", regex=False).str.replace(".", ",", regex=False).str.replace("X", ".", regex=False)
+
+    result = text.where(~valid, formatted)
+    result = result.mask(text == "", "R$ 0,00")
+    return result.mask(text.str.startswith("R$"), text)
@@ -0,0 +1,63 @@
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+# Histórico local dos tempos de cada upload (uma linha JSON por upload)
+LOG_PATH = Path("logs") / "upload_timings.jsonl"
+
+class PipelineTimer:
+    """
+    Cronômetro das etapas do upload (leitura, organize_sheet, merge, gravação...).
+    Cada etapa registra o tempo e, opcionalmente, quantas linhas processou:
+
+        timer = PipelineTimer()
+        with timer.stage("merge") as etapa:
+            df_final = ...
+            etapa["linhas"] = len(df_final)
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        record = {"etapa": name, "segundos": 0.0, "linhas": rows}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["segundos"] = time.perf_counter() - start
+            self.stages.append(record)
+
+    def total_seconds(self):
+        return sum(s["segundos"] for s in self.stages)
+
+    def as_frame(self):
+        """Tabela das etapas para exibir no Streamlit."""
+        df = pd.DataFrame(self.stages, columns=["etapa", "segundos", "linhas"])
+        rows = pd.to_numeric(df["linhas"], errors="coerce")
+        seconds = df["segundos"].where(df["segundos"] > 0)
+        return pd.DataFrame({
+            "Etapa": df["etapa"],
+            "Tempo (s)": df["segundos"].round(3),
+            "Linhas": rows.astype("Int64"),
+            "Linhas/s": (rows / seconds).round(0).astype("Int64"),
+        })
+
+    def append_log(self, path=LOG_PATH, **info):
+        """Acrescenta os tempos deste upload ao log JSONL (info: arquivo, usuário...)."""
+        entry = {"data": datetime.now().isoformat(timespec="seconds"), **info,
+                 "total_s": round(self.total_seconds(), 4),
+                 "etapas": [{**s, "segundos": round(s["segundos"], 4)} for s in self.stages]}
+        try:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            # O log é só diagnóstico: falha de disco não pode impedir o upload
+            print(f"[WARN] Não foi possível gravar o log de tempos do upload: {e}")
@@ -0,0 +1,276 @@
+import codecs
+import csv
+import datetime
+import importlib.util
+import pandas as pd
+
+# Ordem de preferência usada desde a primeira versão do leitor de CSV
+CSV_ENCODINGS = ['utf-8', 'iso-8859-1', 'windows-1252']
+CSV_SEPARATORS = [';', ',', '\t']
+
+# Quantos bytes do início do arquivo são lidos para detectar o dialeto
+CSV_SAMPLE_SIZE = 64 * 1024
+
+# Colunas do analítico (0-indexed) usadas pelo organizador: D, F, H, I, J, K, W, AB, AJ
+ANALITICO_COLUMNS = [3, 5, 7, 8, 9, 10, 22, 27, 35]
+COL_EMPENHO = 7
+COL_HISTORICO = 22
+COL_ANO_PEDIDO = 36
+COL_NUMERO_PEDIDO = 37
+# Todas as colunas que precisam ser lidas do arquivo original
+SOURCE_COLUMNS = ANALITICO_COLUMNS + [COL_ANO_PEDIDO, COL_NUMERO_PEDIDO]
+
+# Coluna extra da planilha projetada: texto de todas as células das sub-linhas
+# (linhas sem empenho logo abaixo de um empenho), usado no fallback do pedido.
+ROW_TEXT_COLUMN = "__texto_linha__"
+# O padrão do pedido não casa com "|" (não é letra, espaço nem dígito), então um match
+# nunca atravessa duas células e o primeiro match da string é o da primeira coluna.
+ROW_TEXT_SEP = "|"
+
+# Textos que o pandas trata como vazio por padrão (na_values do read_excel/read_csv)
+_NA_STRINGS = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+}
+
+SEPARATOR_NAMES = {';': 'ponto e vírgula', ',': 'vírgula', '\t': 'tabulação', '|': 'barra vertical'}
+
+def clean_text(series):
+    """Converte uma coluna para texto limpo, tratando vazios e "nan" como ""."""
+    text = series.fillna("").astype(str).str.strip()
+    return text.mask(text == "nan", "")
+
+def source_column(frame, position):
+    """Coluna da planilha projetada que veio da posição `position` do arquivo original (ou None)."""
+    positions = frame.attrs.get("source_positions", [])
+    if position not in positions:
+        return None
+    return frame.iloc[:, positions.index(position)]
+
+def _subline_text(df):
+    """Texto das sub-linhas que vêm logo abaixo de uma linha com empenho ("" nas demais)."""
+    text = pd.Series("", index=df.index, dtype=object)
+    if df.shape[1] <= COL_EMPENHO or df.empty:
+        return text
+    has_empenho = clean_text(df.iloc[:, COL_EMPENHO]) != ""
+    needed = (~has_empenho & has_empenho.shift(1, fill_value=False)).to_numpy()
+    if needed.any():
+        block = df.iloc[needed]
+        cells = [clean_text(block.iloc[:, c]) for c in range(df.shape[1])]
+        text.iloc[needed] = cells[0].str.cat(cells[1:], sep=ROW_TEXT_SEP).to_numpy()
+    return text
+
+def _projected(columns, width, row_text):
+    frame = pd.DataFrame(columns)
+    frame[ROW_TEXT_COLUMN] = row_text
+    frame.attrs["source_width"] = width
+    frame.attrs["source_positions"] = [p for p in SOURCE_COLUMNS if p < width]
+    return frame
+
+def project_frame(df):
+    """
+    Reduz uma planilha completa (todas as colunas) à planilha projetada usada pelo
+    organizador: só as colunas de SOURCE_COLUMNS + o texto das sub-linhas.
+    """
+    width = df.shape[1]
+    positions = [p for p in SOURCE_COLUMNS if p < width]
+    columns = {df.columns[p]: df.iloc[:, p].to_numpy() for p in positions}
+    return _projected(columns, width, _subline_text(df).to_numpy())
+
+# Valor de célula vazia, como o pandas representa
+_MISSING = float("nan")
+
+def _excel_value_to_str(value):
+    """Converte o valor de uma célula como o read_excel(dtype=str) faz (vazio = NaN)."""
+    if value is None:
+        return _MISSING
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (int, float)):
+        as_int = int(value)
+        return str(as_int) if as_int == value else str(value)
+    if isinstance(value, str):
+        return _MISSING if value in _NA_STRINGS else value
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return str(pd.Timestamp(value)) if not isinstance(value, datetime.time) else str(value)
+    return str(value)
+
+def _unique_headers(raw_headers):
+    """Nomes de coluna como o pandas gera: vazios viram "Unnamed: N" e repetidos ganham ".1", ".2"..."""
+    headers, seen = [], {}
+    for i, h in enumerate(raw_headers):
+        name = f"Unnamed: {i}" if h is None else str(h)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        headers.append(name)
+    return headers
+
+def read_excel_projected(file):
+    """
+    Lê o .xlsx em modo read-only do openpyxl, linha a linha, guardando apenas as colunas
+    de SOURCE_COLUMNS e o texto completo das sub-linhas que o fallback do pedido precisa.
+    A memória não cresce com a largura da planilha (o analítico tem 38+ colunas).
+    Retorna (planilha_projetada, dialeto).
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        # A dimensão gravada no arquivo nem sempre está correta (o pandas faz o mesmo)
+        sheet.reset_dimensions()
+
+        rows = sheet.iter_rows(values_only=True)
+        raw_header = next(rows, ())
+        width = len(raw_header)
+        while width and raw_header[width - 1] in (None, ""):
+            width -= 1
+
+        values = {p: [] for p in SOURCE_COLUMNS}
+        row_text = []
+        last_row_with_data = -1
+        previous_has_empenho = False
+        for row_number, row in enumerate(rows):
+            row_width = len(row)
+            while row_width and row[row_width - 1] in (None, ""):
+                row_width -= 1
+            if row_width:
+                last_row_with_data = row_number
+            width = max(width, row_width)
+
+            for p in SOURCE_COLUMNS:
+                values[p].append(_excel_value_to_str(row[p]) if p < row_width else _MISSING)
+
+            empenho = values[COL_EMPENHO][-1]
+            has_empenho = isinstance(empenho, str) and empenho.strip() not in ("", "nan")
+            text = ""
+            if previous_has_empenho and not has_empenho:
+                cells = (_excel_value_to_str(v) for v in row[:row_width])
+                text = ROW_TEXT_SEP.join(c.strip() if isinstance(c, str) and c.strip() != "nan" else "" for c in cells)
+            row_text.append(text)
+            previous_has_empenho = has_empenho
+    finally:
+        workbook.close()
+
+    # Descarta as linhas vazias do final, como o read_excel
+    n_rows = last_row_with_data + 1
+    headers = _unique_headers(list(raw_header[:width]) + [None] * (width - len(raw_header[:width])))
+    columns = {headers[p]: pd.Series(values[p][:n_rows], dtype=object) for p in SOURCE_COLUMNS if p < width}
+    frame = _projected(columns, width, row_text[:n_rows])
+    return frame, {"formato": "xlsx", "leitor": "openpyxl (read-only)"}
+
+def sniff_csv_dialect(file, sample_size=CSV_SAMPLE_SIZE):
+    """
+    Detecta encoding e separador lendo apenas os primeiros KB do arquivo (uma vez).
+    Retorna (encoding, separador). O arquivo volta para a posição 0.
+    """
+    file.seek(0)
+    sample = file.read(sample_size)
+    file.seek(0)
+    if isinstance(sample, str):
+        sample = sample.encode('utf-8')
+
+    # Decodificador incremental: um caractere multibyte cortado no fim da amostra não é erro
+    encoding, text = CSV_ENCODINGS[-1], ""
+    for enc in CSV_ENCODINGS:
+        try:
+            text = codecs.getincrementaldecoder(enc)().decode(sample, final=False)
+            encoding = enc
+            break
+        except UnicodeDecodeError:
+            continue
+
+    # O cabeçalho (primeira linha não vazia) decide o separador, na mesma ordem de antes
+    header = next((line for line in text.splitlines() if line.strip()), "")
+    for separator in CSV_SEPARATORS:
+        if len(next(csv.reader([header], delimiter=separator), [])) > 1:
+            return encoding, separator
+
+    # Nenhum dos separadores conhecidos: deixa o csv.Sniffer tentar
+    try:
+        return encoding, csv.Sniffer().sniff(header or text).delimiter
+    except csv.Error:
+        return encoding, ','
+
+def read_csv_upload(file):
+    """
+    Lê um CSV enviado no upload com uma única passada do parser C do pandas.
+    Retorna (df, dialeto), onde dialeto descreve o encoding e o separador detectados.
+    """
+    encoding, separator = sniff_csv_dialect(file)
+    try:
+        df = pd.read_csv(file, dtype=str, encoding=encoding, sep=separator, engine='c')
+    except UnicodeDecodeError:
+        # Byte inválido depois da amostra: o latin-1 decodifica qualquer byte
+        encoding = 'iso-8859-1'
+        file.seek(0)
+        df = pd.read_csv(file, dtype=str, encoding=encoding, sep=separator, engine='c')
+
+    dialect = {
+        "formato": "csv",
+        "encoding": encoding,
+        "separador": separator,
+    }
+    return df, dialect
+
+def read_excel_calamine(file):
+    """
+    Lê o Excel com o python-calamine (leitor em Rust)
+    e reduz à planilha projetada. Também abre arquivos .xls antigos.
+    """
+    df = pd.read_excel(file, dtype=str, engine='calamine')
+    return project_frame(df), {"formato": "excel", "leitor": "calamine"}
+
+def _read_csv_projected(file):
+    df, dialect = read_csv_upload(file)
+    dialect["leitor"] = "csv"
+    return project_frame(df), dialect
+
+# Leitores disponíveis: nome -> (função, módulo opcional que precisa estar instalado)
+READERS = {
+    "openpyxl": (read_excel_projected, "openpyxl"),
+    "calamine": (read_excel_calamine, "python_calamine"),
+    "csv": (_read_csv_projected, None),
+}
+DEFAULT_EXCEL_READER = "openpyxl"
+
+def reader_available(name):
+    """True se o leitor existe e a dependência opcional dele está instalada."""
+    if name not in READERS:
+        return False
+    module = READERS[name][1]
+    return module is None or importlib.util.find_spec(module) is not None
+
+def available_readers():
+    return [name for name in READERS if reader_available(name)]
+
+def read_upload(file, engine=None):
+    """
+    Lê o arquivo do upload com o leitor escolhido e devolve (planilha_projetada, dialeto).
+    CSV sempre usa o leitor "csv"; para Excel usa `engine` (padrão: openpyxl).
+    Se o leitor pedido não estiver instalado, volta para o openpyxl.
+    """
+    if file.name.lower().endswith('.csv'):
+        engine = "csv"
+    else:
+        engine = engine or DEFAULT_EXCEL_READER
+        if engine == "csv" or not reader_available(engine):
+            fallback_from = engine
+            frame, dialect = READERS[DEFAULT_EXCEL_READER][0](file)
+            dialect["fallback_de"] = fallback_from
+            return frame, dialect
+    return READERS[engine][0](file)
+
+def describe_dialect(dialect):
+    """Texto curto para mostrar ao administrador como o arquivo foi lido."""
+    if not dialect:
+        return ""
+    if dialect.get("formato") == "csv":
+        sep = dialect.get("separador", "")
+        return f"CSV lido com encoding {dialect.get('encoding')} e separador {SEPARATOR_NAMES.get(sep, repr(sep))}"
+    text = f"Arquivo {dialect.get('formato', '')} lido com o leitor {dialect.get('leitor', '')}"
+    if dialect.get("fallback_de"):
+        text += f" (leitor '{dialect['fallback_de']}' indisponível)"
+    return text
@@ -0,0 +1,242 @@
+import random
+import threading
+import time
+
+import pandas as pd
+
+# Cotas da API do Google Sheets por usuário (a service account é um usuário só): 60 leituras
+# e 60 escritas por minuto. O Drive permite bem mais; o limite aqui só evita rajadas.
+SHEETS_READS_PER_MINUTE = 60
+SHEETS_WRITES_PER_MINUTE = 60
+DRIVE_REQUESTS_PER_MINUTE = 600
+
+# Erros da API que valem nova tentativa (cota excedida e falhas temporárias do Google)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Chamadas que não podem ser repetidas com segurança (acrescentar/apagar linhas, criar aba ou arquivo,
+# trocas de abas): um 5xx não garante que a operação falhou, e repetir pode duplicar ou apagar a mais.
+# Só o 429 é repetido, porque o Google recusa a chamada antes de executá-la.
+RETRY_STATUS_UNSAFE = {429}
+MAX_RETRIES = 5
+MAX_BACKOFF_SECONDS = 32
+
+LEITURA = "leitura"
+ESCRITA = "escrita"
+DRIVE = "drive"
+
+def _status_code(error):
+    """Código HTTP de um erro do gspread (APIError.code) ou do googleapiclient (HttpError.resp.status)."""
+    code = getattr(error, "code", None)
+    if code is None and getattr(error, "resp", None) is not None:
+        code = getattr(error.resp, "status", None)
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+def _retryable(error, retry_status=RETRY_STATUS):
+    return _status_code(error) in retry_status
+
+def _call_with_retry(func, args, kwargs, max_retries, retry_status=RETRY_STATUS, before_attempt=None, on_retry=None, on_error=None):
+    """func(*args, **kwargs) com nova tentativa nos erros de retry_status, esperando 1, 2, 4... s (+ até 1 s aleatório)."""
+    for attempt in range(max_retries + 1):
+        if before_attempt:
+            before_attempt()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if not _retryable(e, retry_status) or attempt == max_retries:
+                if on_error:
+                    on_error()
+                raise
+            if on_retry:
+                on_retry()
+            time.sleep(min(2 ** attempt, MAX_BACKOFF_SECONDS) + random.random())
+
+class TokenBucket:
+    """Limitador de taxa: até `capacity` chamadas de uma vez, repostas a `per_minute` por minuto."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Reserva uma chamada; espera se o balde está vazio. Retorna os segundos esperados."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # O saldo pode ficar negativo: quem chega depois espera a sua vez na fila
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+class QuotaClient:
+    """
+    Ponto único das chamadas ao Sheets e ao Drive: respeita as cotas (token bucket por tipo
+    de chamada), repete erros 429/5xx com espera exponencial + aleatória e conta tudo
+    para a página de configurações.
+    """
+
+    def __init__(self, reads_per_minute=SHEETS_READS_PER_MINUTE, writes_per_minute=SHEETS_WRITES_PER_MINUTE,
+                 drive_per_minute=DRIVE_REQUESTS_PER_MINUTE, max_retries=MAX_RETRIES):
+        self.buckets = {
+            LEITURA: TokenBucket(reads_per_minute),
+            ESCRITA: TokenBucket(writes_per_minute),
+            DRIVE: TokenBucket(drive_per_minute),
+        }
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.counters = {kind: self._empty_counters() for kind in self.buckets}
+
+    @staticmethod
+    def _empty_counters():
+        return {"chamadas": 0, "limitadas": 0, "repetidas": 0, "erros": 0, "espera_s": 0.0}
+
+    def _count(self, kind, **increments):
+        with self.lock:
+            for name, value in increments.items():
+                self.counters[kind][name] += value
+
+    def call(self, kind, func, *args, retry_status=RETRY_STATUS, **kwargs):
+        """
+        Executa func(*args, **kwargs) dentro da cota de `kind`, repetindo erros temporários.
+        Para chamadas que não podem ser repetidas com segurança, use retry_status=RETRY_STATUS_UNSAFE.
+        """
+        def before_attempt():
+            waited = self.buckets[kind].acquire()
+            self._count(kind, chamadas=1, limitadas=int(waited > 0), espera_s=waited)
+        return _call_with_retry(
+            func, args, kwargs, self.max_retries, retry_status=retry_status, before_attempt=before_attempt,
+            on_retry=lambda: self._count(kind, repetidas=1), on_error=lambda: self._count(kind, erros=1),
+        )
+
+    def stats(self):
+        """Contadores por tipo de chamada, como tabela."""
+        with self.lock:
+            df = pd.DataFrame.from_dict(self.counters, orient="index")
+        df["espera_s"] = df["espera_s"].round(2)
+        df.index.name = "tipo"
+        return df
+
+    def reset_stats(self):
+        with self.lock:
+            self.counters = {kind: self._empty_counters() for kind in self.buckets}
+
+    def wrap_spreadsheet(self, sh):
+        return SpreadsheetProxy(sh, self)
+
+    def wrap_drive(self, service):
+        return DriveProxy(service, self)
+
+class _Proxy:
+    """
+    Repassa tudo ao objeto original; os métodos de READS/WRITES passam pelo QuotaClient.
+    Os de UNSAFE (subconjunto de WRITES) só são repetidos em 429.
+    """
+
+    READS = frozenset()
+    WRITES = frozenset()
+    UNSAFE = frozenset()
+
+    def __init__(self, target, client):
+        self._target = target
+        self._client = client
+
+    def _wrap_result(self, name, value):
+        return value
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        kind = LEITURA if name in self.READS else ESCRITA if name in self.WRITES else None
+        if kind is None or not callable(value):
+            return self._wrap_result(name, value)
+
+        retry_status = RETRY_STATUS_UNSAFE if name in self.UNSAFE else RETRY_STATUS
+
+        def managed(*args, **kwargs):
+            return self._wrap_result(name, self._client.call(kind, value, *args, retry_status=retry_status, **kwargs))
+        # Marca para quem já tem retry próprio (sheets_writer) não repetir de novo
+        managed.quota_managed = True
+        return managed
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self._target!r}>"
+
+class WorksheetProxy(_Proxy):
+    READS = frozenset({
+        "get_all_values", "get_all_records", "get_values", "get", "batch_get", "row_values",
+        "col_values", "cell", "acell", "find", "findall",
+    })
+    WRITES = frozenset({
+        "update", "update_cell", "update_acell", "batch_update", "append_row", "append_rows",
+        "insert_row", "insert_rows", "delete_rows", "clear", "batch_clear", "resize",
+    })
+    # batch_update de valores (intervalos fixos) e update podem ser repetidos; estes não
+    UNSAFE = frozenset({"append_row", "append_rows", "insert_row", "insert_rows", "delete_rows"})
+
+    def _wrap_result(self, name, value):
+        if name == "spreadsheet":
+            return SpreadsheetProxy(value, self._client)
+        return value
+
+class SpreadsheetProxy(_Proxy):
+    READS = frozenset({"worksheet", "worksheets", "get_worksheet", "values_batch_get", "fetch_sheet_metadata"})
+    WRITES = frozenset({"add_worksheet", "duplicate_sheet", "del_worksheet", "batch_update", "values_batch_update"})
+    # batch_update da planilha apaga/renomeia abas: repetir depois de um sucesso falha ou apaga a mais
+    UNSAFE = frozenset({"add_worksheet", "duplicate_sheet", "del_worksheet", "batch_update"})
+
+    def _wrap_result(self, name, value):
+        # gspread.Worksheet ou equivalente (fake_google): qualquer objeto com a interface de aba
+        if hasattr(value, "get_all_values"):
+            return WorksheetProxy(value, self._client)
+        if isinstance(value, list) and value and hasattr(value[0], "get_all_values"):
+            return [WorksheetProxy(ws, self._client) for ws in value]
+        return value
+
+    def del_worksheet(self, worksheet):
+        target = worksheet._target if isinstance(worksheet, WorksheetProxy) else worksheet
+        return self._client.call(ESCRITA, self._target.del_worksheet, target, retry_status=RETRY_STATUS_UNSAFE)
+
+class DriveProxy(_Proxy):
+    """
+    Serviço do Drive (googleapiclient): service.files().create(...).execute().
+    Cada nível é embrulhado; só o execute() final faz a chamada, pelo QuotaClient.
+    Requisições de criação (create/copy) só são repetidas em 429: um 5xx pode ter criado o arquivo.
+    """
+
+    UNSAFE = frozenset({"create", "copy"})
+
+    def __init__(self, target, client, unsafe=False):
+        super().__init__(target, client)
+        self._unsafe = unsafe
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if name == "execute":
+            retry_status = RETRY_STATUS_UNSAFE if self._unsafe else RETRY_STATUS
+
+            def managed(*args, **kwargs):
+                return self._client.call(DRIVE, value, *args, retry_status=retry_status, **kwargs)
+            managed.quota_managed = True
+            return managed
+        if not callable(value):
+            return value
+        return lambda *args, **kwargs: DriveProxy(value(*args, **kwargs), self._client, unsafe=name in self.UNSAFE)
+
+# Um cliente por processo: as cotas do Google valem para a service account inteira
+CLIENT = QuotaClient()
+
+def with_retry(func, *args, max_retries=MAX_RETRIES, retry_status=RETRY_STATUS, **kwargs):
+    """
+    Chama func repetindo os erros de retry_status (429/5xx; RETRY_STATUS_UNSAFE para chamadas
+    que não podem ser repetidas com segurança). Se func já é um método embrulhado pelo
+    QuotaClient (handle vindo do auth_manager), chama direto: a cota e as repetições já estão lá.
+    """
+    if getattr(func, "quota_managed", False):
+        return func(*args, **kwargs)
+    return _call_with_retry(func, args, kwargs, max_retries, retry_status=retry_status)
@@ -0,0 +1,349 @@
+import hashlib
+import json
+from pathlib import Path
+
+import gspread
+import numpy as np
+import pandas as pd
+from gspread.utils import ValueRenderOption, rowcol_to_a1
+
+import numeric_parser
+import sheets_client
+from empenho_index import EmpenhoIndex
+from merge_engine import normalize_empenhos
+
+# Acima desta fração de células alteradas, reescrever tudo de uma vez sai mais barato
+FULL_WRITE_RATIO = 0.5
+# Células alteradas na mesma linha separadas por até MERGE_GAP células iguais viram um único intervalo
+MERGE_GAP = 3
+# Limites de cada chamada batch_update (o Sheets recomenda payloads de até ~2 MB)
+BATCH_MAX_RANGES = 5000
+BATCH_MAX_CELLS = 50000
+
+# Reescritas completas maiores que isso vão em blocos para uma aba temporária (staging)
+CHUNK_ROWS = 2000
+STAGING_SUFFIX = "__staging"
+# Progresso das gravações em blocos, para retomar do último bloco confirmado
+CHECKPOINT_DIR = Path(".cache") / "sheets_writes"
+
+def dataframe_to_rows(df):
+    """Cabeçalho + linhas do DataFrame, no formato enviado ao Google Sheets."""
+    return [df.columns.values.tolist()] + df.values.tolist()
+
+def _as_grid(rows, n_rows, n_cols):
+    """Lista de linhas (possivelmente de tamanhos diferentes) -> matriz n_rows x n_cols completada com ""."""
+    grid = np.full((n_rows, n_cols), "", dtype=object)
+    for i, row in enumerate(rows):
+        grid[i, :len(row)] = row
+    return grid
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def changed_cells(old_grid, new_grid):
+    """
+    Máscara das células que precisam ser escritas.
+    Um texto novo igual (como número brasileiro) ao número já gravado não conta como alteração:
+    "R$ 1.234,56" lido formatado da base não precisa sobrescrever o 1234.56 da planilha.
+    """
+    changed = ~(old_grid == new_grid)
+    rows, cols = np.nonzero(changed)
+    if len(rows):
+        old_values = old_grid[rows, cols]
+        new_values = new_grid[rows, cols]
+        candidates = np.array([_is_number(o) and isinstance(n, str) for o, n in zip(old_values, new_values)], dtype=bool)
+        if candidates.any():
+            parsed = numeric_parser.parse_br_numbers(pd.Series(new_values[candidates], dtype=object)).to_numpy()
+            old_numbers = old_values[candidates].astype(float)
+            same = np.isclose(parsed, old_numbers, rtol=0, atol=1e-9) & ~np.isnan(parsed)
+            changed[rows[candidates][same], cols[candidates][same]] = False
+    return changed
+
+def changed_ranges(changed, new_grid, gap=MERGE_GAP):
+    """Agrupa as células alteradas em intervalos por linha: [{"range": "B5:D5", "values": [[...]]}, ...]."""
+    ranges = []
+    for i in np.flatnonzero(changed.any(axis=1)):
+        cols = np.flatnonzero(changed[i])
+        # Quebra a linha onde a distância entre duas células alteradas passa de `gap`
+        breaks = np.flatnonzero(np.diff(cols) > gap + 1)
+        starts = np.concatenate([[cols[0]], cols[breaks + 1]])
+        ends = np.concatenate([cols[breaks], [cols[-1]]])
+        for start, end in zip(starts, ends):
+            ranges.append({
+                "range": f"{rowcol_to_a1(i + 1, start + 1)}:{rowcol_to_a1(i + 1, end + 1)}",
+                "values": [new_grid[i, start:end + 1].tolist()],
+            })
+    return ranges
+
+def _batches(ranges, max_ranges=BATCH_MAX_RANGES, max_cells=BATCH_MAX_CELLS):
+    batch, cells = [], 0
+    for item in ranges:
+        size = len(item["values"][0])
+        if batch and (len(batch) >= max_ranges or cells + size > max_cells):
+            yield batch
+            batch, cells = [], 0
+        batch.append(item)
+        cells += size
+    if batch:
+        yield batch
+
+def _ensure_grid_size(ws, n_rows, n_cols, row_count=None):
+    """
+    Aumenta a aba se os dados novos não cabem na grade atual (a API recusa intervalos fora dela).
+    row_count: linhas da grade, quando o handle ainda tem o valor de antes de apagar/inserir linhas.
+    """
+    row_count = ws.row_count if row_count is None else row_count
+    if n_rows > row_count or n_cols > ws.col_count:
+        ws.resize(rows=max(n_rows, row_count), cols=max(n_cols, ws.col_count))
+
+def _runs(positions):
+    """Posições crescentes -> intervalos [início, fim) de posições consecutivas."""
+    runs = []
+    for p in positions:
+        if runs and runs[-1][1] == p:
+            runs[-1][1] = p + 1
+        else:
+            runs.append([p, p + 1])
+    return runs
+
+def _row_plan(old_rows, new_rows):
+    """
+    Alinha as linhas da aba com as do df pela chave (numeroEmpenho), para que uma linha
+    removida ou inserida no meio não desloque todas as seguintes no diff.
+    Retorna (apagar, inserir, linhas_atuais), com posições base 0 da grade (0 = cabeçalho):
+    - apagar: linhas da aba que saem (empenhos que não estão no df, repetidos ou sem número);
+    - inserir: posições finais das linhas novas que entram antes do último empenho mantido
+      (as do fim são só gravadas depois da última linha);
+    - linhas_atuais: a aba depois de apagar/inserir, alinhada linha a linha com new_rows.
+    Retorna None quando a comparação por posição já basta ou é a única possível: sem coluna
+    de empenho, cabeçalho diferente, empenho vazio ou repetido no df, empenhos em outra ordem
+    ou nenhuma linha a apagar/inserir.
+    """
+    if len(old_rows) < 2:
+        return None
+    width = max(len(old_rows[0]), len(new_rows[0]))
+    if _as_grid(old_rows[:1], 1, width).tolist() != _as_grid(new_rows[:1], 1, width).tolist():
+        return None
+    col = EmpenhoIndex(new_rows[0], []).col_empenho
+    if not col:
+        return None
+    old_keys = normalize_empenhos(pd.Series([r[col - 1] if len(r) >= col else "" for r in old_rows[1:]], dtype=object)).tolist()
+    new_keys = normalize_empenhos(pd.Series([r[col - 1] for r in new_rows[1:]], dtype=object)).tolist()
+    if "" in new_keys or len(set(new_keys)) != len(new_keys):
+        return None
+
+    wanted = set(new_keys)
+    kept, delete = {}, []
+    for i, key in enumerate(old_keys):
+        if key and key in wanted and key not in kept:
+            kept[key] = i + 1
+        else:
+            delete.append(i + 1)
+    # Só apaga/insere: reordenar linhas mantidas fica com a comparação por posição
+    if [k for k in new_keys if k in kept] != list(kept):
+        return None
+    last_kept = max((p for p, k in enumerate(new_keys) if k in kept), default=-1)
+    insert = [p + 1 for p, k in enumerate(new_keys) if k not in kept and p < last_kept]
+    if not delete and not insert:
+        return None
+    current = [old_rows[0]] + [old_rows[kept[k]] if k in kept else [] for k in new_keys]
+    return delete, insert, current
+
+def _apply_row_plan(ws, delete, insert):
+    """Apaga e insere as linhas do plano numa única chamada batch_update (atômica)."""
+    def dimension(start, end):
+        return {"sheetId": ws.id, "dimension": "ROWS", "startIndex": start, "endIndex": end}
+    # De baixo para cima, para as posições das remoções seguintes não mudarem; as inserções
+    # vêm depois, em ordem crescente das posições finais
+    requests = [{"deleteDimension": {"range": dimension(start, end)}} for start, end in reversed(_runs(delete))]
+    requests += [{"insertDimension": {"range": dimension(start, end), "inheritFromBefore": True}}
+                 for start, end in _runs(insert)]
+    # Repetir depois de um 5xx apagaria linhas a mais
+    _with_retry(ws.spreadsheet.batch_update, {"requests": requests}, retry_status=sheets_client.RETRY_STATUS_UNSAFE)
+
+def write_dataframe(ws, df, old_rows=None, full_write_ratio=FULL_WRITE_RATIO):
+    """
+    Grava df (cabeçalho + linhas) na aba escrevendo só o que mudou, sem ws.clear():
+    células alteradas, linhas novas no fim e linhas que sobraram (apagadas com "").
+    Com coluna de empenho, as linhas são casadas pelo número do empenho: empenhos que saíram
+    são apagados da aba e os novos do meio são inseridos (deleteDimension/insertDimension
+    numa chamada só), e só as células que mudaram nas linhas casadas são regravadas.
+    old_rows: valores atuais da aba NÃO formatados; se None, são lidos da planilha.
+    Se muitas células mudaram, reescreve a área inteira numa única chamada.
+    Retorna um resumo com o modo usado e a quantidade de células/linhas/chamadas.
+    """
+    if old_rows is None:
+        old_rows = ws.get_all_values(value_render_option=ValueRenderOption.unformatted)
+    new_rows = dataframe_to_rows(df)
+
+    n_rows = max(len(old_rows), len(new_rows))
+    n_cols = max([len(r) for r in old_rows] + [len(new_rows[0])])
+    old_grid = _as_grid(old_rows, n_rows, n_cols)
+    new_grid = _as_grid(new_rows, n_rows, n_cols)
+    changed = changed_cells(old_grid, new_grid)
+
+    plan = _row_plan(old_rows, new_rows)
+    if plan:
+        delete, insert, current = plan
+        keyed = changed_cells(_as_grid(current, len(new_rows), n_cols), _as_grid(new_rows, len(new_rows), n_cols))
+        # Casar pela chave só compensa se sobrar pouca coisa para gravar
+        if keyed.sum() > full_write_ratio * keyed.size:
+            plan = None
+
+    if plan:
+        resumo = {
+            "modo": "delta",
+            "celulas_alteradas": int(keyed.sum()),
+            "linhas_novas": len(new_rows) - len(old_rows) + len(delete),
+            "linhas_removidas": len(delete),
+            "chamadas": 1,
+        }
+        row_count = ws.row_count - len(delete) + len(insert)
+        _apply_row_plan(ws, delete, insert)
+        _ensure_grid_size(ws, len(new_rows), n_cols, row_count=row_count)
+        for batch in _batches(changed_ranges(keyed, new_grid[:len(new_rows)])):
+            _with_retry(ws.batch_update, batch)
+            resumo["chamadas"] += 1
+        return resumo
+
+    resumo = {
+        "modo": "delta",
+        "celulas_alteradas": int(changed.sum()),
+        "linhas_novas": max(len(new_rows) - len(old_rows), 0),
+        "linhas_removidas": max(len(old_rows) - len(new_rows), 0),
+        "chamadas": 0,
+    }
+    if not resumo["celulas_alteradas"]:
+        return resumo
+
+    if resumo["celulas_alteradas"] > full_write_ratio * changed.size and len(new_rows) > CHUNK_ROWS:
+        # Base grande: grava em blocos numa aba temporária e troca no final
+        resumo["modo"] = "staging"
+        _, resumo["chamadas"] = replace_via_staging(ws, new_rows)
+        return resumo
+
+    _ensure_grid_size(ws, n_rows, n_cols)
+    if resumo["celulas_alteradas"] > full_write_ratio * changed.size:
+        # Reescrita completa, mas sem limpar antes: a área que sobrou recebe ""
+        resumo["modo"] = "completo"
+        _with_retry(ws.update, new_grid.tolist(), "A1")
+        resumo["chamadas"] = 1
+        return resumo
+
+    for batch in _batches(changed_ranges(changed, new_grid)):
+        _with_retry(ws.batch_update, batch)
+        resumo["chamadas"] += 1
+    return resumo
+
+def _with_retry(func, *args, **kwargs):
+    """Chama func repetindo erros 429/5xx da API (ver sheets_client.with_retry)."""
+    return sheets_client.with_retry(func, *args, **kwargs)
+
+def _checkpoint_path(key):
+    return CHECKPOINT_DIR / f"{key}.json"
+
+def _load_checkpoint(key):
+    try:
+        return json.loads(_checkpoint_path(key).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def _save_checkpoint(key, state):
+    try:
+        CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+        _checkpoint_path(key).write_text(json.dumps(state), encoding="utf-8")
+    except OSError as e:
+        # Sem checkpoint a gravação continua; só não dá para retomar depois de uma falha
+        print(f"[WARN] Não foi possível gravar o checkpoint da escrita: {e}")
+
+def _clear_checkpoint(key):
+    try:
+        _checkpoint_path(key).unlink()
+    except OSError:
+        pass
+
+def write_chunked(ws, rows, key=None, chunk_rows=CHUNK_ROWS):
+    """
+    Grava rows na aba em blocos de chunk_rows linhas (uma chamada por bloco, com retry).
+    Com `key`, o número de linhas já confirmadas fica salvo em CHECKPOINT_DIR: chamar de novo
+    com a mesma key depois de uma falha continua do último bloco gravado.
+    Retorna o número de chamadas feitas.
+    """
+    start = 0
+    if key:
+        state = _load_checkpoint(key)
+        if state and state.get("aba") == ws.title:
+            start = state["linhas_confirmadas"]
+
+    calls = 0
+    for block_start in range(start, len(rows), chunk_rows):
+        block = rows[block_start:block_start + chunk_rows]
+        _with_retry(ws.update, block, f"A{block_start + 1}")
+        calls += 1
+        if key:
+            _save_checkpoint(key, {"aba": ws.title, "linhas_confirmadas": block_start + len(block)})
+    return calls
+
+def _rows_key(title, rows):
+    """Identifica uma gravação: mesma aba de destino e mesmo conteúdo."""
+    digest = hashlib.sha256(title.encode())
+    digest.update(json.dumps(rows, default=str).encode())
+    return digest.hexdigest()
+
+def replace_via_staging(ws, rows, chunk_rows=CHUNK_ROWS):
+    """
+    Reescreve a aba inteira sem que ninguém veja uma planilha vazia ou pela metade:
+    duplica a aba como "<título>__staging" (a cópia leva formatação, validação de dados,
+    filtro e linhas congeladas), grava rows nela em blocos e, no fim, numa única chamada
+    batch_update (atômica), apaga a aba antiga e renomeia a staging no lugar dela.
+    Se falhar no meio, chamar de novo com os mesmos dados retoma do último bloco confirmado.
+    Retorna (nova_aba, chamadas). A aba antiga deixa de existir: handles guardados dela
+    precisam ser descartados, e a nova tem outro sheetId, então links com "#gid=" e
+    intervalos protegidos da aba antiga precisam ser refeitos (ver describe_write).
+    """
+    sh = ws.spreadsheet
+    title, index = ws.title, ws.index
+    staging_title = f"{title}{STAGING_SUFFIX}"
+    key = _rows_key(title, rows)
+    n_cols = max(len(r) for r in rows)
+
+    try:
+        staging = sh.worksheet(staging_title)
+        state = _load_checkpoint(key)
+        if not state or state.get("aba") != staging_title:
+            # Sobrou de outra gravação (outros dados): recomeça do zero
+            sh.del_worksheet(staging)
+            raise gspread.WorksheetNotFound(staging_title)
+    except gspread.WorksheetNotFound:
+        staging = _with_retry(sh.duplicate_sheet, ws.id, new_sheet_name=staging_title,
+                              retry_status=sheets_client.RETRY_STATUS_UNSAFE)
+        # A grade fica do tamanho exato dos dados novos: linhas e colunas que sobravam da cópia saem
+        _with_retry(staging.resize, rows=len(rows), cols=n_cols)
+
+    calls = write_chunked(staging, rows, key=key, chunk_rows=chunk_rows)
+
+    # Troca atômica: as duas operações vão no mesmo batch_update
+    _with_retry(sh.batch_update, {"requests": [
+        {"deleteSheet": {"sheetId": ws.id}},
+        {"updateSheetProperties": {
+            "properties": {"sheetId": staging.id, "title": title, "index": index},
+            "fields": "title,index",
+        }},
+    ]}, retry_status=sheets_client.RETRY_STATUS_UNSAFE)
+    _clear_checkpoint(key)
+    return sh.worksheet(title), calls + 1
+
+def describe_write(resumo):
+    """Texto curto do resumo de write_dataframe para mostrar ao administrador."""
+    if resumo["celulas_alteradas"] == 0 and resumo["chamadas"] == 0:
+        return "Nenhuma célula mudou: nada foi enviado ao Google Sheets."
+    modo = {
+        "completo": "reescrita completa",
+        "staging": "reescrita completa em blocos, via aba temporária",
+    }.get(resumo["modo"], "só as células alteradas")
+    texto = (f"Google Sheets: {resumo['celulas_alteradas']} células gravadas ({modo}) em {resumo['chamadas']} chamada(s); "
+             f"{resumo['linhas_novas']} linha(s) nova(s), {resumo['linhas_removidas']} removida(s).")
+    if resumo["modo"] == "staging":
+        texto += (" A aba foi recriada a partir de uma cópia: a formatação foi mantida, mas links para a aba"
+                  " (#gid=) e intervalos protegidos da aba antiga precisam ser refeitos.")
+    return texto
@@ -0,0 +1,496 @@
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import gspread
+from gspread.cell import Cell
+from gspread.utils import (
+    Dimension,
+    ValueRenderOption,
+    a1_range_to_grid_range,
+    numericise_all,
+    rowcol_to_a1,
+    to_records,
+)
+
+# Backend de armazenamento: "sheets" (Google Sheets, padrão), "sqlite" (arquivo local) ou
+# "fake" (Sheets e Drive simulados em memória, ver fake_google).
+# Escolhido pela variável de ambiente ou pela seção [storage] das secrets do Streamlit.
+BACKEND_ENV = "EMPENHOS_STORAGE_BACKEND"
+SQLITE_PATH_ENV = "EMPENHOS_SQLITE_PATH"
+BACKENDS = ("sheets", "sqlite", "fake")
+DEFAULT_BACKEND = "sheets"
+DEFAULT_SQLITE_PATH = "listagem_empenhos.db"
+
+# Abas usadas pela aplicação (para importar do Google Sheets)
+WORKSHEET_TITLES = ["emp_controle", "usuarios", "configuracoes"]
+
+def backend_name(secrets=None):
+    """Backend configurado: variável de ambiente > secrets["storage"]["backend"] > "sheets"."""
+    name = os.environ.get(BACKEND_ENV)
+    if not name and secrets is not None:
+        try:
+            name = secrets.get("storage", {}).get("backend")
+        except Exception:
+            name = None
+    name = (name or DEFAULT_BACKEND).strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de armazenamento desconhecido: '{name}' (use {' ou '.join(BACKENDS)}).")
+    return name
+
+def sqlite_path(secrets=None):
+    path = os.environ.get(SQLITE_PATH_ENV)
+    if not path and secrets is not None:
+        try:
+            path = secrets.get("storage", {}).get("sqlite_path")
+        except Exception:
+            path = None
+    return path or DEFAULT_SQLITE_PATH
+
+class UnsupportedRequestError(gspread.exceptions.GSpreadException):
+    """Requisição do spreadsheets.batchUpdate que o backend local não sabe executar."""
+
+def _is_empty(value):
+    return value is None or value == ""
+
+def _formatted(value):
+    """Valor como o Sheets exibe (FORMATTED_VALUE): texto; número inteiro sem ".0"."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _trim(rows):
+    """Linhas sem as células vazias do fim, e sem as linhas vazias do fim (como a API do Sheets devolve)."""
+    rows = [list(row) for row in rows]
+    for row in rows:
+        while row and _is_empty(row[-1]):
+            row.pop()
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+class LocalSpreadsheet:
+    """
+    Planilha guardada em SQLite com o mesmo subconjunto da API do gspread.Spreadsheet
+    usado pela aplicação (worksheet, add_worksheet, del_worksheet, batch_update...).
+    Cada aba é uma tabela com uma linha por linha da planilha (coluna r = número da linha,
+    chave primária): leituras de colunas (batch_get, values_batch_get, row_values) buscam só
+    as colunas pedidas, e as gravações de células vão direto à linha pela chave.
+    """
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, title="listagem_empenhos"):
+        self.path = str(path)
+        self.title = title
+        # O Streamlit roda cada sessão numa thread: uma conexão compartilhada, protegida por lock
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.RLock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS _abas ("
+                "id INTEGER PRIMARY KEY, title TEXT UNIQUE NOT NULL, idx INTEGER NOT NULL, "
+                "rows INTEGER NOT NULL, cols INTEGER NOT NULL)"
+            )
+
+    def revision(self):
+        """Marca da última alteração do arquivo do banco (também pega gravações de outros processos)."""
+        stamps = [os.stat(p).st_mtime_ns for p in (self.path, f"{self.path}-wal") if os.path.exists(p)]
+        return max(stamps) if stamps else None
+
+    def _meta(self, where, params):
+        with self.lock:
+            return self.conn.execute(f"SELECT id, title, idx, rows, cols FROM _abas WHERE {where}", params).fetchone()
+
+    def worksheets(self, exclude_hidden=False):
+        with self.lock:
+            rows = self.conn.execute("SELECT id, title, idx, rows, cols FROM _abas ORDER BY idx").fetchall()
+        return [LocalWorksheet(self, *row) for row in rows]
+
+    def worksheet(self, title):
+        row = self._meta("title = ?", (title,))
+        if row is None:
+            raise gspread.WorksheetNotFound(title)
+        return LocalWorksheet(self, *row)
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        with self.lock:
+            if self._meta("title = ?", (title,)):
+                raise ValueError(f"Já existe uma aba chamada '{title}'.")
+            idx = index if index is not None else self.conn.execute("SELECT COUNT(*) FROM _abas").fetchone()[0]
+            self.conn.execute("BEGIN")
+            cur = self.conn.execute("INSERT INTO _abas (title, idx, rows, cols) VALUES (?, ?, ?, ?)", (title, idx, rows, cols))
+            sheet_id = cur.lastrowid
+            columns = "".join(f", c{c}" for c in range(1, cols + 1))
+            self.conn.execute(f"CREATE TABLE aba_{sheet_id} (r INTEGER PRIMARY KEY{columns})")
+            self.conn.execute("COMMIT")
+        return self.worksheet(title)
+
+    def duplicate_sheet(self, source_sheet_id, insert_sheet_index=None, new_sheet_id=None, new_sheet_name=None):
+        """Cópia de uma aba (valores e tamanho da grade), como o duplicateSheet do Sheets."""
+        source = self._meta("id = ?", (source_sheet_id,))
+        if source is None:
+            raise gspread.WorksheetNotFound(str(source_sheet_id))
+        title = new_sheet_name or f"Cópia de {source[1]}"
+        with self.lock:
+            if self._meta("title = ?", (title,)):
+                raise ValueError(f"Já existe uma aba chamada '{title}'.")
+            idx = insert_sheet_index if insert_sheet_index is not None else self.conn.execute("SELECT COUNT(*) FROM _abas").fetchone()[0]
+            columns = [col[1] for col in self.conn.execute(f"PRAGMA table_info(aba_{source_sheet_id})") if col[1] != "r"]
+            self.conn.execute("BEGIN")
+            cur = self.conn.execute("INSERT INTO _abas (id, title, idx, rows, cols) VALUES (?, ?, ?, ?, ?)",
+                                    (new_sheet_id, title, idx, source[3], source[4]))
+            sheet_id = cur.lastrowid
+            self.conn.execute(f"CREATE TABLE aba_{sheet_id} (r INTEGER PRIMARY KEY{''.join(f', {c}' for c in columns)})")
+            self.conn.execute(f"INSERT INTO aba_{sheet_id} SELECT * FROM aba_{source_sheet_id}")
+            self.conn.execute("COMMIT")
+        return self.worksheet(title)
+
+    def del_worksheet(self, worksheet):
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self._delete_sheet(worksheet.id)
+            self.conn.execute("COMMIT")
+
+    def _delete_sheet(self, sheet_id):
+        self.conn.execute("DELETE FROM _abas WHERE id = ?", (sheet_id,))
+        self.conn.execute(f"DROP TABLE IF EXISTS aba_{sheet_id}")
+
+    def values_batch_get(self, ranges, params=None):
+        """
+        Subconjunto do spreadsheets.values.batchGet: intervalos "'aba'" (aba inteira) ou "'aba'!B2:B",
+        devolvidos como o Google devolve (valueRanges, sem células vazias no fim).
+        """
+        params = params or {}
+        value_ranges = []
+        for range_name in ranges:
+            title, _, cells = range_name.partition("!")
+            title = title.strip("'").replace("''", "'")
+            values = self.worksheet(title).batch_get(
+                [cells or None], major_dimension=params.get("majorDimension"),
+                value_render_option=params.get("valueRenderOption"),
+            )[0]
+            value_ranges.append({"range": range_name, "majorDimension": params.get("majorDimension") or "ROWS", "values": values})
+        return {"spreadsheetId": self.path, "valueRanges": value_ranges}
+
+    def _shift_rows(self, sheet_id, after, delta):
+        """Soma delta ao número das linhas abaixo de `after` (em dois passos: r é a chave primária)."""
+        table = f"aba_{sheet_id}"
+        self.conn.execute(f"UPDATE {table} SET r = -(r + ?) WHERE r > ?", (delta, after))
+        self.conn.execute(f"UPDATE {table} SET r = -r WHERE r < 0")
+        self.conn.execute("UPDATE _abas SET rows = rows + ? WHERE id = ?", (delta, sheet_id))
+
+    def _change_rows(self, request, insert):
+        """deleteDimension/insertDimension de linhas (startIndex/endIndex base 0, fim exclusivo)."""
+        grid = request["range"]
+        if grid.get("dimension") != "ROWS":
+            raise UnsupportedRequestError(f"Só linhas podem ser apagadas/inseridas no backend local: {grid}")
+        start, end = grid["startIndex"], grid["endIndex"]
+        if insert:
+            self._shift_rows(grid["sheetId"], start, end - start)
+        else:
+            self.conn.execute(f"DELETE FROM aba_{grid['sheetId']} WHERE r > ? AND r <= ?", (start, end))
+            self._shift_rows(grid["sheetId"], end, start - end)
+
+    def batch_update(self, body):
+        """
+        Subconjunto do spreadsheets.batchUpdate, numa transação: deleteSheet, updateSheetProperties
+        (título/posição) e deleteDimension/insertDimension de linhas.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                for request in body.get("requests", []):
+                    if "deleteSheet" in request:
+                        self._delete_sheet(request["deleteSheet"]["sheetId"])
+                    elif "updateSheetProperties" in request:
+                        props = request["updateSheetProperties"]["properties"]
+                        fields = request["updateSheetProperties"].get("fields", "")
+                        if "title" in fields:
+                            self.conn.execute("UPDATE _abas SET title = ? WHERE id = ?", (props["title"], props["sheetId"]))
+                        if "index" in fields:
+                            self.conn.execute("UPDATE _abas SET idx = ? WHERE id = ?", (props["index"], props["sheetId"]))
+                    elif "deleteDimension" in request:
+                        self._change_rows(request["deleteDimension"], insert=False)
+                    elif "insertDimension" in request:
+                        self._change_rows(request["insertDimension"], insert=True)
+                    else:
+                        raise UnsupportedRequestError(f"Requisição não suportada no backend local: {list(request)}")
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return {}
+
+class LocalWorksheet:
+    """Aba de uma LocalSpreadsheet, com a mesma interface do gspread.Worksheet usada pela aplicação."""
+
+    def __init__(self, spreadsheet, sheet_id, title, index, rows, cols):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.title = title
+        self.index = index
+        self.table = f"aba_{sheet_id}"
+
+    @property
+    def _conn(self):
+        return self.spreadsheet.conn
+
+    # Tamanhos lidos do banco a cada uso: outro handle da mesma aba pode ter redimensionado a grade
+    @property
+    def row_count(self):
+        with self.spreadsheet.lock:
+            row = self._conn.execute("SELECT rows FROM _abas WHERE id = ?", (self.id,)).fetchone()
+        return row[0] if row else 0
+
+    @property
+    def col_count(self):
+        """Colunas c1..cN que existem de fato na tabela da aba."""
+        with self.spreadsheet.lock:
+            return sum(1 for col in self._conn.execute(f"PRAGMA table_info({self.table})") if col[1] != "r")
+
+    # ---------- leitura ----------
+
+    def _grid(self):
+        """Todas as linhas gravadas, como {linha: [valores]} (valores não formatados)."""
+        with self.spreadsheet.lock:
+            rows = self._conn.execute(f"SELECT * FROM {self.table} ORDER BY r").fetchall()
+        return {row[0]: list(row[1:]) for row in rows}
+
+    def get_all_values(self, range_name=None, value_render_option=None, **kwargs):
+        grid = self._grid()
+        non_empty = {r: vals for r, vals in grid.items() if any(not _is_empty(v) for v in vals)}
+        if not non_empty:
+            return []
+        n_rows = max(non_empty)
+        n_cols = max(max(i + 1 for i, v in enumerate(vals) if not _is_empty(v)) for vals in non_empty.values())
+        render = _formatted if value_render_option != ValueRenderOption.unformatted else (lambda v: "" if v is None else v)
+        return [[render(v) for v in grid.get(r, [None] * n_cols)[:n_cols]] for r in range(1, n_rows + 1)]
+
+    get_values = get_all_values
+
+    def get_all_records(self, head=1, value_render_option=None, default_blank="", numericise_ignore=(), empty2zero=False, **kwargs):
+        values = self.get_all_values(value_render_option=value_render_option)
+        if len(values) < head:
+            return []
+        keys = values[head - 1]
+        rows = values[head:]
+        if list(numericise_ignore) != ["all"]:
+            rows = [numericise_all(row, empty2zero, default_blank, False, list(numericise_ignore)) for row in rows]
+        return to_records(keys, rows)
+
+    def _read_range(self, range_name, value_render_option=None):
+        """
+        Valores de um intervalo A1 (None = aba inteira) como o Google devolve, sem células/linhas
+        vazias no fim. Só as colunas e linhas do intervalo saem do banco (linhas pela chave r).
+        """
+        grid = a1_range_to_grid_range(range_name) if range_name else {}
+        first_row = grid.get("startRowIndex", 0) + 1
+        first_col = grid.get("startColumnIndex", 0) + 1
+        last_col = min(grid.get("endColumnIndex", self.col_count), self.col_count)
+        if last_col < first_col:
+            return []
+        columns = ", ".join(f"c{c}" for c in range(first_col, last_col + 1))
+        query = f"SELECT r, {columns} FROM {self.table} WHERE r >= ?"
+        params = [first_row]
+        if "endRowIndex" in grid:
+            query += " AND r <= ?"
+            params.append(grid["endRowIndex"])
+        with self.spreadsheet.lock:
+            stored = self._conn.execute(query + " ORDER BY r", params).fetchall()
+        render = _formatted if value_render_option != ValueRenderOption.unformatted else (lambda v: "" if v is None else v)
+        rows = []
+        for r, *values in stored:
+            rows.extend([] for _ in range(r - first_row - len(rows)))
+            rows.append([render(v) for v in values])
+        return _trim(rows)
+
+    def batch_get(self, ranges, major_dimension=None, value_render_option=None, **kwargs):
+        """
+        Valores de vários intervalos A1 ("B2:B", "1:1"...; None = aba inteira) numa leitura só,
+        como o Google devolve: sem linhas/células vazias no fim; major_dimension="COLUMNS" transpõe.
+        """
+        result = []
+        for range_name in ranges:
+            rows = self._read_range(range_name, value_render_option)
+            if major_dimension == Dimension.cols and rows:
+                width = max(len(row) for row in rows)
+                rows = _trim([list(col) for col in zip(*(row + [""] * (width - len(row)) for row in rows))])
+            result.append(rows)
+        return result
+
+    def row_values(self, row, value_render_option=None, **kwargs):
+        values = self._read_range(f"{row}:{row}", value_render_option)
+        return values[0] if values else []
+
+    def col_values(self, col, value_render_option=ValueRenderOption.formatted):
+        if col > self.col_count:
+            return []
+        with self.spreadsheet.lock:
+            rows = dict(self._conn.execute(f"SELECT r, c{col} FROM {self.table} WHERE c{col} IS NOT NULL AND c{col} != ''").fetchall())
+        if not rows:
+            return []
+        render = _formatted if value_render_option != ValueRenderOption.unformatted else (lambda v: v)
+        return [render(rows[r]) if r in rows else "" for r in range(1, max(rows) + 1)]
+
+    def cell(self, row, col, value_render_option=ValueRenderOption.formatted):
+        values = self.col_values(col, value_render_option)
+        return Cell(row, col, values[row - 1] if row <= len(values) else "")
+
+    def find(self, query, in_row=None, in_column=None, case_sensitive=True):
+        """
+        Primeira célula com o texto exato `query`. Com in_column, a busca usa um índice
+        SQLite na coluna (criado na primeira vez), sem ler a aba inteira.
+        """
+        if in_column is None or in_row is not None or not case_sensitive or not isinstance(query, str):
+            for r, vals in enumerate(self.get_all_values(), start=1):
+                if in_row is not None and r != in_row:
+                    continue
+                for c, v in enumerate(vals, start=1):
+                    if in_column is not None and c != in_column:
+                        continue
+                    text = str(v)
+                    if (text == query) if case_sensitive else (text.lower() == str(query).lower()):
+                        return Cell(r, c, text)
+            return None
+        if in_column > self.col_count:
+            return None
+        with self.spreadsheet.lock:
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_c{in_column} ON {self.table} (c{in_column})")
+            # Números são gravados como números: procura também pelo valor numérico
+            candidates = [query]
+            try:
+                candidates.append(float(query))
+            except ValueError:
+                pass
+            marks = ", ".join("?" * len(candidates))
+            row = self._conn.execute(
+                f"SELECT r, c{in_column} FROM {self.table} WHERE c{in_column} IN ({marks}) ORDER BY r LIMIT 1", candidates
+            ).fetchone()
+        return Cell(row[0], in_column, _formatted(row[1])) if row else None
+
+    # ---------- escrita ----------
+
+    def _ensure_size(self, rows, cols):
+        """Aumenta a grade (e as colunas da tabela) se a escrita passar do tamanho atual."""
+        row_count, col_count = self.row_count, self.col_count
+        for c in range(col_count + 1, cols + 1):
+            self._conn.execute(f"ALTER TABLE {self.table} ADD COLUMN c{c}")
+        if rows > row_count or cols > col_count:
+            self._conn.execute("UPDATE _abas SET rows = ?, cols = ? WHERE id = ?",
+                               (max(rows, row_count), max(cols, col_count), self.id))
+
+    def _write_block(self, start_row, start_col, values):
+        values = [list(v) for v in values]
+        if not values:
+            return
+        width = max(len(v) for v in values)
+        self._ensure_size(start_row + len(values) - 1, start_col + width - 1)
+        columns = [f"c{c}" for c in range(start_col, start_col + width)]
+        self._conn.executemany(f"INSERT OR IGNORE INTO {self.table} (r) VALUES (?)",
+                               [(start_row + i,) for i in range(len(values))])
+        assignments = ", ".join(f"{c} = ?" for c in columns)
+        params = []
+        for i, row in enumerate(values):
+            row = [None if _is_empty(v) else v for v in row] + [None] * (width - len(row))
+            params.append(row + [start_row + i])
+        self._conn.executemany(f"UPDATE {self.table} SET {assignments} WHERE r = ?", params)
+
+    def _range_start(self, range_name):
+        grid = a1_range_to_grid_range(range_name or "A1")
+        return grid.get("startRowIndex", 0) + 1, grid.get("startColumnIndex", 0) + 1
+
+    def update(self, values=None, range_name=None, **kwargs):
+        # Aceita também a ordem antiga do gspread: update("A1", [[...]])
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        start_row, start_col = self._range_start(range_name)
+        with self.spreadsheet.lock:
+            self._conn.execute("BEGIN")
+            self._write_block(start_row, start_col, values)
+            self._conn.execute("COMMIT")
+        return {}
+
+    def batch_update(self, data, **kwargs):
+        with self.spreadsheet.lock:
+            self._conn.execute("BEGIN")
+            for item in data:
+                start_row, start_col = self._range_start(item["range"])
+                self._write_block(start_row, start_col, item["values"])
+            self._conn.execute("COMMIT")
+        return {}
+
+    def update_cell(self, row, col, value):
+        return self.update([[value]], rowcol_to_a1(row, col))
+
+    def append_row(self, values, **kwargs):
+        """Grava na linha seguinte à última linha com dados (como o append do Sheets)."""
+        last_row = len(self.get_all_values())
+        return self.update([values], rowcol_to_a1(last_row + 1, 1))
+
+    def batch_clear(self, ranges):
+        with self.spreadsheet.lock:
+            self._conn.execute("BEGIN")
+            for range_name in ranges:
+                grid = a1_range_to_grid_range(range_name)
+                r0, r1 = grid.get("startRowIndex", 0) + 1, grid.get("endRowIndex", self.row_count)
+                c0, c1 = grid.get("startColumnIndex", 0) + 1, min(grid.get("endColumnIndex", self.col_count), self.col_count)
+                if c1 >= c0:
+                    assignments = ", ".join(f"c{c} = NULL" for c in range(c0, c1 + 1))
+                    self._conn.execute(f"UPDATE {self.table} SET {assignments} WHERE r BETWEEN ? AND ?", (r0, r1))
+            self._conn.execute("COMMIT")
+        return {}
+
+    def clear(self):
+        with self.spreadsheet.lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+        return {}
+
+    def resize(self, rows=None, cols=None):
+        with self.spreadsheet.lock:
+            self._ensure_size(rows or self.row_count, cols or self.col_count)
+            if rows is not None and rows < self.row_count:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE r > ?", (rows,))
+                self._conn.execute("UPDATE _abas SET rows = ? WHERE id = ?", (rows, self.id))
+            if cols is not None and cols < self.col_count:
+                # Como no Sheets, diminuir a grade apaga as colunas (e os valores) do fim
+                for c in range(self.col_count, cols, -1):
+                    self._conn.execute(f"ALTER TABLE {self.table} DROP COLUMN c{c}")
+                self._conn.execute("UPDATE _abas SET cols = ? WHERE id = ?", (cols, self.id))
+        return {}
+
+def open_local(path=DEFAULT_SQLITE_PATH):
+    """Abre (ou cria) a planilha local em SQLite."""
+    return LocalSpreadsheet(path)
+
+def import_worksheets(source, target, titles=WORKSHEET_TITLES):
+    """
+    Copia as abas `titles` de uma planilha (ex.: a do Google Sheets) para outra
+    (ex.: a local), para rodar a aplicação offline com os dados atuais.
+    Os valores vão sem formatação (números continuam números).
+    """
+    for title in titles:
+        try:
+            ws_source = source.worksheet(title)
+        except gspread.WorksheetNotFound:
+            continue
+        values = ws_source.get_all_values(value_render_option=ValueRenderOption.unformatted)
+        try:
+            target.del_worksheet(target.worksheet(title))
+        except gspread.WorksheetNotFound:
+            pass
+        n_cols = max([len(r) for r in values] + [1])
+        ws_target = target.add_worksheet(title=title, rows=max(len(values), 1), cols=n_cols)
+        if values:
+            ws_target.update(values, "A1")
+
+def describe_backend(secrets=None):
+    """Texto curto para a página de configurações."""
+    name = backend_name(secrets)
+    if name == "sqlite":
+        return f"Armazenamento local (SQLite): {Path(sqlite_path(secrets)).resolve()}"
+    if name == "fake":
+        return "Armazenamento simulado em memória (fake_google): os dados somem ao reiniciar o servidor"
+    return "Armazenamento: Google Sheets (planilha listagem_empenhos)"
@@ -0,0 +1,36 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import auth_manager  # noqa: E402
+import sheets_client  # noqa: E402
+
+ADMIN_PASSWORD = "senha-de-teste"
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    """Repetições sem a espera exponencial (as cotas e os erros continuam valendo)."""
+    monkeypatch.setattr(sheets_client, "MAX_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(sheets_client, "random", SimpleNamespace(random=lambda: 0.0))
+
+@pytest.fixture
+def fake_backend(monkeypatch, no_backoff):
+    """
+    Aplicação ligada ao fake_google com latência e 20% de erros 429/503 injetados.
+    Retorna o FaultInjector compartilhado pela planilha e pelo Drive simulados.
+    Cada teste começa com as cotas do QuotaClient cheias.
+    """
+    monkeypatch.setenv("EMPENHOS_STORAGE_BACKEND", "fake")
+    monkeypatch.setenv("EMPENHOS_FAKE_EMPENHOS", "200")
+    monkeypatch.setenv("EMPENHOS_FAKE_LATENCY_MS", "2")
+    monkeypatch.setenv("EMPENHOS_FAKE_ERROR_RATE", "0.2")
+    monkeypatch.setenv("EMPENHOS_FAKE_ADMIN_PASSWORD", ADMIN_PASSWORD)
+    auth_manager._conexao.clear()
+    auth_manager._configuracoes.clear()
+    monkeypatch.setattr(sheets_client, "CLIENT", sheets_client.QuotaClient())
+    yield auth_manager._conexao()["sh"]._target._faults
+    auth_manager._conexao.clear()
+    auth_manager._configuracoes.clear()
@@ -0,0 +1,76 @@
+import json
+
+import gspread
+import requests
+from gspread.http_client import HTTPClient
+from gspread.urls import DRIVE_FILES_API_V3_URL
+
+import auth_manager
+import sheets_client
+
+class _Sessao:
+    """Sessão HTTP do gspread sem rede: devolve as respostas da fila e registra os pedidos."""
+
+    def __init__(self, *respostas):
+        self.respostas = list(respostas)
+        self.pedidos = []
+
+    def request(self, method, url, params=None, **kwargs):
+        self.pedidos.append((method, url, params))
+        status, corpo = self.respostas.pop(0)
+        resposta = requests.Response()
+        resposta.status_code = status
+        resposta._content = json.dumps(corpo).encode()
+        return resposta
+
+def _planilha(*respostas):
+    """gspread.Spreadsheet de verdade (a abertura lê os metadados) sobre a sessão simulada."""
+    sessao = _Sessao((200, {"properties": {"title": "listagem_empenhos"}}), *respostas)
+    sh = gspread.Spreadsheet(HTTPClient(auth=None, session=sessao), {"id": "planilha-1"})
+    return sheets_client.QuotaClient().wrap_spreadsheet(sh), sessao
+
+def test_revisao_pelo_drive(no_backoff, monkeypatch):
+    monkeypatch.setattr(sheets_client, "CLIENT", sheets_client.QuotaClient())
+    sh, sessao = _planilha((503, {"error": {"code": 503, "message": "indisponível"}}), (200, {"version": "42"}))
+
+    assert auth_manager.revisao_planilha(sh) == "42"
+    metodo, url, params = sessao.pedidos[-1]
+    assert (metodo, url) == ("get", f"{DRIVE_FILES_API_V3_URL}/planilha-1")
+    assert params["fields"] == "version,modifiedTime"
+    # Pelo controle de cota do Drive, com a repetição do 503
+    assert sheets_client.CLIENT.stats().loc[sheets_client.DRIVE, ["chamadas", "repetidas"]].tolist() == [2, 1]
+
+def test_revisao_indisponivel(no_backoff):
+    sh, _ = _planilha((403, {"error": {"code": 403, "message": "sem permissão"}}))
+    assert auth_manager.revisao_planilha(sh) is None
+
+def test_configuracao_editada_na_planilha_e_relida_pela_revisao(fake_backend, monkeypatch):
+    fake_backend.error_rate = 0
+    monkeypatch.setattr(auth_manager, "CONFIG_CHECK_INTERVAL_SECONDS", 0)
+    monkeypatch.setattr(auth_manager, "CONFIG_TTL_SECONDS", 3600)  # o TTL sozinho não pegaria a edição
+    assert auth_manager.obter_configuracao("DRIVE_FOLDER_ID") == "fake-pasta"
+    leituras = fake_backend.calls.get("get_all_records", 0)
+
+    # Sem edição: a revisão não mudou e a aba não é relida
+    assert auth_manager.obter_configuracao("DRIVE_FOLDER_ID") == "fake-pasta"
+    assert fake_backend.calls.get("get_all_records", 0) == leituras
+
+    # Edição feita direto na planilha (por fora da aplicação)
+    ws = auth_manager._conexao()["sh"]._target.worksheet("configuracoes")
+    linha = ws.col_values(1).index("DRIVE_FOLDER_ID") + 1
+    ws.update_cell(linha, 2, "outra-pasta")
+    assert auth_manager.obter_configuracao("DRIVE_FOLDER_ID") == "outra-pasta"
+
+def test_aba_guardada_reconecta_quando_a_autenticacao_expira(fake_backend, monkeypatch):
+    ws = auth_manager.obter_aba("configuracoes")
+    conexao = auth_manager._conexao()
+    erros = [401]
+
+    def before_call(name, error_factory):
+        if erros:
+            raise error_factory(erros.pop(0), "credencial expirada")
+    monkeypatch.setattr(fake_backend, "before_call", before_call)
+
+    assert ws.get_all_values()[0] == ["Chave", "Valor"]
+    assert auth_manager._conexao() is not conexao  # autenticou e abriu a planilha de novo
+    assert not erros
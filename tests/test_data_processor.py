@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from data_processor import STATUS_WARNING_DAYS, compute_status
+
+HOJE = pd.Timestamp("2026-03-10")
+
+def _status(prazo, saldo="100", valor="100", today=HOJE):
+    return compute_status(pd.Series([saldo]), pd.Series([valor]), [prazo], today=today).iloc[0]
+
+@pytest.mark.parametrize("dias, esperado", [
+    (-30, "Vencido"),
+    (-1, "Vencido"),
+    (0, "Vence em 0 dias"),
+    (1, "Vence em 1 dias"),
+    (STATUS_WARNING_DAYS, f"Vence em {STATUS_WARNING_DAYS} dias"),
+    (STATUS_WARNING_DAYS + 1, "No Prazo"),
+    (90, "No Prazo"),
+])
+def test_status_pelo_prazo(dias, esperado):
+    assert _status(HOJE + pd.Timedelta(days=dias)) == esperado
+
+def test_prazo_conta_dias_inteiros_para_baixo():
+    # Às 10h do dia do prazo, (prazo - hoje) já é negativo: vencido
+    assert _status(HOJE, today=HOJE + pd.Timedelta(hours=10)) == "Vencido"
+    assert _status(HOJE + pd.Timedelta(days=1), today=HOJE + pd.Timedelta(hours=10)) == "Vence em 0 dias"
+
+@pytest.mark.parametrize("prazo", [None, "", "não é data"])
+def test_prazo_invalido(prazo):
+    assert _status(prazo) == "Data Inválida"
+
+@pytest.mark.parametrize("saldo, valor, esperado", [
+    ("50", "100", "Em execução"),        # pago em parte
+    ("100", "100", "Vencido"),           # nada pago: vale o prazo
+    ("0", "100", "Vencido"),             # sem saldo: vale o prazo
+    ("0,005", "100", "Vencido"),         # saldo abaixo de 1 centavo conta como zero
+    ("100,005", "100", "Vencido"),       # diferença abaixo de 1 centavo conta como igual
+    ("1.234,56", "2.000,00", "Em execução"),
+])
+def test_em_execucao_tem_prioridade_sobre_o_prazo(saldo, valor, esperado):
+    assert _status(HOJE - pd.Timedelta(days=10), saldo=saldo, valor=valor) == esperado
+
+def test_em_execucao_sem_prazo():
+    assert _status(None, saldo="50", valor="100") == "Em execução"
+
+def test_today_aceita_data_e_texto():
+    prazo = HOJE + pd.Timedelta(days=2)
+    assert _status(prazo, today="2026-03-10") == _status(prazo, today=HOJE.date()) == "Vence em 2 dias"
+
+def test_varias_linhas_mantem_o_indice():
+    saldo = pd.Series(["100", "50", "100"], index=[7, 8, 9])
+    status = compute_status(saldo, saldo.where(saldo != "50", "100"),
+                            pd.Series([HOJE, HOJE, None], index=[7, 8, 9]), today=HOJE)
+    assert status.to_dict() == {7: "Vence em 0 dias", 8: "Em execução", 9: "Data Inválida"}
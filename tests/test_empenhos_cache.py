@@ -0,0 +1,102 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import auth_manager
+import data_processor
+import numeric_parser
+import sheets_writer
+import write_queue
+from column_reader import ColumnReader
+from empenho_index import EmpenhoIndex
+from empenhos_cache import EmpenhosCache, as_sheet_text
+from test_fake_google import _planilha
+
+def _ler(ws):
+    """Base como o painel monta numa leitura completa da aba (valores formatados)."""
+    return data_processor.categorize_columns(_planilha(ws).rename(columns=str.strip))
+
+def _numeros(df, coluna):
+    return numeric_parser.to_float_or_zero(df[coluna]).to_numpy()
+
+@pytest.mark.parametrize("valor", [1234.5, 1000.0, 0.1 + 0.2, 98765.43])
+def test_texto_da_base_corrigida_e_da_leitura_em_pt_br_dao_o_mesmo_numero(valor):
+    # Leitura numa planilha em português: vírgula decimal, sem separador de milhar no formato automático
+    lido = pd.Series([as_sheet_text(pd.DataFrame({"v": [valor]}))["v"][0], f"{valor:.2f}".replace(".", ",")])
+    assert numeric_parser.to_float_or_zero(lido).tolist() == pytest.approx([valor, valor], abs=0.005)
+
+def test_gravacao_e_patch_equivalem_a_reler_a_planilha(fake_backend):
+    fake_backend.error_rate = 0
+    ws = auth_manager.obter_aba("emp_controle")
+
+    # Como em gravar_emp_controle: planilha final com números (float) vindos da mesclagem
+    df = _planilha(ws)
+    df["valorEmpenho"] = np.linspace(0.1, 5000.5, len(df)) + 0.2
+    df["saldoPagar"] = df["valorEmpenho"].round(0)
+    sheets_writer.write_dataframe(ws, df)
+    cache = EmpenhosCache()
+    cache.replace(data_processor.categorize_columns(as_sheet_text(df)))
+
+    # Como em gravar_fila: edições gravadas e corrigidas na base em memória
+    fila = write_queue.WriteQueue()
+    fila.add("1003", write_queue.CAMPO_OBSERVACAO, "conferido")
+    fila.add("1010", write_queue.CAMPO_ANEXO, "http://anexo")
+    resumo, _ = fila.flush(ws, EmpenhoIndex.from_reader(ColumnReader(ws)))
+    assert cache.patch_many(resumo["alteracoes"]) == 2
+
+    relido = _ler(ws)
+    corrigido = cache.get(lambda: pytest.fail("a base corrigida não deve ser relida"))
+    assert list(corrigido.columns) == list(relido.columns)
+    assert corrigido.dtypes.equals(relido.dtypes)
+    for coluna in ("valorEmpenho", "saldoPagar"):
+        assert _numeros(corrigido, coluna) == pytest.approx(_numeros(relido, coluna), abs=1e-9)
+    texto = [c for c in relido.columns if c not in ("valorEmpenho", "saldoPagar")]
+    pd.testing.assert_frame_equal(corrigido[texto], relido[texto])
+
+def test_releitura_em_andamento_e_descartada_depois_de_um_patch():
+    base = pd.DataFrame({"numeroEmpenho": ["1", "2"], "Observação": ["", ""]}, dtype=object)
+    cache = EmpenhosCache(check_interval_seconds=0)
+    cache.seed(lambda: base, revision=1)
+    iniciou, liberar = threading.Event(), threading.Event()
+
+    def releitura():
+        iniciou.set()
+        liberar.wait(5)
+        return base.copy()  # leitura feita antes da nossa gravação: ainda sem a observação
+
+    cache.get(releitura, revision_fn=lambda: 2)  # revisão mudou: relê em segundo plano
+    assert iniciou.wait(5)
+    assert cache.patch("2", "Observação", "conferido")
+    liberar.set()
+    while cache.refreshing:
+        time.sleep(0.01)
+
+    assert cache.df["Observação"].tolist() == ["", "conferido"]
+    assert cache.revision == 1  # a releitura descartada não marca a revisão como vista
+    assert cache.last_error is None
+
+def _cache_na_revisao(revisao):
+    cache = EmpenhosCache()
+    cache.seed(lambda: pd.DataFrame({"numeroEmpenho": ["1"], "Observação": [""]}), revision=revisao)
+    return cache
+
+def test_revisao_da_nossa_gravacao_e_adotada():
+    cache = _cache_na_revisao(5)
+    cache.patch("1", "Observação", "conferido")
+    cache.mark_revision(6, before=5)
+    assert cache.revision == 6 and cache.df is not None
+
+def test_alteracao_por_fora_antes_da_gravacao_descarta_a_base():
+    cache = _cache_na_revisao(5)
+    cache.patch("1", "Observação", "conferido")
+    cache.mark_revision(7, before=6)  # a 6 não é nossa: alguém editou depois da nossa leitura
+    assert cache.df is None
+
+def test_sem_revisao_vale_o_ttl():
+    cache = _cache_na_revisao(5)
+    cache.mark_revision(None, before=5)
+    cache.mark_revision(6, before=None)
+    assert cache.revision == 5 and cache.df is not None
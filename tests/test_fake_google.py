@@ -0,0 +1,165 @@
+"""
+Fluxos da aplicação contra o Google Sheets/Drive simulado (fake_google), com latência e
+erros 429/503 injetados: login, edição de observação e anexo, mesclagem + gravação da
+base e a política de repetição do sheets_client.
+
+    python -m pytest -q tests
+"""
+import pandas as pd
+import pytest
+
+import auth_manager
+import fake_google
+import merge_engine
+import sheets_client
+import sheets_writer
+import write_queue
+from column_reader import ColumnReader
+from conftest import ADMIN_PASSWORD
+from empenho_index import EmpenhoIndex
+
+def _planilha(ws):
+    values = ws.get_all_values()
+    return pd.DataFrame(values[1:], columns=values[0])
+
+def test_login(fake_backend):
+    abas = auth_manager.carregar_abas_iniciais()
+    assert set(abas) == {"usuarios", "configuracoes"}
+    usuarios = auth_manager.registros_de_valores(abas["usuarios"])
+
+    assert auth_manager.verificar_login("admin", "errada", registros=usuarios)[0] is False
+    # Senha provisória da base de exemplo: troca obrigatória no primeiro acesso
+    assert auth_manager.verificar_login("admin", ADMIN_PASSWORD, registros=usuarios) == (True, "Administrador", "", True)
+    assert auth_manager.verificar_login("admin", ADMIN_PASSWORD) == (True, "Administrador", "", True)
+    assert auth_manager.obter_configuracao("DRIVE_FOLDER_ID") == "fake-pasta"
+
+def test_login_errado_nao_baixa_a_base(fake_backend):
+    fake_backend.error_rate = 0
+    abas = auth_manager.carregar_abas_iniciais()
+    sucesso = auth_manager.verificar_login("admin", "errada", registros=auth_manager.registros_de_valores(abas["usuarios"]))[0]
+    assert not sucesso
+    assert fake_backend.calls == {"values_batch_get": 1}
+
+def test_salvar_observacao_e_anexo(fake_backend):
+    ws = auth_manager.obter_aba("emp_controle")
+    indice = EmpenhoIndex.from_reader(ColumnReader(ws))
+
+    # Anexo: upload no Drive (create só é repetido em 429, então sem erros injetados aqui)
+    fake_backend.error_rate = 0
+    link, erro = auth_manager.upload_para_drive(b"%PDF", "nota.pdf", "application/pdf", "fake-pasta")
+    fake_backend.error_rate = 0.2
+    assert erro is None and link
+
+    fila = write_queue.WriteQueue()
+    fila.add("1003", write_queue.CAMPO_OBSERVACAO, "conferido")
+    fila.add("1007", write_queue.CAMPO_ANEXO, link)
+    fila.add("999999", write_queue.CAMPO_OBSERVACAO, "não existe")
+    resumo, _ = fila.flush(ws, indice)
+
+    assert resumo["gravados"] == 2 and resumo["nao_encontrados"] == ["999999"]
+    df = _planilha(ws).set_index("numeroEmpenho")
+    assert df.loc["1003", "Observação"] == "conferido"
+    assert df.loc["1007", "Anexo"] == link
+    assert fila.status("1003") == write_queue.SALVO
+    assert fila.status("999999") == write_queue.ERRO
+
+def test_mesclagem_e_gravacao(fake_backend):
+    ws = auth_manager.obter_aba("emp_controle")
+    ws.update_cell(3, 11, "observação mantida")  # empenho 1001
+    existente = _planilha(ws)
+
+    upload = existente.drop(columns=["Observação", "Anexo"]).head(50).copy()
+    upload.loc[1, "saldoPagar"] = "123.45"               # 1001: atualizado
+    upload.loc[2, ["valorEmpenho", "saldoPagar"]] = "0"  # 1002: zerado, sai da base
+    novo = upload.iloc[[0]].assign(numeroEmpenho="900001", saldoPagar="10")
+    upload = pd.concat([upload, novo], ignore_index=True)
+
+    df_final, _ = merge_engine.merge_upload(upload, existente)
+    sheets_writer.write_dataframe(ws, df_final)
+
+    gravado = _planilha(ws).set_index("numeroEmpenho")
+    assert "1002" not in gravado.index and "900001" in gravado.index
+    assert gravado.loc["1001", "saldoPagar"] == "123.45"
+    assert gravado.loc["1001", "Observação"] == "observação mantida"
+    assert len(gravado) == len(df_final)
+    # Todo erro injetado foi repetido (nenhum chegou a falhar de vez)
+    stats = sheets_client.CLIENT.stats()
+    assert stats["erros"].sum() == 0
+    assert stats["repetidas"].sum() == fake_backend.errors
+
+def test_leituras_repetidas_com_erros_injetados(fake_backend):
+    ws = auth_manager.obter_aba("emp_controle")
+    esperado = ws.get_all_values()
+    for _ in range(40):
+        assert ws.get_all_values() == esperado
+    stats = sheets_client.CLIENT.stats()
+    assert fake_backend.errors > 0
+    assert stats.loc[sheets_client.LEITURA, "repetidas"] == fake_backend.errors
+
+class _Instavel:
+    """Aba que aplica a escrita e depois responde com `erros` falhas (o 5xx não garante que nada foi gravado)."""
+
+    def __init__(self, erros):
+        self.erros = list(erros)
+        self.linhas = []
+
+    def _responder(self):
+        if self.erros:
+            raise fake_google._api_error(self.erros.pop(0), "falha simulada")
+
+    def append_row(self, values, **kwargs):
+        self.linhas.append(values)
+        self._responder()
+
+    def update(self, values, range_name=None, **kwargs):
+        self.linhas = [values]
+        self._responder()
+
+@pytest.mark.parametrize("erro, tentativas", [(503, 1), (429, 2)])
+def test_append_so_e_repetido_em_429(no_backoff, erro, tentativas):
+    ws = sheets_client.WorksheetProxy(_Instavel([erro]), sheets_client.QuotaClient())
+    if erro == 503:
+        with pytest.raises(Exception):
+            ws.append_row(["x"])
+    else:
+        ws.append_row(["x"])
+    assert len(ws._target.linhas) == tentativas
+
+def test_update_e_repetido_em_5xx(no_backoff):
+    client = sheets_client.QuotaClient()
+    ws = sheets_client.WorksheetProxy(_Instavel([503, 502]), client)
+    ws.update([["x"]], "A1")
+    assert ws._target.linhas == [[["x"]]]
+    assert client.stats().loc[sheets_client.ESCRITA, "repetidas"] == 2
+
+@pytest.mark.parametrize("erro, tentativas", [(503, 1), (429, 2)])
+def test_upload_no_drive_so_e_repetido_em_429(no_backoff, monkeypatch, erro, tentativas):
+    drive = fake_google.FakeDrive()
+    erros = [erro]
+
+    def before_call(name, error_factory):
+        drive.faults.calls[name] = drive.faults.calls.get(name, 0) + 1
+        if erros:
+            raise error_factory(erros.pop(0), "falha simulada")
+    monkeypatch.setattr(drive.faults, "before_call", before_call)
+
+    request = sheets_client.QuotaClient().wrap_drive(drive).files().create(body={"name": "a"})
+    if erro == 503:
+        with pytest.raises(Exception):
+            request.execute()
+    else:
+        request.execute()
+    assert drive.faults.calls["drive.files.create"] == tentativas
+
+def test_exclusao_no_drive_e_repetida_em_5xx(no_backoff, monkeypatch):
+    drive = fake_google.FakeDrive()
+    file_id = drive.files().create(body={"name": "a"}).execute()["id"]
+    erros = [503]
+
+    def before_call(name, error_factory):
+        if erros:
+            raise error_factory(erros.pop(0), "falha simulada")
+    monkeypatch.setattr(drive.faults, "before_call", before_call)
+
+    sheets_client.QuotaClient().wrap_drive(drive).files().delete(fileId=file_id).execute()
+    assert file_id not in drive.stored
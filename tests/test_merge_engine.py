@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+import merge_engine
+
+DEP = merge_engine.COL_DEPARTAMENTO
+
+def _upload(*linhas):
+    """Linhas (empenho, saldo, status, departamento) no formato do organize_sheet."""
+    return pd.DataFrame(linhas, columns=["numeroEmpenho", "saldoPagar", "Status", DEP])
+
+def _base(*linhas):
+    """Linhas (empenho, saldo, status, departamento, observação, anexo) como vêm do Sheets."""
+    return pd.DataFrame(linhas, columns=["numeroEmpenho", "saldoPagar", "Status", DEP, "Observação", "Anexo"])
+
+def test_base_vazia_grava_so_os_ativos():
+    df, resumo = merge_engine.merge_upload(_upload(("1", "10", "No Prazo", "A"), ("2", "0", "Vencido", "A")), pd.DataFrame())
+    assert df["numeroEmpenho"].tolist() == ["1"]
+    assert resumo == {"base_vazia": True, "novos": 1, "atualizados": 0, "preservados": 0,
+                      "removidos": 0, "zerados_descartados": 1, "total": 1}
+
+def test_atualiza_preservando_observacao_e_anexo():
+    base = _base(("1", "10", "No Prazo", "A", "conferido", "http://anexo"), ("2", "20", "No Prazo", "B", "", ""))
+    df, resumo = merge_engine.merge_upload(_upload(("1.0", "5", "Em execução", "A"), ("3", "30", "No Prazo", "C")), base)
+    df = df.set_index("numeroEmpenho")
+    assert df.index.tolist() == ["1.0", "3", "2"]  # upload na ordem do arquivo, depois a base
+    assert df.loc["1.0", "saldoPagar"] == "5"
+    assert (df.loc["1.0", "Observação"], df.loc["1.0", "Anexo"]) == ("conferido", "http://anexo")
+    assert (df.loc["3", "Observação"], df.loc["3", "Anexo"]) == ("", "")
+    assert (resumo["novos"], resumo["atualizados"], resumo["preservados"]) == (1, 1, 1)
+
+def test_empenho_repetido_na_base_vale_a_ultima_linha_na_posicao_da_primeira():
+    base = _base(("1", "10", "No Prazo", "A", "antiga", ""),
+                 ("2", "20", "No Prazo", "B", "", ""),
+                 ("1", "15", "No Prazo", "A", "nova", ""))
+    df, resumo = merge_engine.merge_upload(_upload(("9", "1", "No Prazo", "A")), base)
+    assert df["numeroEmpenho"].tolist() == ["9", "1", "2"]
+    assert df.loc[1, ["saldoPagar", "Observação"]].tolist() == ["15", "nova"]
+    assert resumo["preservados"] == 2
+
+def test_upload_zerado_remove_o_empenho_da_base():
+    base = _base(("1", "10", "No Prazo", "A", "conferido", ""), ("2", "20", "No Prazo", "B", "", ""))
+    df, resumo = merge_engine.merge_upload(_upload(("1", "0,00", "No Prazo", "A")), base)
+    assert df["numeroEmpenho"].tolist() == ["2"]
+    assert (resumo["zerados_descartados"], resumo["removidos"], resumo["preservados"]) == (1, 1, 1)
+
+def test_linha_da_base_com_saldo_zerado_sai():
+    base = _base(("1", "0", "No Prazo", "A", "", ""), ("2", "20", "No Prazo", "B", "", ""))
+    df, resumo = merge_engine.merge_upload(_upload(("3", "30", "No Prazo", "C")), base)
+    assert df["numeroEmpenho"].tolist() == ["3", "2"]
+    assert (resumo["removidos"], resumo["total"]) == (1, 2)
+
+def test_sem_colunas_obrigatorias():
+    with pytest.raises(ValueError, match="arquivo enviado"):
+        merge_engine.merge_upload(pd.DataFrame({"numeroEmpenho": ["1"]}), pd.DataFrame())
+    with pytest.raises(ValueError, match="Google Sheets"):
+        merge_engine.merge_upload(_upload(("1", "10", "No Prazo", "A")), pd.DataFrame({"saldoPagar": ["1"]}))
+
+def test_preview_conta_alteracoes_e_saldo_por_departamento():
+    base = _base(("1", "10", "No Prazo", "A", "", ""),
+                 ("2", "20", "No Prazo", "B", "", ""),
+                 ("3", "30", "No Prazo", "B", "", ""))
+    upload = _upload(("1", "10", "Vencido", "A"),    # só o status muda
+                     ("2", "20", "No Prazo", "B"),   # igual
+                     ("3", "0", "No Prazo", "B"),    # zerado: sai
+                     ("4", "40", "No Prazo", "C"))   # novo
+    df, resumo, diferencas = merge_engine.preview_merge(upload, base)
+
+    assert (resumo["novos"], resumo["atualizados"], resumo["com_alteracao"], resumo["removidos"]) == (1, 2, 1, 1)
+    assert resumo["zerados_descartados"] == 1
+    saldo = diferencas["saldo_por_departamento"]
+    assert saldo["Variação"].to_dict() == {"C": 40.0, "B": -30.0}
+    assert saldo.loc["B", ["Saldo antes", "Saldo depois"]].tolist() == [50.0, 20.0]
+    amostra = diferencas["amostra"]
+    assert amostra[["Situação", "Empenho"]].values.tolist() == [["alterado", "1"], ["novo", "4"]]
+    assert amostra.loc[0, ["Status anterior", "Status novo"]].tolist() == ["No Prazo", "Vencido"]
@@ -0,0 +1,100 @@
+import pandas as pd
+import pytest
+from gspread.utils import ValueRenderOption
+
+import auth_manager
+import sheets_writer
+import storage
+from test_fake_google import _planilha
+
+@pytest.fixture
+def gravacoes(fake_backend, monkeypatch):
+    """Aba emp_controle do fake_google sem erros injetados; registra o que cada batch_update recebeu."""
+    fake_backend.error_rate = 0
+    registro = {"planilha": [], "celulas": []}
+
+    def espiar(cls, destino):
+        original = cls.batch_update
+
+        def batch_update(self, body, **kwargs):
+            registro[destino].append(body)
+            return original(self, body, **kwargs)
+        monkeypatch.setattr(cls, "batch_update", batch_update)
+    espiar(storage.LocalSpreadsheet, "planilha")
+    espiar(storage.LocalWorksheet, "celulas")
+    return auth_manager.obter_aba("emp_controle"), registro
+
+def _gravar(ws, df):
+    old_rows = ws.get_all_values(value_render_option=ValueRenderOption.unformatted)
+    resumo = sheets_writer.write_dataframe(ws, df, old_rows=old_rows)
+    assert _planilha(ws).equals(df)
+    return resumo
+
+def test_remocao_apaga_a_linha_e_grava_so_a_celula_alterada(gravacoes):
+    ws, registro = gravacoes
+    df = _planilha(ws)
+    df = df.drop(index=5).reset_index(drop=True)   # empenho 1005 saiu
+    df.loc[100, "saldoPagar"] = "1,23"
+
+    resumo = _gravar(ws, df)
+
+    assert (resumo["celulas_alteradas"], resumo["linhas_removidas"], resumo["linhas_novas"], resumo["chamadas"]) == (1, 1, 0, 2)
+    assert registro["planilha"] == [{"requests": [{"deleteDimension": {"range": {
+        "sheetId": ws.id, "dimension": "ROWS", "startIndex": 6, "endIndex": 7}}}]}]
+    assert registro["celulas"] == [[{"range": "G102:G102", "values": [["1,23"]]}]]
+
+def test_empenho_novo_no_meio_e_inserido(gravacoes):
+    ws, registro = gravacoes
+    df = _planilha(ws)
+    novos = df.iloc[[10, 11]].assign(numeroEmpenho=["900001", "900002"])
+    df = pd.concat([df.iloc[:10], novos, df.iloc[10:]], ignore_index=True)
+
+    resumo = _gravar(ws, df)
+
+    assert (resumo["linhas_novas"], resumo["linhas_removidas"], resumo["chamadas"]) == (2, 0, 2)
+    assert registro["planilha"][0]["requests"] == [{"insertDimension": {"range": {
+        "sheetId": ws.id, "dimension": "ROWS", "startIndex": 11, "endIndex": 13}, "inheritFromBefore": True}}]
+    # Só as linhas inseridas são gravadas (células vazias já estão vazias na linha em branco)
+    assert resumo["celulas_alteradas"] == int((novos != "").to_numpy().sum())
+
+def test_empenhos_em_outra_ordem_comparam_por_posicao(gravacoes):
+    ws, registro = gravacoes
+    df = _planilha(ws)
+    df = df.iloc[[1, 0] + list(range(2, len(df) - 1))].reset_index(drop=True)
+
+    resumo = _gravar(ws, df)
+
+    assert registro["planilha"] == []
+    assert resumo["linhas_removidas"] == 1
+
+def test_staging_retoma_do_ultimo_bloco_depois_de_uma_falha(gravacoes, monkeypatch, tmp_path):
+    ws, _ = gravacoes
+    monkeypatch.setattr(sheets_writer, "CHECKPOINT_DIR", tmp_path)
+    rows = [["numeroEmpenho", "saldoPagar"]] + [[str(2000 + i), str(i)] for i in range(120)]
+    blocos = []
+    original = storage.LocalWorksheet.update
+
+    def update(self, values=None, range_name=None, **kwargs):
+        if self.title.endswith(sheets_writer.STAGING_SUFFIX) and len(blocos) == 2:
+            blocos.append("falhou")
+            raise storage.UnsupportedRequestError("falha no meio da gravação")
+        blocos.append(range_name)
+        return original(self, values, range_name, **kwargs)
+    monkeypatch.setattr(storage.LocalWorksheet, "update", update)
+
+    with pytest.raises(storage.UnsupportedRequestError):
+        sheets_writer.replace_via_staging(ws, rows, chunk_rows=50)
+    assert blocos == ["A1", "A51", "falhou"]
+    assert ws.get_all_values()[1][1] == "1000"  # a aba original continua intacta
+
+    nova, chamadas = sheets_writer.replace_via_staging(ws, rows, chunk_rows=50)
+    assert blocos[3:] == ["A101"]  # só o bloco que faltava
+    assert chamadas == 2           # o bloco + a troca das abas
+    assert nova.title == "emp_controle" and nova.get_all_values() == rows
+    assert [a.title for a in nova.spreadsheet.worksheets()].count("emp_controle__staging") == 0
+    assert list(tmp_path.iterdir()) == []
+
+def test_staging_avisa_que_a_aba_foi_recriada():
+    texto = sheets_writer.describe_write({"modo": "staging", "celulas_alteradas": 10, "chamadas": 3,
+                                          "linhas_novas": 0, "linhas_removidas": 0})
+    assert "#gid=" in texto and "protegidos" in texto
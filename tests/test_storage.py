@@ -0,0 +1,91 @@
+import gspread
+import pytest
+from gspread.utils import ValueRenderOption, a1_range_to_grid_range
+
+import storage
+
+VALORES = [
+    ["numeroEmpenho", "saldoPagar", "Histórico", "Observação"],
+    ["1000", 1234.5, "compra", ""],
+    ["1001", 10.0, "", "conferido"],
+    ["", "", "", ""],
+    ["1003", 0, "serviço", ""],
+]
+
+@pytest.fixture
+def planilha(tmp_path):
+    sh = storage.open_local(tmp_path / "empenhos.db")
+    ws = sh.add_worksheet("emp_controle", rows=10, cols=4)
+    ws.update(VALORES, "A1")
+    return sh
+
+def _referencia(values, range_name):
+    """Recorte de get_all_values como a API devolve o intervalo (sem células/linhas vazias no fim)."""
+    grid = a1_range_to_grid_range(range_name)
+    rows = [row[grid.get("startColumnIndex", 0):grid.get("endColumnIndex")]
+            for row in values[grid.get("startRowIndex", 0):grid.get("endRowIndex")]]
+    return storage._trim(rows)
+
+def test_valores_voltam_formatados_ou_nao(planilha):
+    ws = planilha.worksheet("emp_controle")
+    assert ws.get_all_values()[1:3] == [["1000", "1234.5", "compra", ""], ["1001", "10", "", "conferido"]]
+    assert ws.get_all_values(value_render_option=ValueRenderOption.unformatted)[1][1] == 1234.5
+    assert ws.get_all_records()[1] == {"numeroEmpenho": 1001, "saldoPagar": 10, "Histórico": "", "Observação": "conferido"}
+
+@pytest.mark.parametrize("range_name", ["A2:A", "B2:B", "D2:D", "1:1", "B3:C4", "C1:D", "A4:D4", "F1:F"])
+def test_intervalos_iguais_ao_recorte_da_aba(planilha, range_name):
+    ws = planilha.worksheet("emp_controle")
+    assert ws.batch_get([range_name]) == [_referencia(ws.get_all_values(), range_name)]
+
+def test_leitura_de_coluna_busca_so_a_coluna(planilha):
+    ws = planilha.worksheet("emp_controle")
+    consultas = []
+    planilha.conn.set_trace_callback(consultas.append)
+    colunas = ws.batch_get(["A2:A"], major_dimension="COLUMNS")
+    planilha.conn.set_trace_callback(None)
+    assert colunas == [[["1000", "1001", "", "1003"]]]
+    assert [q for q in consultas if q.startswith("SELECT r,")] == ["SELECT r, c1 FROM aba_1 WHERE r >= 2 ORDER BY r"]
+    resposta = planilha.values_batch_get(["'emp_controle'!D2:D", "'emp_controle'!1:1"], params={"majorDimension": "COLUMNS"})
+    assert [vr["values"] for vr in resposta["valueRanges"]] == [[["", "conferido"]], [[h] for h in VALORES[0]]]
+    assert ws.row_values(3) == ["1001", "10", "", "conferido"]
+
+def test_gravacao_de_celula_e_tamanho_da_grade_entre_handles(planilha):
+    ws, outro = planilha.worksheet("emp_controle"), planilha.worksheet("emp_controle")
+    ws.update_cell(12, 6, "fora da grade")
+    assert (outro.row_count, outro.col_count) == (12, 6)
+    outro.update_cell(2, 4, "nova observação")
+    assert ws.cell(2, 4).value == "nova observação"
+    assert ws.find("1003", in_column=1).row == 5
+    ws.resize(rows=5, cols=4)
+    assert ws.get_all_values() == [
+        VALORES[0],
+        ["1000", "1234.5", "compra", "nova observação"],
+        ["1001", "10", "", "conferido"],
+        ["", "", "", ""],
+        ["1003", "0", "serviço", ""],
+    ]
+    assert (ws.row_count, ws.col_count) == (5, 4)
+
+def test_batch_update_apaga_e_insere_linhas_e_recusa_o_resto(planilha):
+    ws = planilha.worksheet("emp_controle")
+
+    def linhas(start, end):
+        return {"sheetId": ws.id, "dimension": "ROWS", "startIndex": start, "endIndex": end}
+    planilha.batch_update({"requests": [{"deleteDimension": {"range": linhas(1, 2)}},
+                                        {"insertDimension": {"range": linhas(2, 4)}}]})
+    assert ws.col_values(1) == ["numeroEmpenho", "1001", "", "", "", "1003"]
+    assert ws.row_count == 11
+
+    with pytest.raises(storage.UnsupportedRequestError):
+        planilha.batch_update({"requests": [{"deleteDimension": {"range": linhas(1, 2)}},
+                                            {"mergeCells": {}}]})
+    assert ws.col_values(1) == ["numeroEmpenho", "1001", "", "", "", "1003"]  # nada mudou (transação)
+
+def test_importa_as_abas_de_outra_planilha(planilha, tmp_path):
+    destino = storage.open_local(tmp_path / "copia.db")
+    storage.import_worksheets(planilha, destino)
+    copia = destino.worksheet("emp_controle")
+    assert copia.get_all_values(value_render_option=ValueRenderOption.unformatted) == \
+        planilha.worksheet("emp_controle").get_all_values(value_render_option=ValueRenderOption.unformatted)
+    with pytest.raises(gspread.WorksheetNotFound):
+        destino.worksheet("usuarios")  # não existe na origem
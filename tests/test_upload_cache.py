@@ -0,0 +1,41 @@
+import io
+
+import pandas as pd
+
+import upload_cache
+
+HOJE = "2026-03-10"
+
+class _Arquivo(io.BytesIO):
+    name = "analitico.xlsx"
+
+def test_chave_muda_com_o_leitor_o_dia_e_o_conteudo():
+    chave = upload_cache.upload_key(b"abc", HOJE)
+    assert upload_cache.upload_key(b"abc", HOJE, "openpyxl") == chave  # openpyxl é o padrão
+    assert upload_cache.upload_key(b"abc", HOJE, "calamine") != chave
+    assert upload_cache.upload_key(b"abc", "2026-03-11") != chave
+    assert upload_cache.upload_key(b"abd", HOJE) != chave
+
+def test_acerto_so_com_o_mesmo_leitor(tmp_path, monkeypatch):
+    chamadas = []
+
+    def organize_sheet(file, today=None, engine=None, timer=None):
+        chamadas.append(engine)
+        return pd.DataFrame({"numeroEmpenho": ["1"], "leitor": [engine]}), None
+    monkeypatch.setattr(upload_cache.data_processor, "organize_sheet", organize_sheet)
+
+    def processar(engine):
+        return upload_cache.organize_sheet_cached(_Arquivo(b"abc"), today=HOJE, engine=engine, cache_dir=tmp_path)[0]
+
+    assert processar("openpyxl").attrs["cache_upload"] is False
+    assert processar("calamine").attrs["cache_upload"] is False
+    repetido = processar("calamine")
+    assert repetido.attrs["cache_upload"] is True
+    assert repetido["leitor"].tolist() == ["calamine"]
+    assert chamadas == ["openpyxl", "calamine"]
+
+def test_remove_as_entradas_menos_usadas(tmp_path):
+    for i in range(3):
+        upload_cache.store(f"k{i}", pd.DataFrame({"a": [i]}), tmp_path, max_entries=2)
+    assert upload_cache.load("k0", tmp_path) is None
+    assert upload_cache.load("k2", tmp_path)["a"].tolist() == [2]
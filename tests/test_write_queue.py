@@ -0,0 +1,37 @@
+import pytest
+
+import auth_manager
+import write_queue
+from column_reader import ColumnReader
+from empenho_index import EmpenhoIndex
+from test_fake_google import _planilha
+
+def _inserir_coluna(ws, posicao, nome):
+    """Insere uma coluna na aba (como alguém fazendo isso direto no Google Sheets)."""
+    valores = ws.get_all_values()
+    for i, linha in enumerate(valores):
+        linha.insert(posicao, nome if i == 0 else "")
+    ws.update(valores, "A1")
+
+@pytest.mark.parametrize("posicao, chamadas", [
+    (5, 2),   # depois da coluna de empenhos: cabeçalho + empenhos na mesma leitura, e a gravação
+    (0, 3),   # antes dela: a coluna de empenhos mudou de lugar e é lida de novo
+])
+def test_coluna_inserida_antes_de_gravar(fake_backend, posicao, chamadas):
+    fake_backend.error_rate = 0
+    ws = auth_manager.obter_aba("emp_controle")
+    indice = EmpenhoIndex.from_reader(ColumnReader(ws))
+    _inserir_coluna(ws, posicao, "Conferência")
+
+    fila = write_queue.WriteQueue()
+    fila.add("1003", write_queue.CAMPO_OBSERVACAO, "conferido")
+    fila.add("1004", write_queue.CAMPO_ANEXO, "http://anexo")
+    resumo, indice_atual = fila.flush(ws, indice)
+
+    assert (resumo["gravados"], resumo["chamadas"]) == (2, chamadas)
+    df = _planilha(ws).set_index("numeroEmpenho")
+    assert df.loc["1003", "Observação"] == "conferido"
+    assert df.loc["1004", "Anexo"] == "http://anexo"
+    assert (df["Conferência"] == "").all()
+    assert indice_atual.header[posicao] == "Conferência"
+    assert indice_atual.col_observacao == indice.col_observacao + 1
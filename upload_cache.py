@@ -0,0 +1,97 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+import data_processor
+import pipeline_timer
+import sheet_readers
+
+# Cache em disco dos uploads já processados pelo organize_sheet
+CACHE_DIR = Path(".cache") / "uploads"
+MAX_ENTRIES = 20
+
+def upload_key(file_bytes, today=None, engine=None):
+    """
+    Chave do cache: hash do conteúdo do arquivo + versão das regras de processamento
+    + data de referência do Status (o mesmo arquivo processado em outro dia muda de status)
+    + leitor de Excel (trocar o LEITOR_EXCEL não pode devolver o resultado do outro leitor).
+    """
+    reference_day = pd.Timestamp(datetime.now() if today is None else today).strftime("%Y-%m-%d")
+    engine = engine or sheet_readers.DEFAULT_EXCEL_READER
+    digest = hashlib.sha256()
+    digest.update(file_bytes)
+    digest.update(f"|{data_processor.PROCESSING_RULES_VERSION}|{reference_day}|{engine}".encode())
+    return digest.hexdigest()
+
+def _entry_path(cache_dir, key):
+    return Path(cache_dir) / f"{key}.pkl"
+
+def load(key, cache_dir=CACHE_DIR):
+    """Retorna o DataFrame em cache (ou None). Um acerto atualiza a data de uso da entrada (LRU)."""
+    path = _entry_path(cache_dir, key)
+    try:
+        with open(path, "rb") as f:
+            df = pickle.load(f)
+        os.utime(path)
+        return df
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+def store(key, df, cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES):
+    """
+    Grava a entrada de forma atômica e remove as menos usadas além de max_entries.
+    As entradas são pickles (carregá-los executa código): o diretório é criado só para
+    o usuário do servidor, com a mesma confiança dos próprios arquivos .py da aplicação.
+    """
+    cache_dir = Path(cache_dir)
+    try:
+        cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, _entry_path(cache_dir, key))
+        evict(cache_dir, max_entries)
+    except OSError as e:
+        # Cache é só otimização: falha de disco não pode impedir o upload
+        print(f"[WARN] Não foi possível gravar o cache do upload: {e}")
+
+def evict(cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES):
+    """Remove as entradas usadas há mais tempo até sobrarem max_entries."""
+    entries = sorted(Path(cache_dir).glob("*.pkl"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for path in entries[max_entries:]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+def organize_sheet_cached(file, today=None, engine=None, cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES, timer=None):
+    """
+    Igual ao data_processor.organize_sheet, mas reaproveita o resultado quando o mesmo
+    arquivo (mesmo conteúdo) já foi processado com as mesmas regras e o mesmo leitor no mesmo dia.
+    Em um acerto, df.attrs["cache_upload"] é True.
+    """
+    timer = timer or pipeline_timer.PipelineTimer()
+    with timer.stage("cache (hash do arquivo)") as etapa:
+        file.seek(0)
+        file_bytes = file.read()
+        file.seek(0)
+        key = upload_key(file_bytes, today, engine)
+        cached = load(key, cache_dir)
+        if cached is not None:
+            etapa["linhas"] = len(cached)
+
+    if cached is not None:
+        cached.attrs["cache_upload"] = True
+        return cached, None
+
+    df, erro = data_processor.organize_sheet(file, today=today, engine=engine, timer=timer)
+    if erro is None:
+        with timer.stage("cache (gravação)", rows=len(df)):
+            store(key, df, cache_dir, max_entries)
+        df.attrs["cache_upload"] = False
+    return df, erro
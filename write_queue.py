@@ -0,0 +1,151 @@
+import time
+
+from gspread.utils import rowcol_to_a1
+
+from column_reader import ColumnReader
+from empenho_index import EmpenhoIndex
+from merge_engine import normalize_empenho
+
+# Edições paradas há pelo menos esse tempo são gravadas automaticamente
+DEBOUNCE_SECONDS = 3.0
+# Campos editáveis na aba emp_controle
+CAMPO_OBSERVACAO = "observacao"
+CAMPO_ANEXO = "anexo"
+NOMES_CAMPOS = {CAMPO_OBSERVACAO: "Observação", CAMPO_ANEXO: "Anexo"}
+
+PENDENTE = "pendente"
+SALVO = "salvo"
+ERRO = "erro"
+
+class WriteQueue:
+    """
+    Fila das edições de Observação e link de Anexo de uma sessão, gravadas juntas numa
+    única chamada batch_update (em vez de uma escrita + recarga por edição).
+    Cada empenho editado tem um estado: PENDENTE, SALVO ou ERRO.
+    """
+
+    def __init__(self, debounce_seconds=DEBOUNCE_SECONDS):
+        self.debounce_seconds = debounce_seconds
+        self.pending = {}       # (empenho, campo) -> valor
+        self.last_change = None
+        self.saved = {}         # empenho -> horário da gravação
+        self.errors = {}        # empenho -> mensagem
+
+    def add(self, empenho, campo, valor):
+        """Enfileira (ou substitui) o novo valor de um campo do empenho."""
+        empenho = normalize_empenho(empenho)
+        self.pending[(empenho, campo)] = valor
+        self.errors.pop(empenho, None)
+        self.last_change = time.monotonic()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def due(self, now=None):
+        """Há edições e a última delas foi há pelo menos debounce_seconds."""
+        if not self.pending:
+            return False
+        now = time.monotonic() if now is None else now
+        return now - self.last_change >= self.debounce_seconds
+
+    def status(self, empenho):
+        """Estado do empenho na fila (PENDENTE, ERRO, SALVO) ou None se não foi editado."""
+        empenho = normalize_empenho(empenho)
+        if empenho in self.errors:
+            return ERRO
+        if any(e == empenho for e, _ in self.pending):
+            return PENDENTE
+        if empenho in self.saved:
+            return SALVO
+        return None
+
+    def describe(self, empenho):
+        """Texto curto do estado do empenho para mostrar na linha da tabela (None se não foi editado)."""
+        estado = self.status(empenho)
+        empenho = normalize_empenho(empenho)
+        if estado == PENDENTE:
+            return "⏳ Alteração pendente"
+        if estado == SALVO:
+            return f"✅ Salvo às {self.saved[empenho]}"
+        if estado == ERRO:
+            return f"⚠️ Não salvo: {self.errors[empenho]}"
+        return None
+
+    def flush(self, ws, indice):
+        """
+        Grava todas as edições pendentes numa única chamada ws.batch_update.
+        Antes, relê o cabeçalho e a coluna de empenhos (uma chamada) para conferir o índice:
+        se a planilha mudou por fora, as linhas e as posições das colunas saem dessa leitura
+        (se a coluna de empenhos mudou de lugar, ela é lida de novo na posição nova).
+        Retorna (resumo, indice_atualizado); resumo["alteracoes"] lista (empenho, coluna, valor)
+        de cada célula gravada e resumo["colunas_ausentes"] os nomes das colunas que não existem
+        no cabeçalho. Em erro da API, as edições continuam na fila.
+        """
+        resumo = {"gravados": 0, "nao_encontrados": [], "colunas_ausentes": [], "alteracoes": [], "chamadas": 0}
+        if not self.pending:
+            return resumo, indice
+        if not indice.col_empenho:
+            raise ValueError("Não foi possível encontrar a coluna de Empenho.")
+
+        # Cabeçalho + coluna de empenhos numa leitura só
+        reader = ColumnReader(ws)
+        header, (keys,) = reader.read_with_header([indice.col_empenho])
+        resumo["chamadas"] += 1
+        if header != indice.header:
+            # Coluna inserida, removida ou renomeada por fora: as posições do índice não valem mais
+            col_empenho = EmpenhoIndex(header, []).col_empenho
+            if not col_empenho:
+                raise ValueError("Não foi possível encontrar a coluna de Empenho.")
+            if col_empenho != indice.col_empenho:
+                keys = reader.read_positions([col_empenho])[0]
+                resumo["chamadas"] += 1
+        indice_atual = EmpenhoIndex(header, keys)
+
+        data = []
+        if not indice_atual.col_anexo and any(campo == CAMPO_ANEXO for _, campo in self.pending):
+            # Se não existe a coluna "Anexo", ela é criada no fim do cabeçalho na mesma chamada
+            data.append({"range": rowcol_to_a1(1, len(indice_atual.header) + 1), "values": [["Anexo"]]})
+            indice_atual.add_column("Anexo")
+        columns = {CAMPO_OBSERVACAO: indice_atual.col_observacao, CAMPO_ANEXO: indice_atual.col_anexo}
+
+        gravados, sem_coluna = [], []
+        for (empenho, campo), valor in self.pending.items():
+            row, col = indice_atual.row_of(empenho), columns[campo]
+            if col is None:
+                # Problema do cabeçalho, não do empenho: erro próprio
+                sem_coluna.append((empenho, campo))
+                if NOMES_CAMPOS[campo] not in resumo["colunas_ausentes"]:
+                    resumo["colunas_ausentes"].append(NOMES_CAMPOS[campo])
+                continue
+            if row is None:
+                if empenho not in resumo["nao_encontrados"]:
+                    resumo["nao_encontrados"].append(empenho)
+                continue
+            data.append({"range": rowcol_to_a1(row, col), "values": [[valor]]})
+            gravados.append((empenho, campo))
+            resumo["alteracoes"].append((empenho, indice_atual.header[col - 1], valor))
+
+        if gravados:
+            # raw=False: mesmo tratamento do update_cell (USER_ENTERED)
+            ws.batch_update(data, raw=False)
+            resumo["chamadas"] += 1
+
+        agora = time.strftime("%H:%M:%S")
+        for empenho, campo in gravados:
+            del self.pending[(empenho, campo)]
+            self.errors.pop(empenho, None)
+            self.saved[empenho] = agora
+        for empenho in resumo["nao_encontrados"]:
+            for campo in (CAMPO_OBSERVACAO, CAMPO_ANEXO):
+                self.pending.pop((empenho, campo), None)
+            self.errors[empenho] = "Empenho não encontrado na planilha."
+        for empenho, campo in sem_coluna:
+            self.pending.pop((empenho, campo), None)
+            self.errors[empenho] = f"Coluna '{NOMES_CAMPOS[campo]}' não encontrada na planilha."
+        resumo["gravados"] = len(gravados)
+        return resumo, indice_atual
+
+    def fail(self, message):
+        """Marca as edições pendentes com o erro da última tentativa (continuam na fila)."""
+        for empenho, _ in self.pending:
+            self.errors[empenho] = message